@@ -6,16 +6,17 @@
 """
 
 import asyncio
+import itertools
 import json
 import time
 from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Callable, Optional, Tuple
 from uuid import uuid4
 
-import litellm
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import HTMLResponse, JSONResponse, FileResponse
+from fastapi import FastAPI, File, HTTPException, Request, UploadFile
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import HTMLResponse, JSONResponse, FileResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
@@ -24,9 +25,41 @@ from pydantic import BaseModel
 from config import (
     API_URL, API_KEY, AVAILABLE_MODELS, SYSTEM_PROMPT,
     HOST, PORT, DEFAULT_TEMPERATURE, DEFAULT_MAX_TOKENS,
-    MAX_REQUEST_COUNT, REQUEST_TIMEOUT, DEFAULT_MODEL
+    MAX_REQUEST_COUNT, MAX_CONCURRENCY, MAX_RUNNING_JOBS, MAX_WORKERS, REQUEST_TIMEOUT, CONNECT_TIMEOUT,
+    FIRST_BYTE_TIMEOUT, MAX_COMPARE_MODELS, MAX_SWEEP_CELLS,
+    DEFAULT_MODEL, STREAM_SNAPSHOT_INTERVAL, STREAM_BATCH_SIZE, MAX_LOAD_RATE, MAX_LOAD_DURATION,
+    MAX_IN_FLIGHT, MAX_PROFILE_STEPS, MAX_SHARED_PREFIX_TOKENS, RATE_LIMIT_RPM, RATE_LIMIT_TPM, ADAPTIVE_LATENCY_TOLERANCE,
+    MAX_RETRIES, RETRY_BASE_DELAY, RETRY_MAX_DELAY, RETRY_BUDGET_RATIO, RETRY_BUDGET_MIN, HEDGE_PERCENTILE,
+    HEDGE_MIN_SAMPLES, RESULT_STORE, RESULT_DB_PATH, RESULT_FLUSH_INTERVAL, APP_WORKERS,
+    SHARED_POLL_INTERVAL,
+    MAX_SESSIONS, MAX_STORED_BYTES, SESSION_TTL, DEFAULT_KEEP_FULL_BODIES, RETENTION_CHECK_INTERVAL,
+    DATASET_DIR, LOG_LEVEL, LOG_FORMAT, LOG_PAYLOADS, TRANSPORT, HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE, HTTP2
+)
+from dataset import DatasetRecord, iter_dataset, replay
+from export import ARROW_FORMATS, EXPORT_FORMATS, EXPORT_NDJSON, MEDIA_TYPES, arrow_available, export_results, iter_batches
+from jobs import Job, JobManager, SessionNotifier, ACTIVE_STATES, JOB_DONE
+from load import (
+    OpenLoopScheduler, run_closed_loop, concurrency_levels, rate_ramp,
+    ARRIVAL_CONSTANT, ARRIVAL_TYPES, PROFILE_CONCURRENCY, PROFILE_RATE, PROFILE_TYPES
+)
+from logger import setup_logging, get_logger
+from normalize import extract_message, build_summary, cached_prompt_tokens
+from prompt_cache import apply_shared_prefix
+from ratelimit import Throttle
+from retry import AttemptInfo, HedgeTimer, RetryBudget, RetryEngine, RetryPolicy
+from stats import (
+    SessionStats, summarize_window, summarize_comparison, detect_knee, classify_error,
+    OUTCOME_SUCCESS, OUTCOME_ERROR, OUTCOME_TIMEOUT
+)
+from storage import BODY_FIELDS, create_result_store, project_result
+from workers import batch_specs, load_specs, run_workers, merge_reports
+from transport import (
+    Timeouts, Transport, create_transport, timeout_phase, TRANSPORT_HTTPX, TRANSPORT_LITELLM, TRANSPORT_TYPES
 )
 
+setup_logging(LOG_LEVEL, LOG_FORMAT, LOG_PAYLOADS)
+logger = get_logger("app")
+
 app = FastAPI(
     title="大模型请求测试工具", 
     description="专业的大模型API测试工具，支持批量测试和结果分析",
@@ -37,8 +70,109 @@ app = FastAPI(
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
-# 存储测试结果的全局变量
-test_results: Dict[str, List[Dict[str, Any]]] = {}
+# 测试结果存储（会话统计随结果写入同步更新）
+# 以多个 uvicorn 工作进程运行时，会话和任务状态经 SQLite 在进程间共享
+result_store = create_result_store(
+    RESULT_STORE, RESULT_DB_PATH, RESULT_FLUSH_INTERVAL,
+    shared=APP_WORKERS > 1,
+    max_sessions=MAX_SESSIONS,
+    max_bytes=MAX_STORED_BYTES,
+    max_age=SESSION_TTL,
+    keep_full_bodies=DEFAULT_KEEP_FULL_BODIES
+)
+
+# 后台任务管理器及结果通知
+session_notifier = SessionNotifier()
+job_manager = JobManager(max_running=MAX_RUNNING_JOBS, notifier=session_notifier)
+
+def forget_session_jobs(session_id: str):
+    """会话已被删除：取消本进程中该会话的任务并通知订阅者"""
+    job_manager.forget_session(session_id)
+    session_notifier.notify(session_id)
+
+if result_store.shared:
+    result_store.job_source = lambda: list(job_manager.jobs.values())
+    result_store.on_remote_delete = forget_session_jobs
+    result_store.on_remote_cancel = job_manager.cancel
+
+retention_task: Optional[asyncio.Task] = None
+
+# 已创建的传输层（共享连接池），按名称索引
+transports: Dict[str, Transport] = {}
+
+async def list_job_dicts(session_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    """本进程和（共享模式下）其他进程的任务，按创建时间排序；本进程的任务状态以内存为准"""
+    local = job_manager.session_jobs(session_id) if session_id else list(job_manager.jobs.values())
+    jobs = {job.job_id: job.to_dict() for job in local}
+    for job in await result_store.load_jobs(session_id=session_id):
+        jobs.setdefault(job["job_id"], job)
+    return sorted(jobs.values(), key=lambda job: job["created_at"])
+
+async def find_job(job_id: str) -> Optional[Dict[str, Any]]:
+    job = job_manager.get(job_id)
+    if job:
+        return job.to_dict()
+    jobs = await result_store.load_jobs(job_id=job_id)
+    return jobs[0] if jobs else None
+
+async def active_sessions() -> set:
+    """仍有排队或运行中任务的会话"""
+    return {job["session_id"] for job in await list_job_dicts() if job["status"] in ACTIVE_STATES}
+
+async def enforce_retention(reserve: int = 0):
+    """按保留策略淘汰旧会话，仍有任务运行的会话不会被淘汰"""
+    await result_store.sync()
+    active = await active_sessions()
+    for session_id in await result_store.enforce_retention(is_protected=active.__contains__, reserve=reserve):
+        forget_session_jobs(session_id)
+        logger.info("已按保留策略淘汰会话 %s", session_id, extra={"session_id": session_id})
+
+async def retention_loop():
+    while True:
+        await asyncio.sleep(RETENTION_CHECK_INTERVAL)
+        try:
+            await enforce_retention()
+        except Exception as e:
+            logger.exception("保留策略检查失败: %s", e)
+
+@app.on_event("startup")
+async def open_result_store():
+    global retention_task
+    await result_store.open()
+    if result_store.shared:
+        logger.info("多进程模式：会话和任务状态经 %s 共享", RESULT_DB_PATH)
+    retention_task = asyncio.create_task(retention_loop())
+
+@app.on_event("shutdown")
+async def close_result_store():
+    if retention_task:
+        retention_task.cancel()
+    for transport in transports.values():
+        await transport.close()
+    await result_store.close()
+
+async def submit_job(**kwargs) -> Job:
+    """提交后台任务；共享模式下立即写入会话和任务状态，使其他工作进程马上可以查询"""
+    job = job_manager.submit(**kwargs)
+    if result_store.shared:
+        await result_store.flush()
+    return job
+
+async def ensure_session(session_id: str, keep_full_bodies: Optional[int] = None):
+    """初始化会话的结果存储和统计，新会话创建前先按保留策略淘汰旧会话"""
+    # 共享模式下 position 由写入进程按本地条数分配，同一会话同时只允许一个进程写入
+    if not await result_store.claim_session(session_id):
+        raise HTTPException(status_code=409, detail="会话正由其他工作进程写入，请等待其任务结束或使用新的会话")
+    # 会话可能由其他进程创建，取得写入权后再读取其最新条数，续写时 position 不会重复
+    await result_store.sync_session(session_id)
+    if not result_store.has_session(session_id):
+        await enforce_retention(reserve=1)
+    result_store.create_session(session_id, keep_full_bodies)
+
+def append_result(session_id: str, result: Dict[str, Any]):
+    """写入一条结果，更新会话统计并通知该会话的订阅者"""
+    result_store.append(session_id, result)
+    session_notifier.notify(session_id)
 
 class TestRequest(BaseModel):
     """测试请求模型"""
@@ -53,14 +187,76 @@ class TestRequest(BaseModel):
     
     # 通用字段
     count: int = 1
+    concurrency: int = 1  # 同时在途的最大请求数
+    stream: bool = False  # 流式测量模式：记录TTFT、块间隔和解码吞吐
     session_id: Optional[str] = None
     mode: str = "simple"  # "simple" 或 "json"
+    keep_full_bodies: Optional[int] = None  # 保留完整响应体的成功结果条数，其余只保留指标；未指定时使用默认值
+    transport: Optional[str] = None  # "litellm" 或 "httpx"，未指定时使用默认传输方式
+    workers: int = 1  # 工作进程数，大于1时由多个进程分担负载（仅 /test 和 /load）
+    rpm: Optional[int] = None  # 每分钟请求数上限，未指定时使用 RATE_LIMIT_RPM，0 表示不限制
+    tpm: Optional[int] = None  # 每分钟Token数上限，未指定时使用 RATE_LIMIT_TPM，0 表示不限制
+    adaptive_concurrency: bool = False  # 根据 429/超时/延迟自动调整并发（AIMD），concurrency 或 max_in_flight 为上限
+    retries: int = 0  # 429/5xx/超时/连接错误时的最大重试次数（指数退避加抖动，受任务级重试预算限制）
+    hedge: bool = False  # 对冲请求：超过已完成请求的 p95 延迟仍未返回时发出副本，先返回者胜出
+    timeout: Optional[float] = None  # 单次请求总超时（秒），未指定时使用 REQUEST_TIMEOUT；重试时每次尝试分别计时
+    deadline: Optional[float] = None  # 任务运行时限（秒），超过后取消任务，已完成的结果保留
+    shared_prefix_tokens: int = 0  # 前缀缓存测量：在消息前插入约 N 个Token的固定系统提示词，用户消息加随机后缀
+    prefix_seed: int = 0  # 共享前缀的内容种子，更换后得到未被缓存过的前缀
+
+class LoadTestRequest(TestRequest):
+    """开环压测请求模型"""
+    rate: float  # 目标到达率（请求/秒）
+    duration: float  # 持续时间（秒）
+    arrival: str = ARRIVAL_CONSTANT  # "constant" 或 "poisson"
+    max_in_flight: int = 100  # 同时在途的最大请求数，超出时在本地排队
+    seed: Optional[int] = None  # 泊松到达的随机种子，便于复现
+
+class ProfileTestRequest(TestRequest):
+    """阶梯负载测试请求模型"""
+    profile: str = PROFILE_CONCURRENCY  # "concurrency"（并发阶梯）或 "rate"（到达率线性爬坡）
+    levels: Optional[List[float]] = None  # 自定义各步的并发数或到达率，未指定时自动生成
+    max_concurrency: int = 32  # 并发阶梯 1→2→4→… 的上限
+    start_rate: float = 1.0  # 到达率爬坡起点（请求/秒）
+    end_rate: float = 10.0  # 到达率爬坡终点（请求/秒）
+    rate_steps: int = 5  # 到达率爬坡的步数
+    step_duration: float = 30.0  # 每步持续时间（秒）
+    arrival: str = ARRIVAL_CONSTANT
+    max_in_flight: int = 100
+    p99_threshold: float = 10.0  # p99 延迟阈值（秒）
+    error_rate_threshold: float = 0.05  # 错误率阈值
+    min_throughput_gain: float = 0.05  # 吞吐提升低于此比例视为不再增长
+    stop_at_knee: bool = True  # 检测到拐点后停止后续步骤
+
+class CompareTestRequest(TestRequest):
+    """多模型对比请求模型：count 和 concurrency 按每个模型计算"""
+    models: Optional[List[str]] = None  # 参与对比的模型，未指定时使用全部可用模型
+    per_model_concurrency: Optional[Dict[str, int]] = None  # 按模型覆盖并发上限，未列出的模型使用 concurrency
+
+class SweepTestRequest(TestRequest):
+    """参数扫描请求模型：各列表的笛卡尔积构成扫描单元，count 按每个单元计算"""
+    models: Optional[List[str]] = None  # 未指定的维度使用请求本身的取值
+    temperatures: Optional[List[float]] = None
+    max_tokens_values: Optional[List[int]] = None
+    concurrencies: Optional[List[int]] = None
+    parallel_cells: int = 1  # 同时执行的单元数，默认逐个执行以免单元之间相互干扰
+    max_in_flight: int = MAX_CONCURRENCY  # 所有单元共享的在途请求上限
+
+class ReplayTestRequest(TestRequest):
+    """数据集回放请求模型：每行一个请求，mode 固定为 json；指定 model 时覆盖每行的模型"""
+    dataset_id: Optional[str] = None  # 通过 POST /datasets 上传的数据集
+    path: Optional[str] = None  # 或数据集目录内的 JSONL 文件路径
+    speed: float = 1.0  # 回放倍速：1 按原始时间，N 为 N 倍速，0 尽快发送
+    max_in_flight: int = 100
+    limit: Optional[int] = None  # 最多回放的记录数
 
 class TestResponse(BaseModel):
     """测试响应模型"""
     success: bool
     session_id: str
     message: str
+    job_id: Optional[str] = None
+    status: Optional[str] = None
     results: List[Dict[str, Any]] = []
 
 @app.get("/", response_class=HTMLResponse)
@@ -82,469 +278,1107 @@ async def debug_test():
     """调试测试页面"""
     return FileResponse("debug_test.html")
 
-async def make_api_request(request_data: Dict[str, Any]) -> Dict[str, Any]:
-    """直接使用LiteLLM发送完整的API请求"""
+def get_transport(name: Optional[str] = None) -> Transport:
+    """按名称取得共享的传输层实例（首次使用时创建）"""
+    name = name or TRANSPORT
+    if name not in transports:
+        transports[name] = create_transport(
+            name, API_URL, API_KEY, DEFAULT_MODEL, Timeouts(CONNECT_TIMEOUT, FIRST_BYTE_TIMEOUT, REQUEST_TIMEOUT),
+            **({"max_connections": HTTP_MAX_CONNECTIONS,
+                "max_keepalive_connections": HTTP_MAX_KEEPALIVE, "http2": HTTP2}
+               if name == TRANSPORT_HTTPX else {})
+        )
+    return transports[name]
+
+def validate_common_fields(test_req: TestRequest, allow_workers: bool = False):
+    """校验各类测试请求共有的可选字段"""
+    if test_req.workers != 1 and not allow_workers:
+        raise HTTPException(status_code=400, detail="该类测试不支持多进程（workers 只能为 1）")
+    if test_req.workers < 1 or test_req.workers > MAX_WORKERS:
+        raise HTTPException(status_code=400, detail=f"工作进程数必须在 1 到 {MAX_WORKERS} 之间")
+    if test_req.keep_full_bodies is not None and test_req.keep_full_bodies < 0:
+        raise HTTPException(status_code=400, detail="keep_full_bodies 不能为负数")
+    if test_req.transport is not None and test_req.transport not in TRANSPORT_TYPES:
+        raise HTTPException(status_code=400, detail=f"传输方式必须是 {', '.join(TRANSPORT_TYPES)} 之一")
+    if (test_req.rpm or 0) < 0 or (test_req.tpm or 0) < 0:
+        raise HTTPException(status_code=400, detail="rpm 和 tpm 不能为负数")
+    if test_req.retries < 0 or test_req.retries > MAX_RETRIES:
+        raise HTTPException(status_code=400, detail=f"重试次数必须在 0 到 {MAX_RETRIES} 之间")
+    if test_req.timeout is not None and test_req.timeout <= 0:
+        raise HTTPException(status_code=400, detail="timeout 必须大于 0")
+    if test_req.deadline is not None and test_req.deadline <= 0:
+        raise HTTPException(status_code=400, detail="deadline 必须大于 0")
+    if test_req.shared_prefix_tokens < 0 or test_req.shared_prefix_tokens > MAX_SHARED_PREFIX_TOKENS:
+        raise HTTPException(status_code=400, detail=f"共享前缀长度必须在 0 到 {MAX_SHARED_PREFIX_TOKENS} 之间")
+
+def create_throttle(test_req: TestRequest, max_concurrency: int, share: int = 1) -> Optional[Throttle]:
+    """按测试请求的限流设置创建任务级的请求闸门，未启用限流和自适应并发时返回 None
+
+    max_concurrency 为自适应并发的上限；share 为分担同一预算的工作进程数
+    """
+    rpm = RATE_LIMIT_RPM if test_req.rpm is None else test_req.rpm
+    tpm = RATE_LIMIT_TPM if test_req.tpm is None else test_req.tpm
+    if not rpm and not tpm and not test_req.adaptive_concurrency:
+        return None
+    return Throttle(
+        rpm=rpm / share,
+        tpm=tpm / share,
+        max_concurrency=max_concurrency if test_req.adaptive_concurrency else None,
+        latency_tolerance=ADAPTIVE_LATENCY_TOLERANCE
+    )
+
+def create_retrier(test_req: TestRequest) -> Optional[RetryEngine]:
+    """按测试请求的重试/对冲设置创建任务级的重试引擎，两者都未启用时返回 None"""
+    if not test_req.retries and not test_req.hedge:
+        return None
+    return RetryEngine(
+        policy=RetryPolicy(max_retries=test_req.retries, base_delay=RETRY_BASE_DELAY,
+                           max_delay=RETRY_MAX_DELAY, hedge=test_req.hedge),
+        budget=RetryBudget(RETRY_BUDGET_RATIO, RETRY_BUDGET_MIN),
+        hedge_timer=HedgeTimer(HEDGE_PERCENTILE, HEDGE_MIN_SAMPLES) if test_req.hedge else None
+    )
+
+def control_stats(throttle: Optional[Throttle], retrier: Optional[RetryEngine]) -> Dict[str, Any]:
+    """任务结果中的限流和重试统计（运行中原地更新）"""
+    stats: Dict[str, Any] = {}
+    if throttle:
+        stats["throttle"] = throttle.stats
+    if retrier:
+        stats["retry"] = retrier.stats
+    return stats
+
+def build_request_data(test_req: TestRequest) -> Dict[str, Any]:
+    """根据测试请求构建发送给模型的请求数据，指定 shared_prefix_tokens 时加入共享前缀"""
+    if test_req.mode == "json":
+        # JSON模式：直接使用提供的完整请求
+        request_data = test_req.request_json.copy()
+    else:
+        # 简单模式：构建基本请求
+        request_data = {
+            "model": test_req.model,
+            "messages": [{"role": "user", "content": test_req.prompt}],
+            "temperature": test_req.temperature,
+            "max_tokens": test_req.max_tokens
+        }
+    if test_req.shared_prefix_tokens:
+        request_data = apply_shared_prefix(request_data, test_req.shared_prefix_tokens, test_req.prefix_seed)
+    return request_data
+
+def offset_fields(start_time: float, end_time: float, batch_start: float,
+                  intended_offset: Optional[float] = None) -> Dict[str, Any]:
+    """构建相对批次开始时间的时间偏移字段
+
+    开环压测时额外记录计划发送时间、排队延迟，以及从计划时间起算的延迟（消除协调遗漏）
+    """
+    fields = {
+        "start_offset": round(start_time - batch_start, 4),
+        "end_offset": round(end_time - batch_start, 4),
+    }
+    if intended_offset is not None:
+        fields["intended_offset"] = round(intended_offset, 4)
+        fields["queue_delay"] = round(max(0.0, start_time - batch_start - intended_offset), 4)
+        fields["corrected_duration"] = round(end_time - batch_start - intended_offset, 4)
+    return fields
+
+async def execute_single_request(test_req: TestRequest, index: int, batch_start: float,
+                                 intended_offset: Optional[float] = None,
+                                 throttle: Optional[Throttle] = None,
+                                 retrier: Optional[RetryEngine] = None) -> Dict[str, Any]:
+    """执行单次请求并构建结果记录
+
+    start_offset/end_offset 为相对批次开始时间的偏移（秒），用于观察并发请求的重叠情况；
+    intended_offset 为开环压测中该请求的计划发送偏移。
+    传入 throttle 时先等待限流放行，等待时间不计入 duration（开环压测中计入排队延迟）；
+    传入 retrier 时按其策略重试或对冲，duration 为从首次发送到最终响应的总时间（含退避），
+    结果记录尝试次数和胜出的尝试。
+    每次尝试的总时长受 timeout（默认 REQUEST_TIMEOUT）限制，建连和首字节超时由传输层施加；
+    超时的请求 outcome 为 timeout 并记录超时阶段 timeout_phase，与其他错误分开统计
+    """
+    start_time = time.perf_counter()
+    response = None
+    permit = None
+    attempt_info = AttemptInfo() if retrier else None
+    timeouts = Timeouts(CONNECT_TIMEOUT, FIRST_BYTE_TIMEOUT, test_req.timeout or REQUEST_TIMEOUT)
+    
     try:
-        print(f"发送完整请求到LiteLLM: {json.dumps(request_data, indent=2, ensure_ascii=False)}")
-        
-        # 为模型名称添加openai/前缀（如果需要）
-        model = request_data.get("model", DEFAULT_MODEL)
-        if not model.startswith("openai/"):
-            model = f"openai/{model}"
+        request_data = build_request_data(test_req)
+        if throttle:
+            permit = await throttle.acquire(request_data)
+            start_time = time.perf_counter()
+        transport = get_transport(test_req.transport)
+        streaming = test_req.stream or request_data.get("stream")
+        send = transport.stream if streaming else transport.complete
+        if retrier:
+            async def send_attempt(attempt: int):
+                # 重试和对冲副本同样占用 RPM/TPM 预算，失败及时反馈给限流
+                if permit and attempt > 1:
+                    await throttle.reacquire(permit)
+                try:
+                    return await asyncio.wait_for(send(request_data), timeouts.total)
+                except Exception as e:
+                    if permit:
+                        throttle.note_failure(permit, e)
+                    raise
+            
+            response, timing = await retrier.run(send_attempt, attempt_info)
+        else:
+            response, timing = await asyncio.wait_for(send(request_data), timeouts.total)
         
-        # 准备LiteLLM请求参数
-        litellm_params = {
-            "api_key": API_KEY,
-            "base_url": API_URL,
-            "model": model,
-            **request_data  # 传递所有原始请求数据
-        }
+        end_time = time.perf_counter()
+        duration = end_time - start_time
         
-        # 强制禁用流式传输以获得完整响应
-        litellm_params["stream"] = False
+        # 提取响应内容和工具调用（参数已解析）
+        content, tool_calls_info = extract_message(response)
+        response_summary = build_summary(content, tool_calls_info)
         
-        # 移除可能冲突的参数
-        litellm_params.pop("model", None)  # 避免重复
+        # 提取token使用信息
+        usage = response.get('usage', {})
+        input_tokens = usage.get('prompt_tokens', 0)
+        output_tokens = usage.get('completion_tokens', 0)
+        total_tokens = usage.get('total_tokens', 0)
         
-        # 重新设置model参数
-        litellm_params["model"] = model
+        result = {
+            "index": index,
+            "timestamp": datetime.now().isoformat(),
+            "duration": round(duration, 4),
+            **offset_fields(start_time, end_time, batch_start, intended_offset),
+            "success": True,
+            "response": response_summary,
+            "content": content,
+            "tool_calls": tool_calls_info,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": total_tokens,
+            "model": request_data.get("model", "unknown"),
+            "error": None,
+            "outcome": OUTCOME_SUCCESS,
+            "mode": test_req.mode
+        }
         
-        print(f"LiteLLM请求参数: {json.dumps({k: v for k, v in litellm_params.items() if k != 'api_key'}, indent=2, ensure_ascii=False)}")
+        cached_tokens = cached_prompt_tokens(usage)
+        if cached_tokens is not None:
+            result["cached_tokens"] = cached_tokens
+            result["cache_hit_ratio"] = round(cached_tokens / input_tokens, 4) if input_tokens else 0.0
+        if streaming:
+            result["stream"] = True
+        result.update(timing)
+        if transport.name != TRANSPORT_LITELLM:
+            result["transport"] = transport.name
         
-        # 使用LiteLLM直接发送请求
-        import litellm
-        response = await litellm.acompletion(**litellm_params)
+        if test_req.mode == "json":
+            result["full_response"] = response
+        if attempt_info:
+            result.update(attempt_info.fields())
+        if permit:
+            result.update(throttle.fields(permit))
+            throttle.release(permit, result)
         
-        print(f"LiteLLM响应类型: {type(response)}")
-        print(f"LiteLLM响应对象属性: {[attr for attr in dir(response) if not attr.startswith('_')]}")
+        logger.debug("第 %d 次请求成功，用时 %.2fs", index, duration)
+        return result
         
-        # 检查是否是CustomStreamWrapper对象
-        if hasattr(response, '__class__') and 'CustomStreamWrapper' in str(response.__class__):
-            print("检测到CustomStreamWrapper对象，使用原始响应")
-            print(f"使用原始响应: {response}")
-            
-            # 对于CustomStreamWrapper，我们需要特殊处理
-            response_dict = {
-                'model': getattr(response, 'model', 'unknown'),
-                'choices': [],
-                'usage': {}
-            }
-            
-            # 尝试提取其他字段
-            if hasattr(response, 'id'):
-                response_dict['id'] = response.id
-            if hasattr(response, 'object'):
-                response_dict['object'] = response.object
-            if hasattr(response, 'created'):
-                response_dict['created'] = response.created
-            if hasattr(response, 'system_fingerprint'):
-                response_dict['system_fingerprint'] = response.system_fingerprint
-                
-            # 对于流式响应，尝试从complete_response或response_uptil_now获取数据
-            complete_response = None
-            print(f"检查complete_response: {hasattr(response, 'complete_response')}")
-            if hasattr(response, 'complete_response'):
-                print(f"complete_response值: {response.complete_response}")
-                if response.complete_response:
-                    complete_response = response.complete_response
-                    print(f"找到complete_response: {type(complete_response)}")
-            
-            print(f"检查response_uptil_now: {hasattr(response, 'response_uptil_now')}")
-            if hasattr(response, 'response_uptil_now'):
-                print(f"response_uptil_now值: {response.response_uptil_now}")
-                if not complete_response and response.response_uptil_now:
-                    complete_response = response.response_uptil_now
-                    print(f"找到response_uptil_now: {type(complete_response)}")
-            
-            # 检查其他可能的属性
-            print(f"检查chunks: {hasattr(response, 'chunks')}")
-            if hasattr(response, 'chunks'):
-                print(f"chunks值: {response.chunks}")
-            
-            print(f"检查choices直接访问: {hasattr(response, 'choices')}")
-            if hasattr(response, 'choices'):
-                print(f"choices值: {response.choices}")
-            
-            print(f"检查usage直接访问: {hasattr(response, 'usage')}")
-            if hasattr(response, 'usage'):
-                print(f"usage值: {response.usage}")
-            
-            if complete_response:
-                # 从完整响应中提取数据
-                if hasattr(complete_response, 'choices') and complete_response.choices:
-                    response_dict['choices'] = []
-                    for choice in complete_response.choices:
-                        choice_dict = {}
-                        if hasattr(choice, 'index'):
-                            choice_dict['index'] = choice.index
-                        if hasattr(choice, 'finish_reason'):
-                            choice_dict['finish_reason'] = choice.finish_reason
-                            
-                        # 提取message
-                        if hasattr(choice, 'message'):
-                            message_dict = {}
-                            if hasattr(choice.message, 'role'):
-                                message_dict['role'] = choice.message.role
-                            if hasattr(choice.message, 'content'):
-                                message_dict['content'] = choice.message.content
-                            if hasattr(choice.message, 'tool_calls'):
-                                message_dict['tool_calls'] = choice.message.tool_calls
-                            if hasattr(choice.message, 'function_call'):
-                                message_dict['function_call'] = choice.message.function_call
-                            choice_dict['message'] = message_dict
-                            
-                        response_dict['choices'].append(choice_dict)
-                
-                # 提取usage
-                if hasattr(complete_response, 'usage') and complete_response.usage:
-                    usage_dict = {}
-                    if hasattr(complete_response.usage, 'prompt_tokens'):
-                        usage_dict['prompt_tokens'] = complete_response.usage.prompt_tokens
-                    if hasattr(complete_response.usage, 'completion_tokens'):
-                        usage_dict['completion_tokens'] = complete_response.usage.completion_tokens
-                    if hasattr(complete_response.usage, 'total_tokens'):
-                        usage_dict['total_tokens'] = complete_response.usage.total_tokens
-                    if hasattr(complete_response.usage, 'prompt_tokens_details'):
-                        usage_dict['prompt_tokens_details'] = complete_response.usage.prompt_tokens_details
-                    if hasattr(complete_response.usage, 'completion_tokens_details'):
-                        usage_dict['completion_tokens_details'] = complete_response.usage.completion_tokens_details
-                    response_dict['usage'] = usage_dict
-            else:
-                # 如果没有complete_response，尝试直接从response对象提取
-                if hasattr(response, 'choices') and response.choices:
-                    response_dict['choices'] = []
-                    for choice in response.choices:
-                        choice_dict = {}
-                        if hasattr(choice, 'index'):
-                            choice_dict['index'] = choice.index
-                        if hasattr(choice, 'finish_reason'):
-                            choice_dict['finish_reason'] = choice.finish_reason
-                            
-                        # 提取message
-                        if hasattr(choice, 'message'):
-                            message_dict = {}
-                            if hasattr(choice.message, 'role'):
-                                message_dict['role'] = choice.message.role
-                            if hasattr(choice.message, 'content'):
-                                message_dict['content'] = choice.message.content
-                            if hasattr(choice.message, 'tool_calls'):
-                                message_dict['tool_calls'] = choice.message.tool_calls
-                            if hasattr(choice.message, 'function_call'):
-                                message_dict['function_call'] = choice.message.function_call
-                            choice_dict['message'] = message_dict
-                            
-                        response_dict['choices'].append(choice_dict)
-                
-                # 提取usage
-                if hasattr(response, 'usage') and response.usage:
-                    usage_dict = {}
-                    if hasattr(response.usage, 'prompt_tokens'):
-                        usage_dict['prompt_tokens'] = response.usage.prompt_tokens
-                    if hasattr(response.usage, 'completion_tokens'):
-                        usage_dict['completion_tokens'] = response.usage.completion_tokens
-                    if hasattr(response.usage, 'total_tokens'):
-                        usage_dict['total_tokens'] = response.usage.total_tokens
-                    if hasattr(response.usage, 'prompt_tokens_details'):
-                        usage_dict['prompt_tokens_details'] = response.usage.prompt_tokens_details
-                    if hasattr(response.usage, 'completion_tokens_details'):
-                        usage_dict['completion_tokens_details'] = response.usage.completion_tokens_details
-                    response_dict['usage'] = usage_dict
-        else:
-            # 安全地提取响应数据，避免序列化问题
-            response_dict = {}
-            
-            # 提取基本字段
-            if hasattr(response, 'id'):
-                response_dict['id'] = response.id
-            if hasattr(response, 'object'):
-                response_dict['object'] = response.object
-            if hasattr(response, 'created'):
-                response_dict['created'] = response.created
-            if hasattr(response, 'model'):
-                response_dict['model'] = response.model
-            if hasattr(response, 'system_fingerprint'):
-                response_dict['system_fingerprint'] = response.system_fingerprint
-                
-            # 提取choices
-            if hasattr(response, 'choices') and response.choices:
-                response_dict['choices'] = []
-                for choice in response.choices:
-                    choice_dict = {}
-                    if hasattr(choice, 'index'):
-                        choice_dict['index'] = choice.index
-                    if hasattr(choice, 'finish_reason'):
-                        choice_dict['finish_reason'] = choice.finish_reason
-                        
-                    # 提取message
-                    if hasattr(choice, 'message'):
-                        message_dict = {}
-                        if hasattr(choice.message, 'role'):
-                            message_dict['role'] = choice.message.role
-                        if hasattr(choice.message, 'content'):
-                            message_dict['content'] = choice.message.content
-                        if hasattr(choice.message, 'tool_calls'):
-                            message_dict['tool_calls'] = choice.message.tool_calls
-                        if hasattr(choice.message, 'function_call'):
-                            message_dict['function_call'] = choice.message.function_call
-                        choice_dict['message'] = message_dict
-                        
-                    response_dict['choices'].append(choice_dict)
-            
-            # 提取usage
-            if hasattr(response, 'usage') and response.usage:
-                usage_dict = {}
-                if hasattr(response.usage, 'prompt_tokens'):
-                    usage_dict['prompt_tokens'] = response.usage.prompt_tokens
-                if hasattr(response.usage, 'completion_tokens'):
-                    usage_dict['completion_tokens'] = response.usage.completion_tokens
-                if hasattr(response.usage, 'total_tokens'):
-                    usage_dict['total_tokens'] = response.usage.total_tokens
-                if hasattr(response.usage, 'prompt_tokens_details'):
-                    usage_dict['prompt_tokens_details'] = response.usage.prompt_tokens_details
-                if hasattr(response.usage, 'completion_tokens_details'):
-                    usage_dict['completion_tokens_details'] = response.usage.completion_tokens_details
-                response_dict['usage'] = usage_dict
+    except Exception as e:
+        end_time = time.perf_counter()
+        duration = end_time - start_time
         
-        print(f"最终提取的响应字典: {json.dumps(response_dict, indent=2, ensure_ascii=False, default=str)}")
+        error_model = "unknown"
+        if test_req.mode == "simple":
+            error_model = test_req.model
+        elif test_req.request_json:
+            error_model = test_req.request_json.get("model", "unknown")
+
+        phase = timeout_phase(e)
+        error_result = {
+            "index": index,
+            "timestamp": datetime.now().isoformat(),
+            "duration": round(duration, 4),
+            **offset_fields(start_time, end_time, batch_start, intended_offset),
+            "success": False,
+            "response": None,
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "total_tokens": 0,
+            "model": error_model,
+            "error": timeouts.describe(phase, e) if phase else str(e),
+            "error_type": "timeout" if phase else classify_error(e),
+            "outcome": OUTCOME_TIMEOUT if phase else OUTCOME_ERROR,
+            "mode": test_req.mode
+        }
+        if phase:
+            error_result["timeout_phase"] = phase
+        if attempt_info:
+            error_result.update(attempt_info.fields())
+        if permit:
+            error_result.update(throttle.fields(permit))
+            throttle.release(permit, error_result, e)
         
-        return response_dict
-    except Exception as e:
-        print(f"LiteLLM API调用失败: {e}")
-        import traceback
-        traceback.print_exc()
-        raise e
+        logger.warning("第 %d 次请求失败: %s", index, e,
+                       extra={"error_type": error_result["error_type"], "model": error_model})
+        return error_result
+
+async def run_batch(test_req: TestRequest, session_id: str, job: Optional[Job] = None,
+                    on_result: Optional[Callable[[Dict[str, Any]], None]] = None,
+                    limiter: Optional[asyncio.Semaphore] = None,
+                    throttle: Optional[Throttle] = None,
+                    retrier: Optional[RetryEngine] = None) -> List[Dict[str, Any]]:
+    """通过有界的异步工作池执行一批请求
+
+    同时最多有 concurrency 个请求在途；结果按完成顺序写入会话，返回时按原始序号排序。
+    传入 job 时每完成一个请求更新一次任务进度；on_result 在结果写入会话前回调，可用于附加标记；
+    limiter 为多个批次共享的在途请求上限，throttle 和 retrier 为任务级的限流/自适应并发和重试/对冲
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(test_req.count):
+        queue.put_nowait(i + 1)
+    
+    results = []
+    batch_start = time.perf_counter()
+    
+    async def worker():
+        while True:
+            try:
+                index = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            if limiter:
+                async with limiter:
+                    result = await execute_single_request(test_req, index, batch_start, throttle=throttle,
+                                                          retrier=retrier)
+            else:
+                result = await execute_single_request(test_req, index, batch_start, throttle=throttle,
+                                                      retrier=retrier)
+            results.append(result)
+            if on_result:
+                on_result(result)
+            append_result(session_id, result)
+            if job:
+                job.completed += 1
+    
+    worker_count = max(1, min(test_req.concurrency, test_req.count))
+    await asyncio.gather(*(worker() for _ in range(worker_count)))
+    
+    results.sort(key=lambda r: r["index"])
+    return results
 
 @app.post("/test", response_model=TestResponse)
 async def run_test(test_req: TestRequest):
     """运行大模型测试"""
     # 验证请求次数
-    if test_req.count > MAX_REQUEST_COUNT:
-        raise HTTPException(status_code=400, detail=f"请求次数不能超过 {MAX_REQUEST_COUNT} 次")
+    if test_req.count < 1 or test_req.count > MAX_REQUEST_COUNT:
+        raise HTTPException(status_code=400, detail=f"请求次数必须在 1 到 {MAX_REQUEST_COUNT} 之间")
+    
+    # 验证并发数
+    if test_req.concurrency < 1 or test_req.concurrency > MAX_CONCURRENCY:
+        raise HTTPException(status_code=400, detail=f"并发数必须在 1 到 {MAX_CONCURRENCY} 之间")
+    
+    validate_common_fields(test_req, allow_workers=True)
     
     session_id = test_req.session_id or str(uuid4())
     
     # 初始化结果存储
-    if session_id not in test_results:
-        test_results[session_id] = []
+    await ensure_session(session_id, test_req.keep_full_bodies)
     
-    results = []
+    async def runner(job: Job):
+        if test_req.workers > 1:
+            specs = batch_specs(test_req.model_dump(), test_req.count, test_req.concurrency, test_req.workers)
+            return await run_multiprocess(session_id, job, specs)
+        # 结果已写入会话，不再在任务上重复保存；启用限流或重试时任务结果为其统计
+        throttle = create_throttle(test_req, test_req.concurrency)
+        retrier = create_retrier(test_req)
+        job.result = control_stats(throttle, retrier) or None
+        await run_batch(test_req, session_id, job, throttle=throttle, retrier=retrier)
     
-    try:
-        # 执行多次请求
-        for i in range(test_req.count):
-            print(f"执行第 {i+1}/{test_req.count} 次请求...")
-            
-            start_time = time.time()
-            response = None
-            
-            try:
-                if test_req.mode == "json":
-                    # JSON模式：直接使用提供的完整请求
-                    request_data = test_req.request_json.copy()
-                else:
-                    # 简单模式：构建基本请求
-                    request_data = {
-                        "model": test_req.model,
-                        "messages": [{"role": "user", "content": test_req.prompt}],
-                        "temperature": test_req.temperature,
-                        "max_tokens": test_req.max_tokens
-                    }
-                
-                response = await make_api_request(request_data)
-                
-                end_time = time.time()
-                duration = end_time - start_time
-                
-                # 提取响应内容
-                content = None
-                tool_calls_info = None
-                full_content = None
-                
-                if response.get('choices') and len(response['choices']) > 0:
-                    choice = response['choices'][0]
-                    if choice.get('message'):
-                        full_content = choice['message'].get('content', '')
-                        content = full_content
-                        
-                        # 提取tool_calls信息
-                        if choice['message'].get('tool_calls'):
-                            tool_calls_list = []
-                            for tc in choice['message']['tool_calls']:
-                                tool_info = {}
-                                if tc.get('function', {}).get('name'):
-                                    tool_info['name'] = tc['function']['name']
-                                if tc.get('function', {}).get('arguments'):
-                                    try:
-                                        import json
-                                        args = json.loads(tc['function']['arguments'])
-                                        tool_info['arguments'] = args
-                                    except:
-                                        tool_info['arguments'] = tc['function']['arguments']
-                                if tc.get('id'):
-                                    tool_info['id'] = tc['id']
-                                tool_calls_list.append(tool_info)
-                            
-                            if tool_calls_list:
-                                tool_calls_info = tool_calls_list
-                
-                # 构建响应摘要
-                response_data = {
-                    'content': content,
-                    'tool_calls': tool_calls_info,
-                    'full_content': full_content
-                }
-                
-                # 为了向后兼容，仍然生成response字段
-                response_summary_parts = []
-                if content and content.strip():
-                    # 限制content长度避免显示过长
-                    content_preview = content.strip()
-                    if len(content_preview) > 200:
-                        content_preview = content_preview[:200] + "..."
-                    response_summary_parts.append(f"内容: {content_preview}")
-                
-                if tool_calls_info:
-                    tool_names = [tc.get('name', '未知工具') for tc in tool_calls_info]
-                    response_summary_parts.append(f"调用工具: {', '.join(tool_names)}")
-                
-                if not response_summary_parts:
-                    response_summary = "无响应内容"
-                else:
-                    response_summary = " | ".join(response_summary_parts)
-                
-                # 提取token使用信息
-                usage = response.get('usage', {})
-                input_tokens = usage.get('prompt_tokens', 0)
-                output_tokens = usage.get('completion_tokens', 0)
-                total_tokens = usage.get('total_tokens', 0)
-                
-                result = {
-                    "index": i + 1,
-                    "timestamp": datetime.now().isoformat(),
-                    "duration": round(duration, 2),
-                    "success": True,
-                    "response": response_summary,
-                    "content": response_data.get('content'),
-                    "tool_calls": response_data.get('tool_calls'),
-                    "full_content": response_data.get('full_content'),
-                    "input_tokens": input_tokens,
-                    "output_tokens": output_tokens,
-                    "total_tokens": total_tokens,
-                    "model": request_data.get("model", "unknown"),
-                    "error": None,
-                    "mode": test_req.mode
-                }
-                
-                if test_req.mode == "json":
-                    result["full_response"] = response
-                
-                results.append(result)
-                test_results[session_id].append(result)
-                print(f"第 {i+1} 次请求成功，用时 {duration:.2f}s")
-                
-            except Exception as e:
-                end_time = time.time()
-                duration = end_time - start_time
-                
-                error_model = "unknown"
-                if test_req.mode == "simple":
-                    error_model = test_req.model
-                elif test_req.request_json:
-                    error_model = test_req.request_json.get("model", "unknown")
-
-                error_result = {
-                    "index": i + 1,
-                    "timestamp": datetime.now().isoformat(),
-                    "duration": round(duration, 2),
-                    "success": False,
-                    "response": None,
-                    "input_tokens": 0,
-                    "output_tokens": 0,
-                    "total_tokens": 0,
-                    "model": error_model,
-                    "error": str(e),
-                    "mode": test_req.mode
-                }
-                
-                results.append(error_result)
-                test_results[session_id].append(error_result)
-                print(f"第 {i+1} 次请求失败: {e}")
+    # 提交后台任务，立即返回会话ID，进度通过 /results 查询
+    job = await submit_job(session_id=session_id, total=test_req.count, runner=runner,
+                           deadline=test_req.deadline)
+    
+    return TestResponse(
+        success=True,
+        session_id=session_id,
+        job_id=job.job_id,
+        status=job.status,
+        message=f"已提交 {test_req.count} 次请求测试（并发 {test_req.concurrency}）"
+    )
+
+async def run_multiprocess(session_id: str, job: Job, specs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """由多个工作进程分担负载，回传的结果写入同一会话，返回合并后的逐进程/总体统计"""
+    def on_results(results: List[Dict[str, Any]]):
+        for result in results:
+            append_result(session_id, result)
+        job.completed += len(results)
+    
+    report = merge_reports(await run_workers(specs, on_results))
+    if "scheduled" in report:
+        job.total = report["scheduled"]
+    logger.info("多进程负载完成: %d 个工作进程", report["workers"], extra={"session_id": session_id})
+    return report
+
+async def run_load(load_req: LoadTestRequest, session_id: str, job: Job,
+                   scheduler: OpenLoopScheduler) -> Dict[str, Any]:
+    """按开环调度执行压测，每个请求完成后写入会话"""
+    throttle = create_throttle(load_req, load_req.max_in_flight)
+    retrier = create_retrier(load_req)
+    job.result = control_stats(throttle, retrier) or None
+    
+    async def fire(index: int, intended_offset: float, run_start: float):
+        result = await execute_single_request(load_req, index, run_start, intended_offset=intended_offset,
+                                              throttle=throttle, retrier=retrier)
+        append_result(session_id, result)
+        job.completed += 1
+    
+    stats = await scheduler.run(fire)
+    job.total = stats["scheduled"]
+    stats.update(control_stats(throttle, retrier))
+    logger.info("开环压测完成", extra={"session_id": session_id, **stats})
+    return stats
+
+@app.post("/load", response_model=TestResponse)
+async def run_load_test(load_req: LoadTestRequest):
+    """提交开环压测任务：按目标到达率在指定时长内持续发送请求"""
+    if load_req.rate <= 0 or load_req.rate > MAX_LOAD_RATE:
+        raise HTTPException(status_code=400, detail=f"到达率必须在 0 到 {MAX_LOAD_RATE} 之间")
+    if load_req.duration <= 0 or load_req.duration > MAX_LOAD_DURATION:
+        raise HTTPException(status_code=400, detail=f"持续时间必须在 0 到 {MAX_LOAD_DURATION} 秒之间")
+    if load_req.max_in_flight < 1 or load_req.max_in_flight > MAX_IN_FLIGHT:
+        raise HTTPException(status_code=400, detail=f"在途请求上限必须在 1 到 {MAX_IN_FLIGHT} 之间")
+    if load_req.arrival not in ARRIVAL_TYPES:
+        raise HTTPException(status_code=400, detail=f"到达模式必须是 {', '.join(ARRIVAL_TYPES)} 之一")
+    validate_common_fields(load_req, allow_workers=True)
+    
+    session_id = load_req.session_id or str(uuid4())
+    await ensure_session(session_id, load_req.keep_full_bodies)
+    
+    scheduler = OpenLoopScheduler(
+        rate=load_req.rate,
+        duration=load_req.duration,
+        arrival=load_req.arrival,
+        max_in_flight=load_req.max_in_flight,
+        seed=load_req.seed
+    )
+    job = await submit_job(
+        session_id=session_id,
+        total=scheduler.expected_count,
+        runner=lambda job: (
+            run_multiprocess(session_id, job, load_specs(
+                load_req.model_dump(), load_req.rate, load_req.duration, load_req.arrival,
+                load_req.max_in_flight, load_req.seed, load_req.workers))
+            if load_req.workers > 1 else run_load(load_req, session_id, job, scheduler)
+        ),
+        kind="load",
+        deadline=load_req.deadline
+    )
+    
+    return TestResponse(
+        success=True,
+        session_id=session_id,
+        job_id=job.job_id,
+        status=job.status,
+        message=f"已提交开环压测：{load_req.rate} 请求/秒，持续 {load_req.duration} 秒（{load_req.arrival}）"
+    )
+
+def profile_levels(profile_req: ProfileTestRequest) -> List[float]:
+    """计算阶梯负载各步的并发数或到达率"""
+    if profile_req.levels:
+        return profile_req.levels
+    if profile_req.profile == PROFILE_CONCURRENCY:
+        return concurrency_levels(profile_req.max_concurrency)
+    return rate_ramp(profile_req.start_rate, profile_req.end_rate, profile_req.rate_steps)
+
+async def run_profile(profile_req: ProfileTestRequest, session_id: str, job: Job,
+                      levels: List[float]) -> Dict[str, Any]:
+    """逐步执行阶梯负载，每步单独统计，并检测饱和拐点"""
+    steps: List[Dict[str, Any]] = []
+    report = {
+        "profile": profile_req.profile,
+        "levels": levels,
+        "steps": steps,
+        "knee_step": None,
+        "knee_level": None,
+        "saturation_step": None
+    }
+    # 阶梯负载有意逐步加压，只做 RPM/TPM 限流，不做自适应并发
+    throttle = create_throttle(profile_req, 0)
+    retrier = create_retrier(profile_req)
+    report.update(control_stats(throttle, retrier))
+    # 运行中即可通过 /jobs/{job_id} 查看已完成步骤
+    job.result = report
+    
+    for step_index, level in enumerate(levels):
+        window = SessionStats()
         
-        return TestResponse(
-            success=True,
-            session_id=session_id,
-            message=f"成功完成 {test_req.count} 次请求测试",
-            results=results
-        )
+        async def fire(index: int, intended_offset: float, run_start: float):
+            if profile_req.profile == PROFILE_RATE:
+                result = await execute_single_request(profile_req, index, run_start, intended_offset=intended_offset,
+                                                      throttle=throttle, retrier=retrier)
+            else:
+                result = await execute_single_request(profile_req, index, run_start, throttle=throttle,
+                                                      retrier=retrier)
+            result["step"] = step_index
+            result["step_level"] = level
+            window.add(result)
+            append_result(session_id, result)
+            job.completed += 1
         
-    except Exception as e:
-        return TestResponse(
-            success=False,
-            session_id=session_id,
-            message=f"测试执行失败: {str(e)}",
-            results=results
+        logger.info("阶梯负载第 %d/%d 步: %s=%s", step_index + 1, len(levels), profile_req.profile, level,
+                    extra={"session_id": session_id})
+        step_start = time.perf_counter()
+        if profile_req.profile == PROFILE_CONCURRENCY:
+            await run_closed_loop(fire, int(level), profile_req.step_duration)
+        else:
+            scheduler = OpenLoopScheduler(
+                rate=level,
+                duration=profile_req.step_duration,
+                arrival=profile_req.arrival,
+                max_in_flight=profile_req.max_in_flight
+            )
+            await scheduler.run(fire)
+        
+        steps.append({
+            "step": step_index,
+            "level": level,
+            "stats": summarize_window(window, time.perf_counter() - step_start)
+        })
+        
+        knee = detect_knee(
+            steps,
+            p99_threshold=profile_req.p99_threshold,
+            error_rate_threshold=profile_req.error_rate_threshold,
+            min_throughput_gain=profile_req.min_throughput_gain
         )
+        if knee is not None:
+            report["knee_step"] = knee
+            report["knee_level"] = levels[knee]
+            if profile_req.stop_at_knee:
+                break
+    
+    # 饱和点：拐点之前吞吐最高的一步
+    candidates = steps[:report["knee_step"]] if report["knee_step"] else steps
+    if candidates:
+        best = max(candidates, key=lambda step: step["stats"]["throughput"])
+        report["saturation_step"] = best["step"]
+    return report
 
-@app.get("/results/{session_id}")
-async def get_results(session_id: str):
-    """获取指定会话的测试结果"""
-    if session_id not in test_results:
-        raise HTTPException(status_code=404, detail="会话不存在")
+@app.post("/load/profile", response_model=TestResponse)
+async def run_profile_test(profile_req: ProfileTestRequest):
+    """提交阶梯负载任务：逐步提升并发数或到达率，定位饱和拐点"""
+    if profile_req.profile not in PROFILE_TYPES:
+        raise HTTPException(status_code=400, detail=f"负载模式必须是 {', '.join(PROFILE_TYPES)} 之一")
+    if profile_req.arrival not in ARRIVAL_TYPES:
+        raise HTTPException(status_code=400, detail=f"到达模式必须是 {', '.join(ARRIVAL_TYPES)} 之一")
+    if profile_req.step_duration <= 0 or profile_req.step_duration > MAX_LOAD_DURATION:
+        raise HTTPException(status_code=400, detail=f"每步持续时间必须在 0 到 {MAX_LOAD_DURATION} 秒之间")
     
-    results = test_results[session_id]
-    total_count = len(results)
-    success_count = len([r for r in results if r["success"]])
-    error_count = len([r for r in results if not r["success"]])
+    levels = profile_levels(profile_req)
+    if not levels or len(levels) > MAX_PROFILE_STEPS:
+        raise HTTPException(status_code=400, detail=f"阶梯步数必须在 1 到 {MAX_PROFILE_STEPS} 之间")
+    limit = MAX_IN_FLIGHT if profile_req.profile == PROFILE_CONCURRENCY else MAX_LOAD_RATE
+    if any(level <= 0 or level > limit for level in levels):
+        raise HTTPException(status_code=400, detail=f"各步取值必须在 0 到 {limit} 之间")
+    if profile_req.adaptive_concurrency:
+        raise HTTPException(status_code=400, detail="阶梯负载不支持自适应并发")
+    validate_common_fields(profile_req)
     
-    # 计算工具调用统计
-    tool_call_count = 0
-    total_tool_calls = 0
+    session_id = profile_req.session_id or str(uuid4())
+    await ensure_session(session_id, profile_req.keep_full_bodies)
     
-    for result in results:
-        if result["success"] and result.get("tool_calls"):
-            tool_call_count += 1
-            if isinstance(result["tool_calls"], list):
-                total_tool_calls += len(result["tool_calls"])
-            else:
-                total_tool_calls += 1
+    total = 0
+    if profile_req.profile == PROFILE_RATE:
+        total = int(sum(levels) * profile_req.step_duration)
+    job = await submit_job(
+        session_id=session_id,
+        total=total,
+        runner=lambda job: run_profile(profile_req, session_id, job, levels),
+        kind="profile",
+        deadline=profile_req.deadline
+    )
+    
+    return TestResponse(
+        success=True,
+        session_id=session_id,
+        job_id=job.job_id,
+        status=job.status,
+        message=f"已提交阶梯负载：{profile_req.profile} {levels}，每步 {profile_req.step_duration} 秒"
+    )
+
+def override_request(test_req: TestRequest, concurrency: int, **params) -> TestRequest:
+    """复制测试请求并替换并发数和请求参数：简单模式替换同名字段，JSON模式写入 request_json"""
+    update: Dict[str, Any] = {"concurrency": concurrency}
+    if test_req.mode == "json":
+        update["request_json"] = {**test_req.request_json, **params}
+    else:
+        update.update(params)
+    return test_req.model_copy(update=update)
+
+async def run_compare(compare_req: CompareTestRequest, session_id: str, job: Job,
+                      concurrency: Dict[str, int]) -> Dict[str, Any]:
+    """同时向多个模型发送相同的工作负载
+
+    每个模型使用独立的工作池（并发上限互不影响）、限流预算和统计窗口，结果写入同一会话；
+    吞吐按共同的开始时间计算，保证各模型在同一时段内可比
+    """
+    models = list(concurrency)
+    windows = {model: SessionStats() for model in models}
+    # 代理通常按模型分别限制 RPM/TPM，每个模型各自限流
+    throttles = {model: create_throttle(compare_req, concurrency[model]) for model in models}
+    # 对冲延迟按模型各自的延迟分布计算
+    retriers = {model: create_retrier(compare_req) for model in models}
+    finished: Dict[str, float] = {}
+    report: Dict[str, Any] = {"models": models, "count": compare_req.count, "matrix": []}
+    # 运行中即可通过 /jobs/{job_id} 查看对比矩阵
+    job.result = report
+    compare_start = time.perf_counter()
+    
+    def refresh():
+        now = time.perf_counter() - compare_start
+        report["matrix"] = [
+            {
+                "model": model,
+                "concurrency": concurrency[model],
+                "finished": model in finished,
+                **summarize_comparison(windows[model], finished.get(model, now)),
+                **control_stats(throttles[model], retriers[model])
+            }
+            for model in models
+        ]
+    
+    async def run_model(model: str):
+        def record(result: Dict[str, Any]):
+            windows[model].add(result)
+            refresh()
+        
+        model_req = override_request(compare_req, concurrency[model], model=model)
+        await run_batch(model_req, session_id, job, on_result=record, throttle=throttles[model],
+                        retrier=retriers[model])
+        finished[model] = time.perf_counter() - compare_start
+        refresh()
+    
+    refresh()
+    await asyncio.gather(*(run_model(model) for model in models))
+    logger.info("多模型对比完成: %d 个模型", len(models), extra={"session_id": session_id})
+    return report
+
+@app.post("/compare", response_model=TestResponse)
+async def run_compare_test(compare_req: CompareTestRequest):
+    """提交多模型对比任务：同一请求同时发往多个模型，生成并排的延迟/吞吐/Token/错误矩阵"""
+    if compare_req.count < 1 or compare_req.count > MAX_REQUEST_COUNT:
+        raise HTTPException(status_code=400, detail=f"每个模型的请求次数必须在 1 到 {MAX_REQUEST_COUNT} 之间")
+    if compare_req.mode == "json" and not compare_req.request_json:
+        raise HTTPException(status_code=400, detail="JSON模式需要提供 request_json")
+    
+    # 去重并保持顺序
+    models = list(dict.fromkeys(AVAILABLE_MODELS if compare_req.models is None else compare_req.models))
+    if not models or len(models) > MAX_COMPARE_MODELS:
+        raise HTTPException(status_code=400, detail=f"对比模型数必须在 1 到 {MAX_COMPARE_MODELS} 之间")
+    overrides = compare_req.per_model_concurrency or {}
+    unknown = [model for model in overrides if model not in models]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"per_model_concurrency 中的模型未参与对比: {', '.join(unknown)}")
+    concurrency = {model: overrides.get(model, compare_req.concurrency) for model in models}
+    if any(value < 1 or value > MAX_CONCURRENCY for value in concurrency.values()):
+        raise HTTPException(status_code=400, detail=f"并发数必须在 1 到 {MAX_CONCURRENCY} 之间")
+    validate_common_fields(compare_req)
+    
+    session_id = compare_req.session_id or str(uuid4())
+    await ensure_session(session_id, compare_req.keep_full_bodies)
+    
+    job = await submit_job(
+        session_id=session_id,
+        total=compare_req.count * len(models),
+        runner=lambda job: run_compare(compare_req, session_id, job, concurrency),
+        kind="compare",
+        deadline=compare_req.deadline
+    )
+    
+    return TestResponse(
+        success=True,
+        session_id=session_id,
+        job_id=job.job_id,
+        status=job.status,
+        message=f"已提交多模型对比：{len(models)} 个模型，每个模型 {compare_req.count} 次请求"
+    )
+
+def sweep_cells(sweep_req: SweepTestRequest) -> List[Dict[str, Any]]:
+    """展开扫描维度的笛卡尔积，每个单元记录模型、温度、最大Token数和并发数
+
+    未指定的维度取请求本身的值（JSON模式取 request_json 中的值）
+    """
+    base = (sweep_req.request_json or {}) if sweep_req.mode == "json" else {
+        "model": sweep_req.model,
+        "temperature": sweep_req.temperature,
+        "max_tokens": sweep_req.max_tokens
+    }
+    dimensions = [
+        ("model", sweep_req.models or [base.get("model")]),
+        ("temperature", sweep_req.temperatures or [base.get("temperature")]),
+        ("max_tokens", sweep_req.max_tokens_values or [base.get("max_tokens")]),
+        ("concurrency", sweep_req.concurrencies or [sweep_req.concurrency]),
+    ]
+    names = [name for name, _ in dimensions]
+    return [dict(zip(names, values)) for values in itertools.product(*(values for _, values in dimensions))]
+
+async def run_sweep(sweep_req: SweepTestRequest, session_id: str, job: Job,
+                    cells: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """执行参数扫描：每个单元是一批请求，单元内按其并发数执行，所有单元共享在途请求上限
+
+    每条结果带 cell（单元序号）和 cell_params 标记，各单元单独统计
+    """
+    # 只替换被扫描的参数，未扫描的参数保持请求原样
+    swept = [name for name, values in (("model", sweep_req.models),
+                                       ("temperature", sweep_req.temperatures),
+                                       ("max_tokens", sweep_req.max_tokens_values)) if values]
+    windows = [SessionStats() for _ in cells]
+    elapsed: List[Optional[float]] = [None] * len(cells)
+    rows: List[Dict[str, Any]] = [{}] * len(cells)
+    report: Dict[str, Any] = {"cell_count": len(cells), "count": sweep_req.count, "cells": rows}
+    # 运行中即可通过 /jobs/{job_id} 查看各单元统计
+    job.result = report
+    limiter = asyncio.Semaphore(sweep_req.max_in_flight)
+    # 所有单元共享限流和重试预算
+    throttle = create_throttle(sweep_req, sweep_req.max_in_flight)
+    retrier = create_retrier(sweep_req)
+    report.update(control_stats(throttle, retrier))
+    queue: asyncio.Queue = asyncio.Queue()
+    for cell_index in range(len(cells)):
+        queue.put_nowait(cell_index)
+    
+    def refresh(cell_index: int, cell_elapsed: float):
+        rows[cell_index] = {
+            "cell": cell_index,
+            **cells[cell_index],
+            "finished": elapsed[cell_index] is not None,
+            **summarize_comparison(windows[cell_index], cell_elapsed)
+        }
+    
+    for cell_index in range(len(cells)):
+        refresh(cell_index, 0.0)
+    
+    async def run_cell(cell_index: int):
+        cell = cells[cell_index]
+        cell_start = time.perf_counter()
+        
+        def record(result: Dict[str, Any]):
+            result["cell"] = cell_index
+            result["cell_params"] = cell
+            windows[cell_index].add(result)
+            refresh(cell_index, time.perf_counter() - cell_start)
+        
+        cell_req = override_request(sweep_req, cell["concurrency"], **{name: cell[name] for name in swept})
+        logger.info("参数扫描第 %d/%d 个单元: %s", cell_index + 1, len(cells), cell,
+                    extra={"session_id": session_id})
+        await run_batch(cell_req, session_id, job, on_result=record, limiter=limiter, throttle=throttle,
+                        retrier=retrier)
+        elapsed[cell_index] = time.perf_counter() - cell_start
+        refresh(cell_index, elapsed[cell_index])
+    
+    async def worker():
+        while True:
+            try:
+                cell_index = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            await run_cell(cell_index)
+    
+    await asyncio.gather(*(worker() for _ in range(min(sweep_req.parallel_cells, len(cells)))))
+    return report
+
+@app.post("/sweep", response_model=TestResponse)
+async def run_sweep_test(sweep_req: SweepTestRequest):
+    """提交参数扫描任务：展开模型/温度/最大Token数/并发数的组合，生成各单元的统计表"""
+    if sweep_req.count < 1 or sweep_req.count > MAX_REQUEST_COUNT:
+        raise HTTPException(status_code=400, detail=f"每个单元的请求次数必须在 1 到 {MAX_REQUEST_COUNT} 之间")
+    if sweep_req.mode == "json" and not sweep_req.request_json:
+        raise HTTPException(status_code=400, detail="JSON模式需要提供 request_json")
+    for name in ("models", "temperatures", "max_tokens_values", "concurrencies"):
+        if getattr(sweep_req, name) == []:
+            raise HTTPException(status_code=400, detail=f"{name} 不能为空列表")
+    if any(value < 1 or value > MAX_CONCURRENCY for value in sweep_req.concurrencies or [sweep_req.concurrency]):
+        raise HTTPException(status_code=400, detail=f"并发数必须在 1 到 {MAX_CONCURRENCY} 之间")
+    if any(value < 1 for value in sweep_req.max_tokens_values or []):
+        raise HTTPException(status_code=400, detail="max_tokens 必须大于 0")
+    if sweep_req.max_in_flight < 1 or sweep_req.max_in_flight > MAX_IN_FLIGHT:
+        raise HTTPException(status_code=400, detail=f"在途请求上限必须在 1 到 {MAX_IN_FLIGHT} 之间")
+    if sweep_req.parallel_cells < 1:
+        raise HTTPException(status_code=400, detail="parallel_cells 必须大于 0")
+    validate_common_fields(sweep_req)
+    
+    cells = sweep_cells(sweep_req)
+    if len(cells) > MAX_SWEEP_CELLS:
+        raise HTTPException(status_code=400, detail=f"扫描单元数 {len(cells)} 超过上限 {MAX_SWEEP_CELLS}")
+    
+    session_id = sweep_req.session_id or str(uuid4())
+    await ensure_session(session_id, sweep_req.keep_full_bodies)
+    
+    job = await submit_job(
+        session_id=session_id,
+        total=sweep_req.count * len(cells),
+        runner=lambda job: run_sweep(sweep_req, session_id, job, cells),
+        kind="sweep",
+        deadline=sweep_req.deadline
+    )
     
-    tool_call_probability = (tool_call_count / total_count * 100) if total_count > 0 else 0
+    return TestResponse(
+        success=True,
+        session_id=session_id,
+        job_id=job.job_id,
+        status=job.status,
+        message=f"已提交参数扫描：{len(cells)} 个单元，每个单元 {sweep_req.count} 次请求"
+    )
+
+def dataset_path(dataset_id: str) -> Path:
+    """上传数据集的存放路径；dataset_id 只能是文件名，不能包含路径"""
+    if not dataset_id or Path(dataset_id).name != dataset_id:
+        raise HTTPException(status_code=400, detail="无效的数据集ID")
+    return Path(DATASET_DIR) / f"{dataset_id}.jsonl"
+
+def local_dataset_path(path: str) -> Path:
+    """服务端本地数据集的路径：相对路径相对于数据集目录，解析（含符号链接）后必须位于数据集目录内"""
+    directory = Path(DATASET_DIR).resolve()
+    resolved = (directory / path).resolve()
+    if not resolved.is_relative_to(directory):
+        raise HTTPException(status_code=400, detail=f"数据集路径必须位于数据集目录 {DATASET_DIR} 内")
+    return resolved
+
+@app.post("/datasets")
+async def upload_dataset(file: UploadFile = File(...)):
+    """上传 JSONL 数据集，分块写入磁盘"""
+    dataset_id = uuid4().hex
+    path = dataset_path(dataset_id)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    size = 0
+    with open(path, "wb") as out:
+        while chunk := await file.read(1024 * 1024):
+            await asyncio.to_thread(out.write, chunk)
+            size += len(chunk)
+    logger.info("已上传数据集 %s（%d 字节）", dataset_id, size)
+    return {"dataset_id": dataset_id, "filename": file.filename, "size": size}
+
+@app.get("/datasets")
+async def list_datasets():
+    """获取已上传的数据集"""
+    directory = Path(DATASET_DIR)
+    if not directory.is_dir():
+        return {"datasets": []}
+    datasets = []
+    for path in sorted(directory.glob("*.jsonl"), key=lambda p: p.stat().st_mtime, reverse=True):
+        stat = path.stat()
+        datasets.append({
+            "dataset_id": path.stem,
+            "size": stat.st_size,
+            "uploaded_at": datetime.fromtimestamp(stat.st_mtime).isoformat()
+        })
+    return {"datasets": datasets}
+
+@app.delete("/datasets/{dataset_id}")
+async def delete_dataset(dataset_id: str):
+    """删除已上传的数据集"""
+    path = dataset_path(dataset_id)
+    if not path.is_file():
+        raise HTTPException(status_code=404, detail="数据集不存在")
+    path.unlink()
+    return {"message": "数据集已删除"}
+
+def invalid_line_result(index: int, record: DatasetRecord) -> Dict[str, Any]:
+    """无法解析的数据集行记为失败结果，保留行号便于定位"""
+    return {
+        "index": index,
+        "line": record.line,
+        "timestamp": datetime.now().isoformat(),
+        "duration": 0.0,
+        "success": False,
+        "response": None,
+        "input_tokens": 0,
+        "output_tokens": 0,
+        "total_tokens": 0,
+        "model": "unknown",
+        "error": record.error,
+        "error_type": "invalid_line",
+        "outcome": OUTCOME_ERROR,
+        "mode": "json"
+    }
+
+async def run_replay(replay_req: ReplayTestRequest, session_id: str, job: Job, path: Path) -> Dict[str, Any]:
+    """惰性读取数据集并按时间回放，每条结果带源文件行号 line"""
+    report: Dict[str, Any] = {"path": str(path), "speed": replay_req.speed, "invalid_lines": 0}
+    throttle = create_throttle(replay_req, replay_req.max_in_flight)
+    retrier = create_retrier(replay_req)
+    report.update(control_stats(throttle, retrier))
+    job.result = report
+    
+    async def fire(index: int, record: DatasetRecord, intended_offset: Optional[float], run_start: float):
+        job.total = max(job.total, index)
+        if record.request is None:
+            result = invalid_line_result(index, record)
+            report["invalid_lines"] += 1
+        else:
+            request_json = record.request
+            if replay_req.model:
+                request_json = {**request_json, "model": replay_req.model}
+            line_req = replay_req.model_copy(update={"mode": "json", "request_json": request_json})
+            result = await execute_single_request(line_req, index, run_start, intended_offset=intended_offset,
+                                                  throttle=throttle, retrier=retrier)
+            result["line"] = record.line
+        append_result(session_id, result)
+        job.completed += 1
+    
+    stats = await replay(iter_dataset(path, replay_req.limit), fire,
+                         speed=replay_req.speed, max_in_flight=replay_req.max_in_flight)
+    job.total = stats["dispatched"]
+    report.update(stats)
+    logger.info("数据集回放完成", extra={"session_id": session_id, **stats})
+    return report
+
+@app.post("/replay", response_model=TestResponse)
+async def run_replay_test(replay_req: ReplayTestRequest):
+    """提交数据集回放任务：逐行读取 JSONL 请求，按原始时间间隔（可加速）回放"""
+    if (replay_req.dataset_id is None) == (replay_req.path is None):
+        raise HTTPException(status_code=400, detail="dataset_id 和 path 必须且只能指定一个")
+    path = dataset_path(replay_req.dataset_id) if replay_req.dataset_id else local_dataset_path(replay_req.path)
+    if not path.is_file():
+        raise HTTPException(status_code=404, detail="数据集不存在")
+    if replay_req.speed < 0:
+        raise HTTPException(status_code=400, detail="回放倍速不能为负数")
+    if replay_req.max_in_flight < 1 or replay_req.max_in_flight > MAX_IN_FLIGHT:
+        raise HTTPException(status_code=400, detail=f"在途请求上限必须在 1 到 {MAX_IN_FLIGHT} 之间")
+    if replay_req.limit is not None and replay_req.limit < 1:
+        raise HTTPException(status_code=400, detail="limit 必须大于 0")
+    validate_common_fields(replay_req)
+    
+    session_id = replay_req.session_id or str(uuid4())
+    await ensure_session(session_id, replay_req.keep_full_bodies)
+    
+    job = await submit_job(
+        session_id=session_id,
+        total=replay_req.limit or 0,
+        runner=lambda job: run_replay(replay_req, session_id, job, path),
+        kind="replay",
+        deadline=replay_req.deadline
+    )
+    
+    speed = f"{replay_req.speed}× 速" if replay_req.speed > 0 else "尽快"
+    return TestResponse(
+        success=True,
+        session_id=session_id,
+        job_id=job.job_id,
+        status=job.status,
+        message=f"已提交数据集回放：{path.name}（{speed}）"
+    )
+
+async def session_progress(session_id: str) -> Dict[str, Any]:
+    """返回会话最近一个任务的状态和进度（共享模式下包括其他进程提交的任务）"""
+    jobs = await list_job_dicts(session_id)
+    if jobs:
+        job = jobs[-1]
+        return {"job_id": job["job_id"], "status": job["status"], "completed": job["completed"], "total": job["total"]}
+    count = result_store.count(session_id)
+    return {"job_id": None, "status": JOB_DONE, "completed": count, "total": count}
+
+@app.get("/results/{session_id}")
+async def get_results(session_id: str, offset: int = 0, limit: Optional[int] = None, since: Optional[int] = None,
+                      fields: Optional[str] = None, bodies: bool = True, success: Optional[bool] = None,
+                      model: Optional[str] = None, error_type: Optional[str] = None, summary: bool = True):
+    """获取指定会话的测试结果
+
+    offset/limit 用于分页，返回第 offset+1 条起的至多 limit 条结果；since 与 offset 相同，
+    作为增量查询的游标，把响应中的 next_since 作为下次的 since 即只取新增结果。
+    success/model/error_type 按索引过滤结果；fields 为逗号分隔的返回字段，bodies=false 时不返回响应体字段；
+    summary=false 时不返回会话统计
+    """
+    await result_store.sync_session(session_id)
+    if not result_store.has_session(session_id):
+        raise HTTPException(status_code=404, detail="会话不存在")
+    if since is not None:
+        offset = since
+    if offset < 0 or (limit is not None and limit < 1):
+        raise HTTPException(status_code=400, detail="offset/since 不能为负数，limit 必须大于 0")
     
+    filters = {field: value for field, value in
+               (("success", success), ("model", model), ("error_type", error_type)) if value is not None}
+    selected = [name.strip() for name in fields.split(",") if name.strip()] if fields else None
+    exclude = () if bodies else BODY_FIELDS
+    results, cursor = await result_store.query_results(session_id, offset, limit, filters)
     return {
         "session_id": session_id,
-        "results": results,
-        "total_count": total_count,
-        "success_count": success_count,
-        "error_count": error_count,
-        "tool_call_count": tool_call_count,
-        "total_tool_calls": total_tool_calls,
-        "tool_call_probability": round(tool_call_probability, 1)
+        **(await session_progress(session_id)),
+        "offset": offset,
+        "next_since": cursor,
+        "results": [project_result(result, selected, exclude) for result in results],
+        **(result_store.stats(session_id).summary() if summary else {})
     }
 
+@app.get("/results/{session_id}/export")
+async def export_session(session_id: str, format: str = EXPORT_NDJSON, columns: Optional[str] = None,
+                         bodies: bool = True):
+    """流式导出会话结果（ndjson/csv/parquet/arrow），分批读取，内存占用与会话大小无关
+
+    columns 为逗号分隔的导出列；bodies=false 时不导出响应体字段，只保留指标。
+    导出范围为开始导出时已写入的结果
+    """
+    await result_store.sync_session(session_id)
+    if not result_store.has_session(session_id):
+        raise HTTPException(status_code=404, detail="会话不存在")
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"导出格式必须是 {', '.join(EXPORT_FORMATS)} 之一")
+    if format in ARROW_FORMATS and not arrow_available():
+        raise HTTPException(status_code=400, detail="导出 Parquet/Arrow 需要安装 pyarrow")
+    
+    selected = [name.strip() for name in columns.split(",") if name.strip()] if columns else None
+    total = result_store.count(session_id)
+    return StreamingResponse(
+        export_results(format, lambda: iter_batches(result_store, session_id, total), selected,
+                       exclude=() if bodies else BODY_FIELDS),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{session_id}.{format}"'}
+    )
+
+def format_sse(event: str, data: Any, event_id: Optional[int] = None) -> str:
+    """按 Server-Sent Events 格式编码一条事件"""
+    payload = json.dumps(jsonable_encoder(data), ensure_ascii=False)
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {payload}")
+    return "\n".join(lines) + "\n\n"
+
+async def stream_session_events(request: Request, session_id: str, since: int):
+    """逐条推送会话结果，并定期推送汇总快照，任务结束后发送 end 事件
+
+    事件 id 为结果在会话中的位置（从1开始），断线重连时可据此从上次位置继续
+    """
+    position = since
+    last_snapshot = 0.0
+    
+    while True:
+        if await request.is_disconnected():
+            return
+        
+        # 先取得 waiter 再检查数据，避免漏掉两者之间写入的结果
+        waiter = session_notifier.waiter(session_id)
+        await result_store.sync_session(session_id)
+        if not result_store.has_session(session_id):
+            yield format_sse("missing", {"detail": "会话不存在"})
+            return
+        
+        # 积压的结果分批读取，推送完一批再读下一批，从头续传大会话时内存中也只有一批结果
+        while True:
+            batch = await result_store.get_results(session_id, position, STREAM_BATCH_SIZE)
+            for result in batch:
+                position += 1
+                yield format_sse("result", {"position": position, **result}, event_id=position)
+            if len(batch) < STREAM_BATCH_SIZE:
+                break
+        
+        if not result_store.has_session(session_id):
+            yield format_sse("missing", {"detail": "会话不存在"})
+            return
+        stats = result_store.stats(session_id)
+        progress = await session_progress(session_id)
+        finished = progress["status"] not in ACTIVE_STATES
+        now = time.monotonic()
+        if finished or now - last_snapshot >= STREAM_SNAPSHOT_INTERVAL:
+            yield format_sse("snapshot", {
+                "session_id": session_id,
+                **progress,
+                **stats.summary()
+            })
+            last_snapshot = now
+        
+        if finished:
+            yield format_sse("end", {"session_id": session_id, "status": progress["status"]})
+            return
+        
+        # 共享模式下其他进程写入的结果不会触发本进程的通知，需要定期轮询
+        await session_notifier.wait(waiter, min(STREAM_SNAPSHOT_INTERVAL, SHARED_POLL_INTERVAL)
+                                    if result_store.shared else STREAM_SNAPSHOT_INTERVAL)
+
+@app.get("/results/{session_id}/stream")
+async def stream_results(request: Request, session_id: str, since: int = 0):
+    """以 Server-Sent Events 推送会话结果
+
+    since 为已接收的结果条数；浏览器自动重连时携带的 Last-Event-ID 优先
+    """
+    await result_store.sync_session(session_id)
+    if not result_store.has_session(session_id):
+        raise HTTPException(status_code=404, detail="会话不存在")
+    
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id and last_event_id.isdigit():
+        since = int(last_event_id)
+    
+    return StreamingResponse(
+        stream_session_events(request, session_id, max(0, since)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/sessions")
-async def get_sessions():
-    """获取所有测试会话"""
+async def get_sessions(offset: int = 0, limit: Optional[int] = None):
+    """获取所有测试会话（按创建时间排序，可分页）"""
+    await result_store.sync()
+    session_ids = result_store.session_ids()
+    end = None if limit is None else offset + limit
+    # 各会话最近一个任务的状态
+    latest_status = {job["session_id"]: job["status"] for job in await list_job_dicts()}
     sessions = []
-    for session_id, results in test_results.items():
+    for session_id in session_ids[offset:end]:
+        stats = result_store.stats(session_id)
         sessions.append({
             "session_id": session_id,
-            "total_count": len(results),
-            "success_count": len([r for r in results if r["success"]]),
-            "error_count": len([r for r in results if not r["success"]]),
-            "last_update": max([r["timestamp"] for r in results]) if results else None
+            "status": latest_status.get(session_id, JOB_DONE),
+            "timestamp": result_store.created_at(session_id),
+            "total_count": stats.total_count,
+            "success_count": stats.success_count,
+            "error_count": stats.error_count,
+            "latency": stats.latency.summary(),
+            "stored_bytes": result_store.size(session_id),
+            "last_update": stats.last_update
         })
     
-    return {"sessions": sessions}
+    return {"sessions": sessions, "total": len(session_ids)}
 
 @app.delete("/results/{session_id}")
 async def delete_results(session_id: str):
     """删除指定会话的测试结果"""
-    if session_id not in test_results:
+    await result_store.sync_session(session_id)
+    if not result_store.has_session(session_id):
         raise HTTPException(status_code=404, detail="会话不存在")
     
-    del test_results[session_id]
+    # 先取消会话下仍在运行的任务
+    job_manager.forget_session(session_id)
+    await result_store.delete_session(session_id)
     return {"message": f"已删除会话 {session_id} 的结果"}
 
+@app.get("/jobs")
+async def list_jobs():
+    """获取所有后台任务"""
+    return {"jobs": await list_job_dicts()}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """获取指定后台任务的状态"""
+    job = await find_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """取消任务：在途请求立即中止，已完成的结果保留在会话中
+
+    共享模式下任务可能由其他工作进程执行，取消请求经数据库转交给该进程
+    """
+    job = job_manager.get(job_id)
+    if job:
+        if not job_manager.cancel(job_id):
+            raise HTTPException(status_code=409, detail="任务已结束")
+        return {"message": "任务已取消", "job_id": job_id, "session_id": job.session_id,
+                "completed": job.completed}
+    job = await find_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    if job["status"] not in ACTIVE_STATES or not await result_store.request_cancel(job_id):
+        raise HTTPException(status_code=409, detail="任务已结束")
+    return {"message": "已请求取消任务，将由执行该任务的工作进程中止", "job_id": job_id,
+            "session_id": job["session_id"], "completed": job["completed"]}
+
 @app.get("/system-prompt")
 async def get_system_prompt():
     """获取系统提示词"""
@@ -555,11 +1389,15 @@ async def get_system_prompt():
 @app.get("/health")
 async def health_check():
     """健康检查"""
+    await result_store.sync()
+    jobs = await list_job_dicts()
     return {
         "status": "ok",
         "api_url": API_URL,
         "available_models": AVAILABLE_MODELS,
-        "active_sessions": len(test_results),
+        "active_sessions": len(result_store.session_ids()),
+        "stored_bytes": result_store.total_bytes,
+        "active_jobs": len([job for job in jobs if job["status"] in ACTIVE_STATES]),
         "version": "1.0.0"
     }
 
@@ -573,7 +1411,25 @@ async def get_config():
         "default_temperature": DEFAULT_TEMPERATURE,
         "default_max_tokens": DEFAULT_MAX_TOKENS,
         "max_request_count": MAX_REQUEST_COUNT,
-        "request_timeout": REQUEST_TIMEOUT
+        "max_concurrency": MAX_CONCURRENCY,
+        "max_compare_models": MAX_COMPARE_MODELS,
+        "max_sweep_cells": MAX_SWEEP_CELLS,
+        "max_workers": MAX_WORKERS,
+        "max_load_rate": MAX_LOAD_RATE,
+        "max_load_duration": MAX_LOAD_DURATION,
+        "max_in_flight": MAX_IN_FLIGHT,
+        "max_shared_prefix_tokens": MAX_SHARED_PREFIX_TOKENS,
+        "rate_limit_rpm": RATE_LIMIT_RPM,
+        "rate_limit_tpm": RATE_LIMIT_TPM,
+        "max_sessions": MAX_SESSIONS,
+        "max_stored_bytes": MAX_STORED_BYTES,
+        "session_ttl": SESSION_TTL,
+        "default_keep_full_bodies": DEFAULT_KEEP_FULL_BODIES,
+        "transport": TRANSPORT,
+        "app_workers": APP_WORKERS,
+        "request_timeout": REQUEST_TIMEOUT,
+        "connect_timeout": CONNECT_TIMEOUT,
+        "first_byte_timeout": FIRST_BYTE_TIMEOUT
     }
 
 @app.get("/default-model")
@@ -589,4 +1445,7 @@ if __name__ == "__main__":
     print(f"API地址: {API_URL}")
     print(f"支持模型: {len(AVAILABLE_MODELS)} 个")
     print(f"访问地址: http://{HOST}:{PORT}")
-    uvicorn.run("app:app", host=HOST, port=PORT, reload=True)
\ No newline at end of file
+    if APP_WORKERS > 1:
+        print(f"工作进程: {APP_WORKERS} 个（状态经 {RESULT_DB_PATH} 共享）")
+    # 多工作进程与自动重载不能同时使用
+    uvicorn.run("app:app", host=HOST, port=PORT, reload=APP_WORKERS == 1, workers=APP_WORKERS)
\ No newline at end of file
@@ -23,7 +23,7 @@ from pydantic import BaseModel
 from config import (
     API_URL, API_KEY, AVAILABLE_MODELS, SYSTEM_PROMPT,
     HOST, PORT, DEFAULT_TEMPERATURE, DEFAULT_MAX_TOKENS,
-    MAX_REQUEST_COUNT, REQUEST_TIMEOUT, DEFAULT_MODEL
+    MAX_REQUEST_COUNT, MAX_CONCURRENCY, REQUEST_TIMEOUT, DEFAULT_MODEL
 )
 
 # 创建FastAPI应用
@@ -43,6 +43,7 @@ class TestRequest(BaseModel):
     temperature: Optional[float] = DEFAULT_TEMPERATURE
     max_tokens: Optional[int] = DEFAULT_MAX_TOKENS
     count: int = 1
+    concurrency: int = 1  # 同时在途的最大请求数
     session_id: Optional[str] = None
 
 class TestResponse(BaseModel):
@@ -73,6 +74,7 @@ async def get_config():
         "default_temperature": DEFAULT_TEMPERATURE,
         "default_max_tokens": DEFAULT_MAX_TOKENS,
         "max_request_count": MAX_REQUEST_COUNT,
+        "max_concurrency": MAX_CONCURRENCY,
         "default_model": DEFAULT_MODEL
     }
 
@@ -115,11 +117,78 @@ async def make_api_request(prompt: str, model: str, temperature: float, max_toke
         traceback.print_exc()
         raise e
 
+async def execute_single_request(test_req: TestRequest, index: int, batch_start: float) -> Dict[str, Any]:
+    """执行单次请求并构建结果记录"""
+    print(f"执行第 {index}/{test_req.count} 次请求...")
+    
+    start_time = time.perf_counter()
+    
+    try:
+        response = await make_api_request(
+            prompt=test_req.prompt,
+            model=test_req.model,
+            temperature=test_req.temperature,
+            max_tokens=test_req.max_tokens
+        )
+        
+        end_time = time.perf_counter()
+        duration = end_time - start_time
+        
+        # 提取响应内容
+        content = ""
+        if response.get('choices') and len(response['choices']) > 0:
+            choice = response['choices'][0]
+            if choice.get('message'):
+                content = choice['message'].get('content', '')
+        
+        # 提取token使用信息
+        usage = response.get('usage', {})
+        
+        result = {
+            "index": index,
+            "timestamp": datetime.now().isoformat(),
+            "duration": round(duration, 2),
+            "start_offset": round(start_time - batch_start, 3),
+            "end_offset": round(end_time - batch_start, 3),
+            "success": True,
+            "response": content[:200] + "..." if len(content) > 200 else content,
+            "input_tokens": usage.get('prompt_tokens', 0),
+            "output_tokens": usage.get('completion_tokens', 0),
+            "total_tokens": usage.get('total_tokens', 0),
+            "model": test_req.model,
+            "error": None
+        }
+        print(f"第 {index} 次请求成功，用时 {duration:.2f}s")
+        return result
+        
+    except Exception as e:
+        end_time = time.perf_counter()
+        duration = end_time - start_time
+        
+        error_result = {
+            "index": index,
+            "timestamp": datetime.now().isoformat(),
+            "duration": round(duration, 2),
+            "start_offset": round(start_time - batch_start, 3),
+            "end_offset": round(end_time - batch_start, 3),
+            "success": False,
+            "response": None,
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "total_tokens": 0,
+            "model": test_req.model,
+            "error": str(e)
+        }
+        print(f"第 {index} 次请求失败: {e}")
+        return error_result
+
 @app.post("/test", response_model=TestResponse)
 async def run_test(test_req: TestRequest):
     """运行大模型测试"""
-    if test_req.count > MAX_REQUEST_COUNT:
-        raise HTTPException(status_code=400, detail=f"请求次数不能超过 {MAX_REQUEST_COUNT} 次")
+    if test_req.count < 1 or test_req.count > MAX_REQUEST_COUNT:
+        raise HTTPException(status_code=400, detail=f"请求次数必须在 1 到 {MAX_REQUEST_COUNT} 之间")
+    if test_req.concurrency < 1 or test_req.concurrency > MAX_CONCURRENCY:
+        raise HTTPException(status_code=400, detail=f"并发数必须在 1 到 {MAX_CONCURRENCY} 之间")
     
     session_id = test_req.session_id or str(uuid4())
     
@@ -127,71 +196,26 @@ async def run_test(test_req: TestRequest):
         test_results[session_id] = []
     
     results = []
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(test_req.count):
+        queue.put_nowait(i + 1)
+    batch_start = time.perf_counter()
     
-    try:
-        for i in range(test_req.count):
-            print(f"执行第 {i+1}/{test_req.count} 次请求...")
-            
-            start_time = time.time()
-            
+    async def worker():
+        # 工作协程持续从队列领取序号，直到队列为空
+        while True:
             try:
-                response = await make_api_request(
-                    prompt=test_req.prompt,
-                    model=test_req.model,
-                    temperature=test_req.temperature,
-                    max_tokens=test_req.max_tokens
-                )
-                
-                end_time = time.time()
-                duration = end_time - start_time
-                
-                # 提取响应内容
-                content = ""
-                if response.get('choices') and len(response['choices']) > 0:
-                    choice = response['choices'][0]
-                    if choice.get('message'):
-                        content = choice['message'].get('content', '')
-                
-                # 提取token使用信息
-                usage = response.get('usage', {})
-                
-                result = {
-                    "index": i + 1,
-                    "timestamp": datetime.now().isoformat(),
-                    "duration": round(duration, 2),
-                    "success": True,
-                    "response": content[:200] + "..." if len(content) > 200 else content,
-                    "input_tokens": usage.get('prompt_tokens', 0),
-                    "output_tokens": usage.get('completion_tokens', 0),
-                    "total_tokens": usage.get('total_tokens', 0),
-                    "model": test_req.model,
-                    "error": None
-                }
-                
-                results.append(result)
-                test_results[session_id].append(result)
-                print(f"第 {i+1} 次请求成功，用时 {duration:.2f}s")
-                
-            except Exception as e:
-                end_time = time.time()
-                duration = end_time - start_time
-                
-                error_result = {
-                    "index": i + 1,
-                    "timestamp": datetime.now().isoformat(),
-                    "duration": round(duration, 2),
-                    "success": False,
-                    "response": None,
-                    "input_tokens": 0,
-                    "output_tokens": 0,
-                    "total_tokens": 0,
-                    "model": test_req.model,
-                    "error": str(e)
-                }
-                
-                results.append(error_result)
-                test_results[session_id].append(error_result)
-                print(f"第 {i+1} 次请求失败: {e}")
+                index = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            result = await execute_single_request(test_req, index, batch_start)
+            results.append(result)
+            test_results[session_id].append(result)
+    
+    try:
+        worker_count = max(1, min(test_req.concurrency, test_req.count))
+        await asyncio.gather(*(worker() for _ in range(worker_count)))
+        results.sort(key=lambda r: r["index"])
         
         return TestResponse(
             success=True,
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+日志开销基准测试
+用立即返回的假 acompletion 替换 LiteLLM，测量 LiteLLM 传输层每次请求在本地消耗的时间：
+- legacy-print：旧版在请求路径上同步执行的调试打印（json.dumps indent=2 三次、dir(response)）
+- info：默认级别，不记录请求/响应内容
+- debug+payloads：LOG_LEVEL=DEBUG 且 LOG_PAYLOADS=true，内容序列化后入队，由后台线程写出
+
+用法: python benchmarks/bench_logging.py [--requests 2000] [--tools 20] [--json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.chdir(ROOT)
+os.environ.setdefault("API_URL", "http://127.0.0.1:4000/v1")
+os.environ.setdefault("API_KEY", "benchmark")
+
+DEVNULL = open(os.devnull, "w")
+
+from logger import setup_logging  # noqa: E402
+
+# 在导入其他模块之前配置日志，使输出线程写入 /dev/null
+setup_logging("INFO", stream=DEVNULL)
+
+import litellm  # noqa: E402
+from transport import LiteLLMTransport  # noqa: E402
+
+
+class Obj:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+def build_payload(tool_count: int):
+    """构造带大量工具定义和工具调用的请求及响应，模拟大体积的工具调用场景"""
+    tools = [{
+        "type": "function",
+        "function": {
+            "name": f"tool_{i}",
+            "description": "查询数据并返回结构化结果。" * 10,
+            "parameters": {
+                "type": "object",
+                "properties": {f"arg_{j}": {"type": "string", "description": "参数说明" * 5} for j in range(10)},
+            },
+        },
+    } for i in range(tool_count)]
+    request_data = {
+        "model": "benchmark-model",
+        "messages": [{"role": "user", "content": "请调用合适的工具。" * 50}],
+        "tools": tools,
+    }
+    tool_calls = [Obj(id=f"call_{i}", type="function",
+                      function=Obj(name=f"tool_{i}", arguments=json.dumps({"arg_0": "x" * 200})))
+                  for i in range(tool_count)]
+    response = Obj(
+        id="chatcmpl-bench", object="chat.completion", created=0, model="benchmark-model",
+        system_fingerprint=None,
+        choices=[Obj(index=0, finish_reason="tool_calls",
+                     message=Obj(role="assistant", content="好的" * 100, tool_calls=tool_calls, function_call=None))],
+        usage=Obj(prompt_tokens=1000, completion_tokens=500, total_tokens=1500,
+                  prompt_tokens_details=None, completion_tokens_details=None),
+    )
+    return request_data, response
+
+
+def legacy_prints(request_data, litellm_params, response, response_dict):
+    """旧版 make_api_request 中每次请求都会同步执行的打印"""
+    print(f"发送完整请求到LiteLLM: {json.dumps(request_data, indent=2, ensure_ascii=False)}", file=DEVNULL)
+    params = {k: v for k, v in litellm_params.items() if k != 'api_key'}
+    print(f"LiteLLM请求参数: {json.dumps(params, indent=2, ensure_ascii=False, default=str)}", file=DEVNULL)
+    print(f"LiteLLM响应类型: {type(response)}", file=DEVNULL)
+    print(f"LiteLLM响应对象属性: {[attr for attr in dir(response) if not attr.startswith('_')]}", file=DEVNULL)
+    print(f"最终提取的响应字典: {json.dumps(response_dict, indent=2, ensure_ascii=False, default=str)}",
+          file=DEVNULL)
+
+
+async def measure(request_data, response, count: int, legacy: bool) -> float:
+    """返回每次请求的平均本地耗时（微秒）"""
+    async def fake_acompletion(**kwargs):
+        return response
+
+    litellm.acompletion = fake_acompletion
+    transport = LiteLLMTransport(os.environ["API_URL"], os.environ["API_KEY"], "benchmark-model")
+    start = time.perf_counter()
+    for _ in range(count):
+        response_dict, _ = await transport.complete(request_data)
+        if legacy:
+            legacy_prints(request_data, transport.build_params(request_data), response, response_dict)
+    return (time.perf_counter() - start) / count * 1e6
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="测量请求路径上的日志开销")
+    parser.add_argument("--requests", type=int, default=2000, help="每种配置的请求次数")
+    parser.add_argument("--tools", type=int, default=20, help="请求中的工具数量（决定负载大小）")
+    parser.add_argument("--json", action="store_true", help="以JSON输出结果")
+    args = parser.parse_args()
+
+    request_data, response = build_payload(args.tools)
+    configs = [
+        ("legacy-print", "INFO", False, True),
+        ("info", "INFO", False, False),
+        ("debug+payloads", "DEBUG", True, False),
+    ]
+
+    results = {}
+    for name, level, payloads, legacy in configs:
+        setup_logging(level, log_payloads=payloads)
+        await measure(request_data, response, min(100, args.requests), legacy)  # 预热
+        results[name] = round(await measure(request_data, response, args.requests, legacy), 1)
+
+    payload_bytes = len(json.dumps(request_data, ensure_ascii=False).encode("utf-8"))
+    if args.json:
+        print(json.dumps({"requests": args.requests, "payload_bytes": payload_bytes,
+                          "us_per_request": results}, ensure_ascii=False))
+        return
+
+    print(f"请求体大小: {payload_bytes} 字节，每种配置 {args.requests} 次请求")
+    for name, value in results.items():
+        print(f"{name:<16} {value:>10.1f} µs/请求")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+响应规范化基准测试
+测量 normalize_response + extract_message + build_summary 每条响应的耗时。
+默认使用内置的纯文本/工具调用样例；--responses 可指定记录下来的响应（JSONL，每行一个 chat.completion），
+读入后转换为对象以模拟LiteLLM的响应模型
+
+用法: python benchmarks/bench_normalize.py [--responses recorded.jsonl] [--iterations 20000] [--json]
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from normalize import normalize_response, extract_message, build_summary, parse_arguments  # noqa: E402
+
+
+def to_object(value: Any) -> Any:
+    """将JSON结构转换为属性访问的对象"""
+    if isinstance(value, dict):
+        return SimpleNamespace(**{key: to_object(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return [to_object(item) for item in value]
+    return value
+
+
+def sample_responses() -> List[dict]:
+    usage = {"prompt_tokens": 1200, "completion_tokens": 300, "total_tokens": 1500,
+             "prompt_tokens_details": {"cached_tokens": 1024}, "completion_tokens_details": None}
+    text = {
+        "id": "chatcmpl-text", "object": "chat.completion", "created": 0, "model": "bench",
+        "system_fingerprint": None, "usage": usage,
+        "choices": [{"index": 0, "finish_reason": "stop",
+                     "message": {"role": "assistant", "content": "这是一个回答。" * 200,
+                                 "tool_calls": None, "function_call": None}}],
+    }
+    tool = {
+        "id": "chatcmpl-tool", "object": "chat.completion", "created": 0, "model": "bench",
+        "system_fingerprint": None, "usage": usage,
+        "choices": [{"index": 0, "finish_reason": "tool_calls",
+                     "message": {"role": "assistant", "content": None, "function_call": None,
+                                 "tool_calls": [
+                                     {"id": f"call_{i}", "type": "function",
+                                      "function": {"name": f"tool_{i}",
+                                                   "arguments": json.dumps({"query": "天气" * 20, "limit": i})}}
+                                     for i in range(5)]}}],
+    }
+    return [text, tool]
+
+
+def run(responses: List[Any], iterations: int) -> float:
+    """返回每条响应的平均耗时（微秒）"""
+    start = time.perf_counter()
+    for i in range(iterations):
+        response_dict = normalize_response(responses[i % len(responses)])
+        content, tool_calls = extract_message(response_dict)
+        build_summary(content, tool_calls)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="测量响应规范化的耗时")
+    parser.add_argument("--responses", help="记录的响应文件（JSONL）")
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--json", action="store_true", help="以JSON输出结果")
+    args = parser.parse_args()
+
+    if args.responses:
+        with open(args.responses, encoding="utf-8") as f:
+            raw = [json.loads(line) for line in f if line.strip()]
+    else:
+        raw = sample_responses()
+    responses = [to_object(item) for item in raw]
+
+    parse_arguments.cache_clear()
+    cold = run(responses, len(responses))
+    warm = run(responses, args.iterations)
+    result = {
+        "responses": len(responses),
+        "iterations": args.iterations,
+        "first_pass_us": round(cold, 2),
+        "us_per_response": round(warm, 2),
+        "argument_cache": parse_arguments.cache_info()._asdict(),
+    }
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False))
+        return
+    print(f"{len(responses)} 条响应，{args.iterations} 次迭代")
+    print(f"首轮（参数未缓存）: {cold:.2f} µs/条")
+    print(f"稳定状态: {warm:.2f} µs/条")
+    print(f"参数缓存: {result['argument_cache']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试工具自身开销基准测试
+以零延迟的本地模拟服务（mock_server.py）为后端，端到端驱动 app.py，输出机器可读的JSON：
+
+- stages：每个请求在本地各阶段的耗时（µs）——请求构建、响应规范化、结果记录构建、/results 序列化
+- sustained：开环到达率逐级提升（经 POST /load），吞吐仍能跟上且排队延迟可忽略的最大请求/秒
+- event_loop_lag：压测期间事件循环的调度延迟（ms）
+- rss：每写入1万条结果的常驻内存增长（MB）
+
+用法: python benchmarks/bench_overhead.py [--rates 50,100,200,400,800] [--step-duration 3] [--output result.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.chdir(ROOT)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def rss_mb() -> float:
+    """当前常驻内存（MB）；无 /proc 时退回峰值RSS"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))]
+
+
+def per_call_us(func, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return round((time.perf_counter() - start) / iterations * 1e6, 2)
+
+
+def start_mock(port: int) -> subprocess.Popen:
+    """在子进程中启动零延迟的模拟服务，避免与被测进程争用CPU"""
+    process = subprocess.Popen(
+        [sys.executable, "mock_server.py", "--port", str(port), "--latency", "0", "--tps", "0",
+         "--completion-tokens", "20"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("模拟服务启动超时")
+
+
+class LoopLagMonitor:
+    """每隔 interval 秒醒来一次，记录实际醒来时间比预期晚了多少"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, time.perf_counter() - expected) * 1000)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "samples": len(self.samples),
+            "p50_ms": round(percentile(self.samples, 50) or 0, 3),
+            "p99_ms": round(percentile(self.samples, 99) or 0, 3),
+            "max_ms": round(max(self.samples, default=0), 3),
+        }
+
+
+async def bench_stages(app, iterations: int) -> Dict[str, Any]:
+    """不经网络，测量单个请求在本地各阶段的耗时"""
+    from mock_server import reply_text
+    from normalize import normalize_response, extract_message
+    from transport import Transport
+
+    raw = {
+        "id": "chatcmpl-bench", "object": "chat.completion", "created": 0, "model": "mock",
+        "choices": [{"index": 0, "finish_reason": "stop",
+                     "message": {"role": "assistant", "content": reply_text(20)}}],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 20, "total_tokens": 30},
+    }
+
+    class CannedTransport(Transport):
+        """直接返回固定响应的传输层，只保留规范化开销"""
+        name = "canned"
+
+        async def complete(self, request_data):
+            return normalize_response(raw), {}
+
+    app.transports["canned"] = CannedTransport()
+    test_req = app.TestRequest(prompt="你好", model="mock", transport="canned")
+
+    stages = {
+        "build_request_us": per_call_us(lambda: app.build_request_data(test_req), iterations),
+        "normalize_us": per_call_us(lambda: extract_message(normalize_response(raw)), iterations),
+    }
+
+    start = time.perf_counter()
+    batch_start = time.perf_counter()
+    records = [await app.execute_single_request(test_req, i + 1, batch_start) for i in range(iterations)]
+    stages["execute_request_us"] = round((time.perf_counter() - start) / iterations * 1e6, 2)
+
+    session_id = "bench-serialize"
+    await app.ensure_session(session_id)
+    for record in records:
+        app.append_result(session_id, record)
+    start = time.perf_counter()
+    response = await app.get_results(session_id)
+    json.dumps(app.jsonable_encoder(response), ensure_ascii=False)
+    stages["results_serialize_us_per_result"] = round((time.perf_counter() - start) / iterations * 1e6, 2)
+    await app.result_store.delete_session(session_id)
+    return stages
+
+
+async def bench_sustained(app, client, rates: List[float], step_duration: float, max_queue_delay: float,
+                          warmup: float, queue_intervals: float) -> Dict[str, Any]:
+    """逐级提升开环到达率，找出吞吐跟得上且排队延迟可忽略的最大到达率
+
+    每级开头 warmup 秒内计划发送的请求不计入排队延迟（连接建立、首次调度等一次性停顿）；
+    p99 排队延迟的阈值取 max_queue_delay 与 queue_intervals 个到达间隔中的较大者，低到达率时不因单次调度停顿判为不可持续。
+    没有任何一级可持续时 max_sustained_rps 为 None，failed_step 给出首个未通过的级别及原因
+    """
+    monitor = LoopLagMonitor()
+    monitor.start()
+    steps = []
+    sustained: Optional[float] = None
+    failed_step: Optional[Dict[str, Any]] = None
+    try:
+        for rate in rates:
+            response = await client.post("/load", json={
+                "prompt": "你好", "model": "mock", "rate": rate, "duration": step_duration,
+                "max_in_flight": app.HTTP_MAX_CONNECTIONS, "transport": "httpx", "keep_full_bodies": 0,
+            })
+            response.raise_for_status()
+            job_id, session_id = response.json()["job_id"], response.json()["session_id"]
+            while True:
+                job = (await client.get(f"/jobs/{job_id}")).json()
+                if job["status"] not in ("queued", "running"):
+                    break
+                await asyncio.sleep(0.1)
+
+            results = (await client.get(f"/results/{session_id}")).json()
+            delays = [r.get("queue_delay") or 0.0 for r in results["results"]
+                      if (r.get("intended_offset") or 0.0) >= warmup]
+            elapsed = max((r["end_offset"] for r in results["results"]), default=step_duration)
+            achieved = results["success_count"] / elapsed if elapsed > 0 else 0.0
+            p99_delay = percentile(delays, 99) or 0.0
+            threshold = max(max_queue_delay, queue_intervals / rate)
+            reasons = []
+            if job["status"] != "done":
+                reasons.append(f"任务状态为 {job['status']}")
+            if results["error_count"]:
+                reasons.append(f"{results['error_count']} 个请求失败")
+            if achieved < rate * 0.95:
+                reasons.append(f"吞吐 {achieved:.2f} 请求/秒低于目标的95%")
+            if p99_delay > threshold:
+                reasons.append(f"p99 排队延迟 {p99_delay:.4f} 秒超过阈值 {threshold:.4f} 秒")
+            step = {
+                "rate": rate,
+                "achieved": round(achieved, 2),
+                "errors": results["error_count"],
+                "queue_delay_p99": round(p99_delay, 4),
+                "queue_delay_threshold": round(threshold, 4),
+                "latency_p99": results["latency"]["p99"],
+                "sustained": not reasons,
+            }
+            if reasons:
+                step["reasons"] = reasons
+            steps.append(step)
+            await client.delete(f"/results/{session_id}")
+            if reasons:
+                failed_step = step
+                break
+            sustained = rate
+    finally:
+        await monitor.stop()
+    return {"max_sustained_rps": sustained, "failed_step": failed_step, "steps": steps,
+            "event_loop_lag": monitor.summary()}
+
+
+async def bench_rss(app, count: int) -> Dict[str, Any]:
+    """写入 count 条结果（保留策略默认值），换算为每1万条结果的RSS增长"""
+    test_req = app.TestRequest(prompt="你好", model="mock", transport="canned")
+    session_id = "bench-rss"
+    await app.ensure_session(session_id)
+    batch_start = time.perf_counter()
+    before = rss_mb()
+    for i in range(count):
+        app.append_result(session_id, await app.execute_single_request(test_req, i + 1, batch_start))
+    growth = rss_mb() - before
+    await app.result_store.delete_session(session_id)
+    return {"results": count, "rss_growth_mb_per_10k": round(growth / count * 10000, 2)}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="测试工具自身开销基准测试")
+    parser.add_argument("--rates", default="50,100,200,400,800", help="逐级尝试的到达率（请求/秒）")
+    parser.add_argument("--step-duration", type=float, default=3.0, help="每个到达率持续的秒数")
+    parser.add_argument("--max-queue-delay", type=float, default=0.05, help="判定可持续的 p99 排队延迟上限（秒）")
+    parser.add_argument("--queue-intervals", type=float, default=5.0,
+                        help="排队延迟上限至少为该数量的到达间隔（1/到达率）")
+    parser.add_argument("--warmup", type=float, default=0.2, help="每级开头不计入排队延迟的秒数")
+    parser.add_argument("--iterations", type=int, default=2000, help="阶段耗时测量的次数")
+    parser.add_argument("--rss-results", type=int, default=10000, help="测量内存增长时写入的结果数")
+    parser.add_argument("--store", default="memory", choices=("memory", "sqlite"), help="结果存储后端")
+    parser.add_argument("--output", help="结果写入文件（默认输出到标准输出）")
+    args = parser.parse_args()
+
+    port = free_port()
+    mock = start_mock(port)
+    db_path = ROOT / "data" / f"bench-{port}.db"
+    os.environ.update({
+        "API_URL": f"http://127.0.0.1:{port}/v1",
+        "API_KEY": "benchmark",
+        "RESULT_STORE": args.store,
+        "RESULT_DB_PATH": str(db_path),
+        "LOG_LEVEL": "ERROR",
+    })
+
+    import httpx
+    import app
+
+    await app.open_result_store()
+    try:
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app.app), base_url="http://tester")
+        report = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "store": args.store,
+            "stages": await bench_stages(app, args.iterations),
+            **await bench_sustained(app, client, [float(r) for r in args.rates.split(",")],
+                                    args.step_duration, args.max_queue_delay, args.warmup,
+                                    args.queue_intervals),
+            "rss": await bench_rss(app, args.rss_results),
+        }
+        await client.aclose()
+    finally:
+        await app.close_result_store()
+        mock.terminate()
+        mock.wait()
+        for suffix in ("", "-wal", "-shm"):
+            Path(f"{db_path}{suffix}").unlink(missing_ok=True)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n", encoding="utf-8")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
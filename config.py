@@ -31,6 +31,11 @@ HOST = os.getenv("HOST", "0.0.0.0")
 PORT = int(os.getenv("PORT", 8005))
 DEBUG = os.getenv("DEBUG", "true").lower() == "true"
 
+# 日志配置
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")  # DEBUG / INFO / WARNING / ERROR
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # text 或 json
+LOG_PAYLOADS = os.getenv("LOG_PAYLOADS", "false").lower() == "true"  # 仅在 DEBUG 级别下记录完整请求/响应
+
 # =============================================================================
 # 模型配置
 # =============================================================================
@@ -68,4 +73,67 @@ SYSTEM_PROMPT = """你是一个智能助手，能够帮助用户解答问题，
 DEFAULT_TEMPERATURE = 0.7
 DEFAULT_MAX_TOKENS = 2000
 MAX_REQUEST_COUNT = 20
-REQUEST_TIMEOUT = 300  # 5分钟超时
\ No newline at end of file
+MAX_CONCURRENCY = 20  # 单批次最大并发请求数
+MAX_RUNNING_JOBS = 4  # 同时运行的后台任务数，超出的任务排队等待
+MAX_WORKERS = int(os.getenv("MAX_WORKERS", os.cpu_count() or 1))  # 多进程负载生成的最大工作进程数
+MAX_COMPARE_MODELS = 10  # 单次多模型对比最多包含的模型数
+MAX_SWEEP_CELLS = 50  # 单次参数扫描最多展开的单元数
+MAX_SHARED_PREFIX_TOKENS = 32000  # 前缀缓存测量中共享前缀的最大Token数
+STREAM_SNAPSHOT_INTERVAL = 2.0  # 结果推送中汇总快照的间隔（秒）
+STREAM_BATCH_SIZE = 500  # 结果推送每次从存储读取的最大条数
+REQUEST_TIMEOUT = 300  # 单次请求总超时（秒）：从发出到收到完整响应，5分钟
+CONNECT_TIMEOUT = 10  # 建立连接超时（秒）
+FIRST_BYTE_TIMEOUT = 120  # 首字节超时（秒）：等待响应头，流式请求中也是相邻两个数据块的最大间隔
+
+# =============================================================================
+# 传输配置
+# =============================================================================
+TRANSPORT = os.getenv("TRANSPORT", "litellm")  # litellm 或 httpx（共享连接池直接请求 /chat/completions）
+HTTP_MAX_CONNECTIONS = 100  # httpx 连接池最大连接数
+HTTP_MAX_KEEPALIVE = 100  # httpx 连接池保持的空闲长连接数，压测时应与最大连接数一致，避免反复建连
+HTTP2 = os.getenv("HTTP2", "false").lower() == "true"  # 启用 HTTP/2（需要安装 h2）
+
+# =============================================================================
+# 开环压测配置
+# =============================================================================
+MAX_LOAD_RATE = 1000  # 最大目标到达率（请求/秒）
+MAX_LOAD_DURATION = 3600  # 最长压测时间（秒）
+MAX_IN_FLIGHT = 1000  # 最大在途请求数
+MAX_PROFILE_STEPS = 20  # 阶梯负载最大步数
+
+# =============================================================================
+# 客户端限流配置（0 表示不限制，可在每个请求中用 rpm/tpm 覆盖）
+# =============================================================================
+RATE_LIMIT_RPM = int(os.getenv("RATE_LIMIT_RPM", "0"))  # 每个任务每分钟最多发出的请求数
+RATE_LIMIT_TPM = int(os.getenv("RATE_LIMIT_TPM", "0"))  # 每个任务每分钟最多消耗的Token数（提示词+生成）
+ADAPTIVE_LATENCY_TOLERANCE = 2.0  # 自适应并发：平滑延迟超过最低值的多少倍时收缩，0 表示只对 429/超时收缩
+
+# =============================================================================
+# 重试与对冲配置（在每个请求中用 retries/hedge 启用）
+# =============================================================================
+MAX_RETRIES = 5  # 单个请求允许设置的最大重试次数
+RETRY_BASE_DELAY = 0.5  # 首次重试的退避上限（秒），之后每次翻倍并随机抖动
+RETRY_MAX_DELAY = 30.0  # 单次退避的上限（秒）
+RETRY_BUDGET_RATIO = 0.1  # 重试预算：每个任务的重试和对冲副本不超过原始请求数的比例
+RETRY_BUDGET_MIN = 10  # 重试预算的起始额度
+HEDGE_PERCENTILE = 95  # 对冲延迟取已完成请求延迟的分位数
+HEDGE_MIN_SAMPLES = 20  # 积累多少个样本后才开始对冲
+
+# =============================================================================
+# 结果存储配置
+# =============================================================================
+RESULT_STORE = os.getenv("RESULT_STORE", "sqlite")  # sqlite（持久化）或 memory（仅内存）
+RESULT_DB_PATH = os.getenv("RESULT_DB_PATH", "data/results.db")
+RESULT_FLUSH_INTERVAL = 0.2  # 结果批量写入间隔（秒）
+APP_WORKERS = int(os.getenv("APP_WORKERS", "1"))  # uvicorn 工作进程数，大于1时会话和任务状态经 SQLite 共享
+SHARED_POLL_INTERVAL = 0.5  # 多进程运行时SSE轮询其他进程写入结果的间隔（秒）
+DATASET_DIR = os.getenv("DATASET_DIR", "data/datasets")  # 回放数据集目录：上传的数据集和 /replay 指定的本地文件都须在此目录内
+
+# =============================================================================
+# 结果保留配置（0 表示不限制）
+# =============================================================================
+MAX_SESSIONS = 200  # 最多保留的会话数，超出时淘汰最久未访问的会话
+MAX_STORED_BYTES = 512 * 1024 * 1024  # 结果总字节数上限
+SESSION_TTL = 0  # 会话闲置多久后淘汰（秒）
+DEFAULT_KEEP_FULL_BODIES = 20  # 每个会话保留完整响应体的成功结果条数，其余只保留指标
+RETENTION_CHECK_INTERVAL = 30  # 保留策略检查间隔（秒）
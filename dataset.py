@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据集回放
+逐行惰性读取 JSONL 格式的请求记录（不将整个文件载入内存），按记录中的时间戳以原速、N倍速或尽快回放
+"""
+
+import asyncio
+import itertools
+import json
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+from logger import get_logger
+
+logger = get_logger("dataset")
+
+# 每次在线程池中读取的行数，读取文件不阻塞事件循环
+READ_BATCH_LINES = 256
+
+# 包装格式中不属于请求体的字段
+RECORD_META_FIELDS = ("timestamp", "offset", "custom_id", "method", "url")
+
+
+@dataclass
+class DatasetRecord:
+    """数据集中的一行"""
+    line: int  # 源文件行号（从1开始）
+    request: Optional[Dict[str, Any]]  # OpenAI chat.completions 请求体，无法解析时为 None
+    timestamp: Optional[float] = None  # 秒；可以是绝对时间戳或相对偏移，回放时只使用差值
+    error: Optional[str] = None
+
+
+# fire(index, record, intended_offset, run_start)：按时间回放时 intended_offset 为计划发送偏移，否则为 None
+ReplayCallback = Callable[[int, DatasetRecord, Optional[float], float], Awaitable[Any]]
+
+
+def parse_timestamp(value: Any) -> Optional[float]:
+    """解析时间戳：数字（秒）或 ISO 8601 字符串"""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise ValueError(f"无法识别的时间戳: {value!r}")
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    raise ValueError(f"无法识别的时间戳: {value!r}")
+
+
+def parse_line(line_number: int, text: str) -> Optional[DatasetRecord]:
+    """解析一行记录，空行返回 None
+
+    支持三种格式：直接的请求体；{"timestamp": ..., "request": {...}}；
+    OpenAI Batch API 格式 {"custom_id": ..., "body": {...}}。时间戳字段为 timestamp 或 offset
+    """
+    text = text.strip()
+    if not text:
+        return None
+    try:
+        data = json.loads(text)
+        if not isinstance(data, dict):
+            raise ValueError("每行必须是JSON对象")
+        timestamp = parse_timestamp(data.get("timestamp", data.get("offset")))
+        request = data.get("request") or data.get("body")
+        if request is None:
+            request = {key: value for key, value in data.items() if key not in RECORD_META_FIELDS}
+        if not isinstance(request, dict) or not request.get("messages"):
+            raise ValueError("请求缺少 messages")
+        return DatasetRecord(line_number, request, timestamp)
+    except ValueError as e:
+        return DatasetRecord(line_number, None, error=f"第 {line_number} 行无效: {e}")
+
+
+async def iter_dataset(path: Path, limit: Optional[int] = None) -> AsyncIterator[DatasetRecord]:
+    """逐批读取文件并逐行产出记录，内存中最多保留 READ_BATCH_LINES 行"""
+    loop = asyncio.get_running_loop()
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        line_number = 0
+        produced = 0
+        while True:
+            lines = await loop.run_in_executor(None, lambda: list(itertools.islice(f, READ_BATCH_LINES)))
+            if not lines:
+                return
+            for text in lines:
+                line_number += 1
+                record = parse_line(line_number, text)
+                if record is None:
+                    continue
+                yield record
+                produced += 1
+                if limit and produced >= limit:
+                    return
+
+
+async def replay(records: AsyncIterator[DatasetRecord], fire: ReplayCallback,
+                 speed: float = 1.0, max_in_flight: int = 100) -> Dict[str, Any]:
+    """按记录时间戳回放：speed 为倍速（1 原速，N 为 N 倍速），0 表示不等待、尽快发送
+
+    没有时间戳的记录立即发送。在途请求达到上限时暂停读取下一行（背压），
+    内存占用与文件大小无关；等待名额的时间会体现在结果的排队延迟中
+    """
+    slots = asyncio.Semaphore(max_in_flight)
+    pending = set()
+    dispatched = 0
+    first_timestamp: Optional[float] = None
+    max_schedule_lag = 0.0
+
+    async def dispatch(index: int, record: DatasetRecord, offset: Optional[float], run_start: float):
+        try:
+            await fire(index, record, offset, run_start)
+        finally:
+            slots.release()
+
+    run_start = time.perf_counter()
+    try:
+        async for record in records:
+            offset = None
+            if speed > 0 and record.timestamp is not None:
+                if first_timestamp is None:
+                    first_timestamp = record.timestamp
+                # 时间戳乱序的记录不回拨，立即发送
+                offset = max(0.0, (record.timestamp - first_timestamp) / speed)
+                delay = run_start + offset - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    max_schedule_lag = max(max_schedule_lag, -delay)
+            await slots.acquire()
+            dispatched += 1
+            task = asyncio.create_task(dispatch(dispatched, record, offset, run_start))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+
+        if pending:
+            await asyncio.gather(*pending)
+    except asyncio.CancelledError:
+        for task in pending:
+            task.cancel()
+        raise
+
+    return {
+        "dispatched": dispatched,
+        "elapsed": round(time.perf_counter() - run_start, 3),
+        "max_schedule_lag": round(max_schedule_lag, 4),
+    }
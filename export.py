@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+会话结果导出
+分批读取结果并逐块输出 NDJSON、CSV、Parquet 或 Arrow IPC 流，内存中只保留一批结果，占用与会话大小无关。
+CSV/Parquet/Arrow 需要固定的列和类型：未指定列时先扫描一遍结果，得到所有字段（按首次出现的顺序）及其类型。
+Parquet/Arrow 需要安装 pyarrow（可选依赖）
+"""
+
+import csv
+import io
+import json
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+from storage import ResultStore, json_default, project_result
+
+EXPORT_NDJSON = "ndjson"
+EXPORT_CSV = "csv"
+EXPORT_PARQUET = "parquet"
+EXPORT_ARROW = "arrow"
+EXPORT_FORMATS = (EXPORT_NDJSON, EXPORT_CSV, EXPORT_PARQUET, EXPORT_ARROW)
+# 依赖 pyarrow 的格式
+ARROW_FORMATS = (EXPORT_PARQUET, EXPORT_ARROW)
+
+MEDIA_TYPES = {
+    EXPORT_NDJSON: "application/x-ndjson",
+    EXPORT_CSV: "text/csv; charset=utf-8",
+    EXPORT_PARQUET: "application/vnd.apache.parquet",
+    EXPORT_ARROW: "application/vnd.apache.arrow.stream",
+}
+
+# 每次从存储读取的结果数，也是 Parquet 行组和 Arrow 记录批的大小
+EXPORT_BATCH_SIZE = 1000
+
+# 列类型
+TYPE_BOOL = "bool"
+TYPE_INT = "int"
+TYPE_FLOAT = "float"
+TYPE_STRING = "string"
+
+# 每次调用返回一个新的结果批次迭代器，未指定列时需要读取两遍
+BatchSource = Callable[[], AsyncIterator[List[Dict[str, Any]]]]
+
+
+def arrow_available() -> bool:
+    return pa is not None
+
+
+async def iter_batches(store: ResultStore, session_id: str, total: int,
+                       batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[List[Dict[str, Any]]]:
+    """按 position 顺序分批读取会话的前 total 条结果；导出开始后新写入的结果不包含在内，两遍读取的范围一致"""
+    offset = 0
+    while offset < total:
+        batch = await store.get_results(session_id, offset, min(batch_size, total - offset))
+        if not batch:
+            return
+        yield batch
+        offset += len(batch)
+
+
+def _value_kind(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return TYPE_BOOL
+    if isinstance(value, int):
+        return TYPE_INT
+    if isinstance(value, float):
+        return TYPE_FLOAT
+    return TYPE_STRING
+
+
+def _column_type(kinds: set) -> str:
+    """同一列出现过的取值类型合并为一个列类型：整数和浮点数合并为浮点数，其余混合或嵌套的值为字符串"""
+    if kinds == {TYPE_BOOL}:
+        return TYPE_BOOL
+    if kinds == {TYPE_INT}:
+        return TYPE_INT
+    if kinds and kinds <= {TYPE_INT, TYPE_FLOAT}:
+        return TYPE_FLOAT
+    return TYPE_STRING
+
+
+async def scan_columns(batches: AsyncIterator[List[Dict[str, Any]]], columns: Optional[List[str]] = None,
+                       exclude: Iterable[str] = ()) -> Dict[str, str]:
+    """扫描全部结果，返回 列名 -> 列类型；指定 columns 时只推断这些列的类型"""
+    exclude = set(exclude)
+    kinds: Dict[str, set] = {name: set() for name in columns} if columns else {}
+    async for batch in batches:
+        for result in batch:
+            for key, value in result.items():
+                if (columns and key not in kinds) or key in exclude:
+                    continue
+                seen = kinds.setdefault(key, set())
+                kind = _value_kind(value)
+                if kind:
+                    seen.add(kind)
+    return {name: _column_type(seen) for name, seen in kinds.items()}
+
+
+def _cell(value: Any, column_type: str) -> Any:
+    """按列类型转换取值，嵌套的值（工具调用、完整响应等）编码为JSON字符串"""
+    if value is None:
+        return None
+    if column_type == TYPE_STRING:
+        return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=json_default)
+    if column_type == TYPE_FLOAT:
+        return float(value)
+    return value
+
+
+async def export_ndjson(batches: AsyncIterator[List[Dict[str, Any]]], columns: Optional[List[str]] = None,
+                        exclude: Iterable[str] = ()) -> AsyncIterator[bytes]:
+    """每条结果一行JSON，不需要预先确定列，只读取一遍"""
+    async for batch in batches:
+        lines = [json.dumps(project_result(result, columns, exclude), ensure_ascii=False, default=json_default)
+                 for result in batch]
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def _drain(buffer: io.StringIO) -> bytes:
+    data = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return data.encode("utf-8")
+
+
+async def export_csv(batches: AsyncIterator[List[Dict[str, Any]]], types: Dict[str, str]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(types)
+    yield _drain(buffer)
+    async for batch in batches:
+        for result in batch:
+            writer.writerow([_cell(result.get(name), column_type) for name, column_type in types.items()])
+        yield _drain(buffer)
+
+
+class _ChunkSink(io.RawIOBase):
+    """pyarrow 的输出目标：收集写出的字节，每写完一批结果取走一次"""
+
+    def __init__(self):
+        super().__init__()
+        self.chunks: List[bytes] = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+async def export_arrow(batches: AsyncIterator[List[Dict[str, Any]]], types: Dict[str, str],
+                       fmt: str = EXPORT_PARQUET) -> AsyncIterator[bytes]:
+    """每批结果写成一个 Parquet 行组或 Arrow 记录批，写完即输出"""
+    arrow_types = {TYPE_BOOL: pa.bool_(), TYPE_INT: pa.int64(), TYPE_FLOAT: pa.float64(), TYPE_STRING: pa.string()}
+    schema = pa.schema([(name, arrow_types[column_type]) for name, column_type in types.items()])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema) if fmt == EXPORT_PARQUET else pa.ipc.new_stream(sink, schema)
+    try:
+        async for batch in batches:
+            arrays = [[_cell(result.get(name), column_type) for result in batch]
+                      for name, column_type in types.items()]
+            writer.write_batch(pa.record_batch(arrays, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    # 文件尾（Parquet 元数据或 Arrow 流结束标记）
+    yield sink.drain()
+
+
+async def export_results(fmt: str, batches: BatchSource, columns: Optional[List[str]] = None,
+                         exclude: Iterable[str] = ()) -> AsyncIterator[bytes]:
+    """按格式逐块输出导出内容；columns 指定导出的列（优先于 exclude），exclude 为不导出的字段"""
+    if columns:
+        exclude = ()
+    if fmt == EXPORT_NDJSON:
+        async for chunk in export_ndjson(batches(), columns, exclude):
+            yield chunk
+        return
+    types = await scan_columns(batches(), columns, exclude)
+    chunks = export_csv(batches(), types) if fmt == EXPORT_CSV else export_arrow(batches(), types, fmt)
+    async for chunk in chunks:
+        yield chunk
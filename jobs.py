@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+后台任务管理
+将测试批次作为受管理的asyncio任务运行，/test 提交后立即返回；
+任务可随时取消或设置运行时限，取消时在途请求立即中止，已完成的结果保留在会话中
+"""
+
+import asyncio
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from uuid import uuid4
+
+from logger import get_logger
+
+logger = get_logger("jobs")
+
+# 任务状态
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+ACTIVE_STATES = (JOB_QUEUED, JOB_RUNNING)
+
+
+@dataclass
+class Job:
+    """单个后台任务"""
+    job_id: str
+    session_id: str
+    total: int
+    kind: str = "batch"
+    status: str = JOB_QUEUED
+    completed: int = 0
+    error: Optional[str] = None
+    result: Optional[Dict[str, Any]] = None  # 任务级汇总（如阶梯负载报告），运行中可增量更新
+    deadline: Optional[float] = None  # 运行时限（秒），从开始运行起算，超过后取消任务
+    created_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    task: Optional[asyncio.Task] = field(default=None, repr=False)
+
+    @property
+    def is_active(self) -> bool:
+        return self.status in ACTIVE_STATES
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为可序列化的字典"""
+        return {
+            "job_id": self.job_id,
+            "session_id": self.session_id,
+            "kind": self.kind,
+            "status": self.status,
+            "completed": self.completed,
+            "total": self.total,
+            "error": self.error,
+            "result": self.result,
+            "deadline": self.deadline,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobManager:
+    """任务管理器
+
+    同时运行的任务数受 max_running 限制，超出的任务保持 queued 状态等待
+    """
+
+    def __init__(self, max_running: int = 4, notifier: Optional["SessionNotifier"] = None):
+        self.jobs: Dict[str, Job] = {}
+        self.notifier = notifier
+        self._slots = asyncio.Semaphore(max_running)
+
+    def submit(
+        self,
+        session_id: str,
+        total: int,
+        runner: Callable[[Job], Awaitable[Any]],
+        kind: str = "batch",
+        deadline: Optional[float] = None
+    ) -> Job:
+        """提交任务并立即返回
+
+        runner 接收 Job 对象以便更新进度，其返回值（如有）保存为 job.result；
+        deadline 为运行时限（秒），排队等待的时间不计入
+        """
+        job = Job(job_id=str(uuid4()), session_id=session_id, total=total, kind=kind, deadline=deadline)
+        self.jobs[job.job_id] = job
+        job.task = asyncio.create_task(self._run(job, runner))
+        return job
+
+    async def _run(self, job: Job, runner: Callable[[Job], Awaitable[Any]]):
+        timer: Optional[asyncio.TimerHandle] = None
+        try:
+            async with self._slots:
+                job.status = JOB_RUNNING
+                job.started_at = datetime.now().isoformat()
+                if job.deadline:
+                    timer = asyncio.get_running_loop().call_later(job.deadline, self._expire, job)
+                result = await runner(job)
+                if result is not None:
+                    job.result = result
+                job.status = JOB_DONE
+        except asyncio.CancelledError:
+            job.status = JOB_CANCELLED
+        except Exception as e:
+            job.status = JOB_FAILED
+            job.error = str(e)
+            logger.exception("任务 %s 执行失败: %s", job.job_id, e, extra={"session_id": job.session_id})
+        finally:
+            if timer:
+                timer.cancel()
+            job.finished_at = datetime.now().isoformat()
+            # 任务结束时唤醒订阅者，使其及时发送最终状态
+            if self.notifier:
+                self.notifier.notify(job.session_id)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def session_jobs(self, session_id: str) -> List[Job]:
+        """按提交顺序返回会话下的所有任务"""
+        return [job for job in self.jobs.values() if job.session_id == session_id]
+
+    def latest_for_session(self, session_id: str) -> Optional[Job]:
+        jobs = self.session_jobs(session_id)
+        return jobs[-1] if jobs else None
+
+    def _expire(self, job: Job):
+        """任务超过运行时限：记录原因后取消"""
+        if job.is_active and job.task:
+            job.error = f"超过任务运行时限（{job.deadline:g} 秒），已取消"
+            logger.info("任务 %s 超过运行时限，已取消", job.job_id, extra={"session_id": job.session_id})
+            job.task.cancel()
+
+    def cancel(self, job_id: str) -> bool:
+        """取消任务，已结束的任务返回 False"""
+        job = self.jobs.get(job_id)
+        if not job or not job.is_active or not job.task:
+            return False
+        job.task.cancel()
+        return True
+
+    def forget_session(self, session_id: str):
+        """取消并移除会话下的所有任务"""
+        for job in self.session_jobs(session_id):
+            self.cancel(job.job_id)
+            del self.jobs[job.job_id]
+
+
+class SessionNotifier:
+    """会话结果通知
+
+    每次有新结果写入会话时唤醒所有等待者；等待者需在检查数据之前先取得 waiter，避免漏掉通知
+    """
+
+    def __init__(self):
+        self._events: Dict[str, asyncio.Event] = {}
+
+    def waiter(self, session_id: str) -> asyncio.Event:
+        event = self._events.get(session_id)
+        if event is None:
+            event = self._events[session_id] = asyncio.Event()
+        return event
+
+    def notify(self, session_id: str):
+        event = self._events.pop(session_id, None)
+        if event is not None:
+            event.set()
+
+    @staticmethod
+    async def wait(event: asyncio.Event, timeout: float) -> bool:
+        """等待通知，超时返回 False"""
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+负载生成
+开环：按目标到达率（恒定或泊松）定时发出请求，不等待先前请求完成；
+闭环：固定数量的工作协程持续发送；以及阶梯负载所用的并发/到达率阶梯
+"""
+
+import asyncio
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+
+ARRIVAL_CONSTANT = "constant"
+ARRIVAL_POISSON = "poisson"
+ARRIVAL_TYPES = (ARRIVAL_CONSTANT, ARRIVAL_POISSON)
+
+# fire(index, intended_offset, run_start)：intended_offset 为计划发送时间相对 run_start 的偏移（秒）
+FireCallback = Callable[[int, float, float], Awaitable[Any]]
+
+
+class OpenLoopScheduler:
+    """开环调度器
+
+    每个到达时刻都会按计划创建一个发送任务，调度本身从不因请求未完成而阻塞；
+    max_in_flight 只限制同时在途的请求数，超出时请求在本地排队，
+    实际发送时间晚于计划时间的部分即为排队延迟，从而暴露协调遗漏(coordinated omission)
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        duration: float,
+        arrival: str = ARRIVAL_CONSTANT,
+        max_in_flight: int = 100,
+        seed: Optional[int] = None,
+        phase: float = 0.0
+    ):
+        if rate <= 0 or duration <= 0:
+            raise ValueError("rate 和 duration 必须大于 0")
+        if arrival not in ARRIVAL_TYPES:
+            raise ValueError(f"不支持的到达模式: {arrival}")
+        self.rate = rate
+        self.duration = duration
+        self.arrival = arrival
+        self.max_in_flight = max_in_flight
+        # 恒定到达的起始相位（秒）：多个调度器分担同一到达率时错开发送时刻
+        self.phase = phase
+        self._random = random.Random(seed)
+
+    @property
+    def expected_count(self) -> int:
+        """预计发送的请求数"""
+        return max(1, int(self.rate * self.duration))
+
+    def schedule(self) -> Iterator[float]:
+        """生成各请求的计划发送偏移（秒）"""
+        if self.arrival == ARRIVAL_CONSTANT:
+            interval = 1.0 / self.rate
+            index = 0
+            while self.phase + index * interval < self.duration:
+                yield self.phase + index * interval
+                index += 1
+            return
+
+        offset = self._random.expovariate(self.rate)
+        while offset < self.duration:
+            yield offset
+            offset += self._random.expovariate(self.rate)
+
+    async def run(self, fire: FireCallback) -> Dict[str, Any]:
+        """按计划发出所有请求并等待其完成，返回调度统计"""
+        slots = asyncio.Semaphore(self.max_in_flight)
+        pending = set()
+        scheduled = 0
+        max_schedule_lag = 0.0
+
+        async def dispatch(index: int, offset: float, run_start: float):
+            async with slots:
+                await fire(index, offset, run_start)
+
+        run_start = time.perf_counter()
+        try:
+            for offset in self.schedule():
+                delay = run_start + offset - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    # 调度器自身落后于计划（事件循环繁忙）
+                    max_schedule_lag = max(max_schedule_lag, -delay)
+                scheduled += 1
+                task = asyncio.create_task(dispatch(scheduled, offset, run_start))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+
+            if pending:
+                await asyncio.gather(*pending)
+        except asyncio.CancelledError:
+            for task in pending:
+                task.cancel()
+            raise
+
+        return {
+            "scheduled": scheduled,
+            "elapsed": round(time.perf_counter() - run_start, 3),
+            "max_schedule_lag": round(max_schedule_lag, 4),
+        }
+
+
+async def run_closed_loop(fire: FireCallback, concurrency: int, duration: float) -> Dict[str, Any]:
+    """闭环运行：concurrency 个工作协程持续发送请求，直到持续时间结束
+
+    每个协程在上一个请求完成后立即发出下一个，时间到后不再发起新请求，已在途的请求会等待完成
+    """
+    run_start = time.perf_counter()
+    deadline = run_start + duration
+    counter = 0
+
+    async def worker():
+        nonlocal counter
+        while time.perf_counter() < deadline:
+            counter += 1
+            await fire(counter, time.perf_counter() - run_start, run_start)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return {
+        "scheduled": counter,
+        "elapsed": round(time.perf_counter() - run_start, 3),
+    }
+
+
+PROFILE_CONCURRENCY = "concurrency"
+PROFILE_RATE = "rate"
+PROFILE_TYPES = (PROFILE_CONCURRENCY, PROFILE_RATE)
+
+
+def concurrency_levels(max_concurrency: int) -> List[int]:
+    """生成 1, 2, 4, ... 直到 max_concurrency 的并发阶梯"""
+    levels = []
+    level = 1
+    while level < max_concurrency:
+        levels.append(level)
+        level *= 2
+    levels.append(max_concurrency)
+    return levels
+
+
+def rate_ramp(start_rate: float, end_rate: float, steps: int) -> List[float]:
+    """生成从 start_rate 到 end_rate 的线性到达率阶梯"""
+    if steps <= 1:
+        return [end_rate]
+    increment = (end_rate - start_rate) / (steps - 1)
+    return [round(start_rate + increment * i, 3) for i in range(steps)]
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+日志
+分级、结构化的日志输出。请求路径上只把日志记录放入队列，格式化和写出由后台线程完成，不阻塞事件循环
+"""
+
+import atexit
+import json
+import logging
+import queue
+import sys
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+from typing import IO, Any, Dict, Optional
+
+LOGGER_NAME = "tester"
+
+# LogRecord 自带的属性，其余属性视为通过 extra 传入的结构化字段
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+_listener: Optional[QueueListener] = None
+_log_payloads = False
+
+
+def record_fields(record: logging.LogRecord) -> Dict[str, Any]:
+    """取出日志记录中通过 extra 传入的结构化字段"""
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS}
+
+
+class TextFormatter(logging.Formatter):
+    """文本格式：时间 级别 模块 消息 key=value ..."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        fields = record_fields(record)
+        if fields:
+            text += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return text
+
+
+class JsonFormatter(logging.Formatter):
+    """JSON格式：每条日志一行，便于日志系统采集"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **record_fields(record),
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging(level: str = "INFO", fmt: str = "text", log_payloads: bool = False,
+                  stream: Optional[IO[str]] = None):
+    """配置日志：调用方只入队，由 QueueListener 线程负责格式化和输出
+
+    log_payloads 为 True 且级别为 DEBUG 时才记录完整的请求/响应内容；
+    重复调用只更新级别和 log_payloads，输出线程只启动一次
+    """
+    global _listener, _log_payloads
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(level.upper())
+    _log_payloads = log_payloads
+    if _listener is not None:
+        return
+
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    _listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+    logger.addHandler(QueueHandler(log_queue))
+    logger.propagate = False
+
+
+def shutdown_logging():
+    """停止后台线程，输出队列中剩余的日志"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"{LOGGER_NAME}.{name}")
+
+
+def payloads_enabled(logger: logging.Logger) -> bool:
+    """是否记录完整的请求/响应内容（开销较大，仅用于调试）"""
+    return _log_payloads and logger.isEnabledFor(logging.DEBUG)
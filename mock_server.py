@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地模拟的 OpenAI 兼容服务
+用于离线测量测试工具自身的吞吐：延迟分布、按 tokens/s 输出的流式响应、工具调用、429/500 错误注入和 usage 字段均可配置。
+启用 prompt_cache 时模拟前缀缓存：首条系统消息此前出现过即视为命中，usage 中报告 cached_tokens 并缩短首token延迟。
+
+独立运行:  python mock_server.py --port 8010 --latency 0.2 --distribution lognormal --tps 50
+然后将 API_URL 指向 http://127.0.0.1:8010/v1
+
+进程内运行:
+    async with run_mock_server(MockConfig(latency=0.05), port=8010) as url:
+        ...
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from contextlib import asynccontextmanager
+from dataclasses import asdict, dataclass, fields
+from typing import Any, AsyncIterator, Dict, List, Optional
+from uuid import uuid4
+
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+DISTRIBUTIONS = ("fixed", "uniform", "normal", "lognormal", "exponential")
+
+WORDS = ["你好", "，", "这是", "一段", "模拟", "的", "回复", "内容", "。"]
+CITIES = ["北京", "上海", "广州", "深圳", "杭州"]
+
+
+@dataclass
+class MockConfig:
+    """模拟服务配置
+
+    latency 为首token（非流式为完整响应）前的延迟均值（秒），jitter 为分布的离散程度：
+    uniform 取 [latency-jitter, latency+jitter]，normal 的标准差为 jitter，
+    lognormal 的对数标准差为 jitter，exponential 忽略 jitter
+    """
+    latency: float = 0.2
+    distribution: str = "fixed"
+    jitter: float = 0.0
+    tokens_per_second: float = 50.0  # 流式输出速度，0 表示不限速
+    completion_tokens: int = 50  # 每次回复的输出token数（不超过请求的 max_tokens）
+    tool_call_rate: float = 0.5  # 请求携带 tools 时返回工具调用的概率
+    error_429_rate: float = 0.0
+    error_500_rate: float = 0.0
+    prompt_cache: bool = False  # 模拟前缀缓存（修改配置后缓存清空）
+    cache_speedup: float = 0.5  # 全部提示词命中缓存时首token延迟缩短的比例，部分命中按比例缩短
+    seed: Optional[int] = None
+
+
+class MockStats:
+    """模拟服务的请求计数"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.requests = 0
+        self.streamed = 0
+        self.tool_calls = 0
+        self.errors_429 = 0
+        self.errors_500 = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.started_at = time.time()
+
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = time.time() - self.started_at
+        return {
+            "requests": self.requests,
+            "streamed": self.streamed,
+            "tool_calls": self.tool_calls,
+            "errors_429": self.errors_429,
+            "errors_500": self.errors_500,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "elapsed": round(elapsed, 3),
+            "requests_per_second": round(self.requests / elapsed, 2) if elapsed > 0 else 0.0,
+        }
+
+
+class MockModel:
+    """根据配置生成延迟、回复内容和错误"""
+
+    def __init__(self, config: MockConfig):
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.cached_prefixes: set = set()
+
+    def sample_latency(self, cached_ratio: float = 0.0) -> float:
+        """采样首token延迟，cached_ratio 为提示词中命中缓存的比例"""
+        config = self.config
+        if config.distribution == "uniform":
+            value = self.random.uniform(config.latency - config.jitter, config.latency + config.jitter)
+        elif config.distribution == "normal":
+            value = self.random.gauss(config.latency, config.jitter)
+        elif config.distribution == "lognormal":
+            # 使中位数等于 latency
+            value = config.latency * self.random.lognormvariate(0, config.jitter)
+        elif config.distribution == "exponential":
+            value = self.random.expovariate(1 / config.latency) if config.latency > 0 else 0.0
+        else:
+            value = config.latency
+        return max(0.0, value * (1 - config.cache_speedup * cached_ratio))
+
+    def cached_tokens(self, body: Dict[str, Any]) -> int:
+        """首条系统消息此前出现过时，其Token数计为命中缓存"""
+        messages = body.get("messages") or []
+        if not messages or messages[0].get("role") != "system":
+            return 0
+        key = hash(json.dumps(messages[0], ensure_ascii=False, sort_keys=True))
+        if key in self.cached_prefixes:
+            return estimate_prompt_tokens({"messages": messages[:1]})
+        self.cached_prefixes.add(key)
+        return 0
+
+    def sample_error(self) -> Optional[int]:
+        roll = self.random.random()
+        if roll < self.config.error_429_rate:
+            return 429
+        if roll < self.config.error_429_rate + self.config.error_500_rate:
+            return 500
+        return None
+
+    def completion_tokens(self, body: Dict[str, Any]) -> int:
+        max_tokens = body.get("max_tokens") or body.get("max_completion_tokens")
+        tokens = self.config.completion_tokens
+        return max(1, min(tokens, max_tokens)) if max_tokens else max(1, tokens)
+
+    def tool_call(self, body: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        tools = body.get("tools")
+        if not tools or self.random.random() >= self.config.tool_call_rate:
+            return None
+        name = (tools[0].get("function") or {}).get("name") or "get_weather"
+        return {
+            "id": f"call_{uuid4().hex[:12]}",
+            "type": "function",
+            "function": {"name": name, "arguments": json.dumps({"city": self.random.choice(CITIES)},
+                                                               ensure_ascii=False)},
+        }
+
+
+def estimate_prompt_tokens(body: Dict[str, Any]) -> int:
+    """粗略估算输入token数（约4个字符一个token）"""
+    text = json.dumps(body.get("messages") or [], ensure_ascii=False)
+    if body.get("tools"):
+        text += json.dumps(body["tools"], ensure_ascii=False)
+    return max(1, len(text) // 4)
+
+
+def cached_ratio(usage: Dict[str, Any]) -> float:
+    cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+    return min(1.0, cached / usage["prompt_tokens"])
+
+
+def error_response(status: int) -> JSONResponse:
+    if status == 429:
+        return JSONResponse(
+            {"error": {"message": "Rate limit exceeded (mock)", "type": "rate_limit_error", "code": "rate_limit"}},
+            status_code=429, headers={"Retry-After": "1"}
+        )
+    return JSONResponse(
+        {"error": {"message": "Internal server error (mock)", "type": "server_error", "code": "internal_error"}},
+        status_code=500
+    )
+
+
+def create_mock_app(config: Optional[MockConfig] = None) -> FastAPI:
+    """创建模拟服务应用"""
+    app = FastAPI(title="Mock OpenAI Server")
+    app.state.model = MockModel(config or MockConfig())
+    app.state.stats = MockStats()
+
+    @app.post("/v1/chat/completions")
+    @app.post("/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model: MockModel = app.state.model
+        stats: MockStats = app.state.stats
+
+        stats.requests += 1
+        stats.in_flight += 1
+        stats.max_in_flight = max(stats.max_in_flight, stats.in_flight)
+        try:
+            status = model.sample_error()
+            if status == 429:
+                stats.errors_429 += 1
+                return error_response(429)
+            if status == 500:
+                stats.errors_500 += 1
+                return error_response(500)
+
+            completion_id = f"chatcmpl-{uuid4().hex[:16]}"
+            tool_call = model.tool_call(body)
+            if tool_call:
+                stats.tool_calls += 1
+            tokens = model.completion_tokens(body)
+            usage = {
+                "prompt_tokens": estimate_prompt_tokens(body),
+                "completion_tokens": tokens,
+            }
+            usage["total_tokens"] = usage["prompt_tokens"] + tokens
+            if model.config.prompt_cache:
+                usage["prompt_tokens_details"] = {"cached_tokens": model.cached_tokens(body)}
+
+            if body.get("stream"):
+                stats.streamed += 1
+                include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+                # 流式响应在生成器中结束，在途计数由生成器负责
+                return StreamingResponse(
+                    stream_chunks(model, stats, body, completion_id, tool_call, usage, include_usage),
+                    media_type="text/event-stream"
+                )
+
+            await asyncio.sleep(model.sample_latency(cached_ratio(usage)))
+            message: Dict[str, Any] = {"role": "assistant", "content": None if tool_call else reply_text(tokens)}
+            if tool_call:
+                message["tool_calls"] = [tool_call]
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "mock"),
+                "choices": [{
+                    "index": 0,
+                    "message": message,
+                    "finish_reason": "tool_calls" if tool_call else "stop",
+                }],
+                "usage": usage,
+            }
+        finally:
+            stats.in_flight -= 1
+
+    @app.get("/v1/models")
+    async def list_models():
+        return {"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "mock"}]}
+
+    @app.get("/mock/stats")
+    async def get_stats():
+        return app.state.stats.to_dict()
+
+    @app.post("/mock/reset")
+    async def reset_stats():
+        app.state.stats.reset()
+        return app.state.stats.to_dict()
+
+    @app.get("/mock/config")
+    async def get_config():
+        return asdict(app.state.model.config)
+
+    @app.put("/mock/config")
+    async def update_config(updates: Dict[str, Any]):
+        """运行时修改配置，未提供的字段保持不变"""
+        current = asdict(app.state.model.config)
+        unknown = set(updates) - {f.name for f in fields(MockConfig)}
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"未知的配置项: {', '.join(sorted(unknown))}")
+        current.update(updates)
+        if current["distribution"] not in DISTRIBUTIONS:
+            raise HTTPException(status_code=400, detail=f"延迟分布必须是 {', '.join(DISTRIBUTIONS)} 之一")
+        app.state.model = MockModel(MockConfig(**current))
+        return current
+
+    return app
+
+
+def reply_text(tokens: int) -> str:
+    return "".join(WORDS[i % len(WORDS)] for i in range(tokens))
+
+
+def _chunk(completion_id: str, model_name: str, delta: Dict[str, Any],
+           finish_reason: Optional[str] = None) -> str:
+    payload = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model_name,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+async def stream_chunks(
+    model: MockModel,
+    stats: MockStats,
+    body: Dict[str, Any],
+    completion_id: str,
+    tool_call: Optional[Dict[str, Any]],
+    usage: Dict[str, Any],
+    include_usage: bool
+) -> AsyncIterator[str]:
+    """按 tokens_per_second 逐块输出：首块前等待一次延迟，之后每个token一块"""
+    model_name = body.get("model", "mock")
+    interval = 1 / model.config.tokens_per_second if model.config.tokens_per_second > 0 else 0.0
+    try:
+        # 在生成器内计数：客户端在开始迭代前断开时生成器不会运行，计数与 finally 中的减少成对
+        stats.in_flight += 1
+        await asyncio.sleep(model.sample_latency(cached_ratio(usage)))
+        yield _chunk(completion_id, model_name, {"role": "assistant", "content": ""})
+
+        if tool_call:
+            arguments = tool_call["function"]["arguments"]
+            pieces: List[str] = [arguments[i:i + 4] for i in range(0, len(arguments), 4)]
+            yield _chunk(completion_id, model_name, {"tool_calls": [{
+                "index": 0, "id": tool_call["id"], "type": "function",
+                "function": {"name": tool_call["function"]["name"], "arguments": ""},
+            }]})
+            for piece in pieces:
+                if interval:
+                    await asyncio.sleep(interval)
+                yield _chunk(completion_id, model_name,
+                             {"tool_calls": [{"index": 0, "function": {"arguments": piece}}]})
+            finish_reason = "tool_calls"
+        else:
+            for i in range(usage["completion_tokens"]):
+                if i and interval:
+                    await asyncio.sleep(interval)
+                yield _chunk(completion_id, model_name, {"content": WORDS[i % len(WORDS)]})
+            finish_reason = "stop"
+
+        yield _chunk(completion_id, model_name, {}, finish_reason)
+        if include_usage:
+            payload = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                       "model": model_name, "choices": [], "usage": usage}
+            yield f"data: {json.dumps(payload)}\n\n"
+        yield "data: [DONE]\n\n"
+    finally:
+        stats.in_flight -= 1
+
+
+@asynccontextmanager
+async def run_mock_server(config: Optional[MockConfig] = None, host: str = "127.0.0.1",
+                          port: int = 8010) -> AsyncIterator[str]:
+    """在当前事件循环中启动模拟服务，返回可作为 API_URL 的地址，退出时关闭"""
+    server = uvicorn.Server(uvicorn.Config(create_mock_app(config), host=host, port=port,
+                                           log_level="warning", access_log=False))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()  # 启动失败时抛出异常
+        await asyncio.sleep(0.01)
+    try:
+        yield f"http://{host}:{port}/v1"
+    finally:
+        server.should_exit = True
+        await task
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟的 OpenAI 兼容服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--latency", type=float, default=0.2, help="延迟均值（秒）")
+    parser.add_argument("--distribution", choices=DISTRIBUTIONS, default="fixed")
+    parser.add_argument("--jitter", type=float, default=0.0, help="延迟离散程度")
+    parser.add_argument("--tps", type=float, default=50.0, help="流式输出速度（tokens/s），0 不限速")
+    parser.add_argument("--completion-tokens", type=int, default=50)
+    parser.add_argument("--tool-call-rate", type=float, default=0.5)
+    parser.add_argument("--error-429", type=float, default=0.0, help="返回429的概率")
+    parser.add_argument("--error-500", type=float, default=0.0, help="返回500的概率")
+    parser.add_argument("--prompt-cache", action="store_true", help="模拟前缀缓存")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    config = MockConfig(
+        latency=args.latency,
+        distribution=args.distribution,
+        jitter=args.jitter,
+        tokens_per_second=args.tps,
+        completion_tokens=args.completion_tokens,
+        tool_call_rate=args.tool_call_rate,
+        error_429_rate=args.error_429,
+        error_500_rate=args.error_500,
+        prompt_cache=args.prompt_cache,
+        seed=args.seed,
+    )
+    print(f"模拟服务: http://{args.host}:{args.port}/v1")
+    uvicorn.run(create_mock_app(config), host=args.host, port=args.port, log_level="warning", access_log=False)
+
+
+if __name__ == "__main__":
+    main()
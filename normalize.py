@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+响应规范化
+将LiteLLM响应对象一次性转换为可序列化的普通字典，并从中提取结果记录所需的内容和工具调用
+"""
+
+import json
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+_RESPONSE_FIELDS = ("id", "object", "created", "model", "system_fingerprint")
+_USAGE_FIELDS = ("prompt_tokens", "completion_tokens", "total_tokens",
+                 "prompt_tokens_details", "completion_tokens_details", "cache_read_input_tokens")
+_SCALAR_TYPES = (str, int, float, bool, type(None))
+
+# 响应摘要中内容预览的最大长度
+PREVIEW_LENGTH = 200
+
+
+def get_field(obj: Any, key: str, default: Any = None) -> Any:
+    """同时支持字典和对象的字段读取"""
+    if isinstance(obj, dict):
+        return obj.get(key, default)
+    return getattr(obj, key, default)
+
+
+def to_plain(value: Any) -> Any:
+    """将模型对象递归转换为普通的字典/列表"""
+    if isinstance(value, _SCALAR_TYPES):
+        return value
+    if isinstance(value, dict):
+        return {key: to_plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_plain(item) for item in value]
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    if hasattr(value, "__dict__"):
+        return {key: to_plain(item) for key, item in vars(value).items() if not key.startswith("_")}
+    return str(value)
+
+
+def usage_to_dict(usage: Any) -> Dict[str, Any]:
+    """将usage对象转换为字典，缺失的字段不输出"""
+    if not usage:
+        return {}
+    usage_dict = {}
+    for key in _USAGE_FIELDS:
+        value = get_field(usage, key)
+        if value is not None:
+            usage_dict[key] = to_plain(value)
+    return usage_dict
+
+
+def cached_prompt_tokens(usage: Dict[str, Any]) -> Optional[int]:
+    """规范化的 usage 中命中前缀缓存的提示词Token数，后端未报告时返回 None
+
+    OpenAI 兼容接口在 prompt_tokens_details.cached_tokens 中报告，部分经LiteLLM转换的后端只提供 cache_read_input_tokens
+    """
+    details = usage.get("prompt_tokens_details")
+    if isinstance(details, dict) and details.get("cached_tokens") is not None:
+        return details["cached_tokens"]
+    return usage.get("cache_read_input_tokens")
+
+
+def tool_call_to_dict(call: Any) -> Dict[str, Any]:
+    function = get_field(call, "function")
+    return {
+        "id": get_field(call, "id"),
+        "type": get_field(call, "type") or "function",
+        "function": {
+            "name": get_field(function, "name"),
+            "arguments": get_field(function, "arguments"),
+        },
+    }
+
+
+def _message_to_dict(message: Any) -> Dict[str, Any]:
+    tool_calls = get_field(message, "tool_calls")
+    function_call = get_field(message, "function_call")
+    return {
+        "role": get_field(message, "role"),
+        "content": get_field(message, "content"),
+        "tool_calls": [tool_call_to_dict(call) for call in tool_calls] if tool_calls else None,
+        "function_call": to_plain(function_call) if function_call is not None else None,
+    }
+
+
+def normalize_response(response: Any) -> Dict[str, Any]:
+    """单次遍历，将（非流式）响应转换为 OpenAI chat.completion 结构的普通字典
+
+    对于 CustomStreamWrapper，元数据取自包装对象本身，choices/usage 取自其 complete_response
+    （或 response_uptil_now），两者都为空时退回包装对象
+    """
+    body = response
+    if "CustomStreamWrapper" in type(response).__name__:
+        body = (getattr(response, "complete_response", None)
+                or getattr(response, "response_uptil_now", None)
+                or response)
+
+    response_dict: Dict[str, Any] = {}
+    for key in _RESPONSE_FIELDS:
+        value = get_field(response, key)
+        if value is not None:
+            response_dict[key] = value
+
+    response_dict["choices"] = [
+        {
+            "index": get_field(choice, "index"),
+            "finish_reason": get_field(choice, "finish_reason"),
+            "message": _message_to_dict(get_field(choice, "message")),
+        }
+        for choice in get_field(body, "choices") or []
+    ]
+    response_dict["usage"] = usage_to_dict(get_field(body, "usage"))
+    return response_dict
+
+
+@lru_cache(maxsize=1024)
+def parse_arguments(arguments: str) -> Any:
+    """解析工具调用参数，无法解析时原样返回
+
+    批量测试中相同的参数字符串会反复出现，解析结果按字符串缓存；返回值为共享对象，调用方不应修改
+    """
+    try:
+        return json.loads(arguments)
+    except ValueError:
+        return arguments
+
+
+def extract_message(response_dict: Dict[str, Any]) -> Tuple[Optional[str], Optional[List[Dict[str, Any]]]]:
+    """从规范化的响应字典中取出首个choice的内容和工具调用摘要（参数已解析）"""
+    choices = response_dict.get("choices")
+    if not choices or not choices[0].get("message"):
+        return None, None
+
+    message = choices[0]["message"]
+    content = message.get("content", "")
+    tool_calls_info = []
+    for call in message.get("tool_calls") or []:
+        function = call.get("function") or {}
+        tool_info = {}
+        if function.get("name"):
+            tool_info["name"] = function["name"]
+        arguments = function.get("arguments")
+        if arguments:
+            tool_info["arguments"] = parse_arguments(arguments) if isinstance(arguments, str) else arguments
+        if call.get("id"):
+            tool_info["id"] = call["id"]
+        tool_calls_info.append(tool_info)
+    return content, tool_calls_info or None
+
+
+def build_summary(content: Optional[str], tool_calls: Optional[List[Dict[str, Any]]]) -> str:
+    """生成兼容旧版的 response 摘要文本"""
+    parts = []
+    if content and content.strip():
+        preview = content.strip()
+        if len(preview) > PREVIEW_LENGTH:
+            preview = preview[:PREVIEW_LENGTH] + "..."
+        parts.append(f"内容: {preview}")
+    if tool_calls:
+        tool_names = [tc.get("name", "未知工具") for tc in tool_calls]
+        parts.append(f"调用工具: {', '.join(tool_names)}")
+    return " | ".join(parts) if parts else "无响应内容"
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+提示词前缀缓存测量
+生成共享前缀的负载：同一任务的所有请求以相同的长系统提示词开头，最后一条用户消息末尾加入随机后缀，
+请求之间只有前缀相同，响应 usage 中报告的缓存Token数即反映服务端前缀缓存的命中情况
+"""
+
+import random
+from functools import lru_cache
+from typing import Any, Dict
+from uuid import uuid4
+
+# 常见英文单词：大多数分词器中每个单词（连同前导空格）约占1个Token，便于按Token数控制前缀长度
+PREFIX_WORDS = (
+    "the", "of", "and", "to", "in", "is", "that", "for", "it", "as", "was", "with", "be", "by", "on",
+    "not", "he", "this", "are", "or", "his", "from", "at", "which", "but", "have", "an", "had", "they",
+    "you", "were", "their", "one", "all", "we", "can", "her", "has", "there", "been", "if", "more",
+    "when", "will", "would", "who", "so", "no", "time", "people", "year", "way", "day", "man", "thing",
+    "world", "life", "hand", "part", "child", "eye", "place", "work", "week", "case", "point", "number",
+    "group", "problem", "fact", "water", "system", "program", "question", "home", "state", "city", "name",
+)
+
+
+@lru_cache(maxsize=16)
+def shared_prefix(tokens: int, seed: int = 0) -> str:
+    """约 tokens 个Token的固定文本，参数相同时总是生成相同的文本；更换 seed 即得到未被缓存过的前缀"""
+    rng = random.Random(seed)
+    words = " ".join(rng.choice(PREFIX_WORDS) for _ in range(tokens))
+    return f"Reference document {seed}: {words}"
+
+
+def apply_shared_prefix(request_data: Dict[str, Any], tokens: int, seed: int = 0) -> Dict[str, Any]:
+    """返回加入共享前缀的请求数据（不修改原请求）
+
+    共享前缀作为第一条系统消息插入，原有消息保持不变；最后一条文本用户消息末尾加入随机后缀，
+    使相同的请求不会整条命中缓存
+    """
+    messages = list(request_data.get("messages") or [])
+    for i in range(len(messages) - 1, -1, -1):
+        message = messages[i]
+        if message.get("role") == "user" and isinstance(message.get("content"), str):
+            messages[i] = {**message, "content": f"{message['content']}\n\n(#{uuid4().hex[:12]})"}
+            break
+    messages.insert(0, {"role": "system", "content": shared_prefix(tokens, seed)})
+    return {**request_data, "messages": messages}
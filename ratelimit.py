@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+客户端限流与自适应并发
+令牌桶按每分钟请求数（RPM）和每分钟Token数（TPM）预算放行请求：发送前按请求内容估算Token数预扣，
+完成后按响应 usage 修正；AIMD 控制器在遇到 429、超时或延迟明显上升时收缩并发上限，健康时逐步上调探测
+"""
+
+import asyncio
+import json
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Optional
+
+from logger import get_logger
+from stats import classify_error
+
+logger = get_logger("ratelimit")
+
+# 令牌桶最多积攒的预算（秒），限制空闲之后的突发
+BURST_SECONDS = 1.0
+# 尚无实际用量时估算提示词Token数所用的 字符/Token 比
+CHARS_PER_TOKEN = 3.0
+# 估算比例和平滑延迟的指数平滑系数
+SMOOTHING = 0.2
+# 视为服务端过载、触发并发收缩的错误类型
+OVERLOAD_ERRORS = ("rate_limit", "timeout")
+
+
+def retry_after(exc: Optional[BaseException]) -> float:
+    """从异常携带的响应头中读取 Retry-After（秒），没有时返回 0"""
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    try:
+        return max(0.0, float(headers.get("retry-after", 0))) if headers else 0.0
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class TokenBucket:
+    """令牌桶：每秒补充 per_minute/60 个令牌，最多积攒 BURST_SECONDS 秒的量
+
+    余额允许为负：按估算值预扣后，实际用量更大时差额从后续预算中扣回
+    """
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * BURST_SECONDS)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def delay(self, amount: float, now: float) -> float:
+        """取得 amount 个令牌还需等待的秒数；超过容量的请求在桶满时放行"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return max(0.0, (min(amount, self.capacity) - self.tokens) / self.rate)
+
+    def take(self, amount: float):
+        self.tokens -= amount
+
+    def adjust(self, delta: float):
+        """按实际用量修正余额：delta 为实际值减估算值"""
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+
+class RateLimiter:
+    """RPM/TPM 限流器，等待的请求按先后顺序放行"""
+
+    def __init__(self, rpm: float = 0, tpm: float = 0):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, estimated_tokens: int) -> float:
+        """等待预算并预扣，返回等待的秒数"""
+        start = time.monotonic()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                delay = max(
+                    self.blocked_until - now,
+                    self.requests.delay(1, now) if self.requests else 0.0,
+                    self.tokens.delay(estimated_tokens, now) if self.tokens else 0.0
+                )
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+            if self.requests:
+                self.requests.take(1)
+            if self.tokens:
+                self.tokens.take(estimated_tokens)
+        return time.monotonic() - start
+
+    def correct(self, estimated_tokens: int, actual_tokens: int):
+        if self.tokens:
+            self.tokens.adjust(actual_tokens - estimated_tokens)
+
+    def pause(self, seconds: float):
+        """服务端要求退避时暂停放行"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class AIMDController:
+    """AIMD 自适应并发上限
+
+    慢启动阶段每个成功请求使上限加1（每轮翻倍），首次收缩后每轮（约上限个成功请求）加1；
+    遇到过载错误，或平滑延迟超过最低平滑延迟的 latency_tolerance 倍时，上限乘以 backoff。
+    每次收缩之前发出的请求不再触发收缩，避免同一次拥塞被重复计数
+    """
+
+    def __init__(self, maximum: int, minimum: int = 1, backoff: float = 0.5, latency_tolerance: float = 2.0):
+        self.maximum = maximum
+        self.minimum = min(minimum, maximum)
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.limit = float(self.minimum)
+        self.slow_start = True
+        self.in_flight = 0
+        self.epoch = 0  # 收缩次数
+        self.smoothed: Optional[float] = None
+        self.baseline: Optional[float] = None
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    async def acquire(self) -> int:
+        """等待并发名额，返回当前收缩轮次"""
+        while self.in_flight >= int(self.limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        self.in_flight += 1
+        return self.epoch
+
+    def release(self, epoch: int, success: bool, error_type: Optional[str], latency: float):
+        """归还名额并根据请求结果调整上限"""
+        self.in_flight -= 1
+        if error_type in OVERLOAD_ERRORS:
+            self.decrease(epoch, error_type)
+        elif success:
+            self.smoothed = latency if self.smoothed is None else \
+                self.smoothed + SMOOTHING * (latency - self.smoothed)
+            self.baseline = self.smoothed if self.baseline is None else min(self.baseline, self.smoothed)
+            if self.latency_tolerance and self.smoothed > self.baseline * self.latency_tolerance:
+                self.decrease(epoch, "latency")
+            else:
+                self.limit = min(self.maximum, self.limit + (1.0 if self.slow_start else 1.0 / self.limit))
+        self._wake()
+
+    def decrease(self, epoch: int, reason: str):
+        """收缩并发上限；epoch 早于当前轮次（即收缩之前发出）的请求不再触发收缩"""
+        if epoch != self.epoch:
+            return
+        self.epoch += 1
+        self.slow_start = False
+        self.limit = max(self.minimum, self.limit * self.backoff)
+        # 收缩后重新积累平滑延迟，不受收缩前排队的请求影响
+        self.smoothed = None
+        logger.info("并发上限收缩为 %d（%s）", int(self.limit), reason)
+
+    def _wake(self):
+        for _ in range(min(len(self._waiters), int(self.limit) - self.in_flight)):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+
+
+@dataclass
+class Permit:
+    """一次放行：记录预扣的Token估算值，完成后据此修正"""
+    estimated_tokens: int  # 单次发送的估算值
+    prompt_chars: int
+    epoch: int
+    wait: float
+    sends: int = 1  # 重试和对冲副本各占一次预算
+
+
+class Throttle:
+    """一个任务的请求闸门：RPM/TPM 限流和可选的自适应并发
+
+    stats 在每次请求完成后原地更新，可直接放入任务结果供运行中查看
+    """
+
+    def __init__(self, rpm: float = 0, tpm: float = 0, max_concurrency: Optional[int] = None,
+                 latency_tolerance: float = 2.0):
+        self.limiter = RateLimiter(rpm, tpm) if rpm or tpm else None
+        self.controller = AIMDController(max_concurrency, latency_tolerance=latency_tolerance) \
+            if max_concurrency else None
+        # 每字符的提示词Token数和平均生成Token数，随实际用量修正
+        self.tokens_per_char = 1.0 / CHARS_PER_TOKEN
+        self.completion_tokens: Optional[float] = None
+        self.stats: Dict[str, Any] = {
+            "rpm": rpm or None,
+            "tpm": tpm or None,
+            "throttled": 0,
+            "throttle_wait": 0.0,
+            "estimated_tokens": 0,
+            "actual_tokens": 0,
+        }
+        if self.controller:
+            self.stats.update(concurrency_limit=int(self.controller.limit), backoffs=0)
+
+    def estimate_tokens(self, request_data: Dict[str, Any]) -> Permit:
+        """估算请求消耗的Token数：提示词按字符数换算，生成部分取已观测的平均值，尚无观测时取 max_tokens"""
+        prompt_chars = len(json.dumps(
+            [request_data.get("messages"), request_data.get("tools")], ensure_ascii=False, default=str))
+        completion = self.completion_tokens
+        if completion is None:
+            completion = request_data.get("max_tokens") or request_data.get("max_completion_tokens") or 0
+        estimated = int(prompt_chars * self.tokens_per_char + completion) + 1
+        return Permit(estimated, prompt_chars, 0, 0.0)
+
+    async def acquire(self, request_data: Dict[str, Any]) -> Permit:
+        """先等待并发名额，再等待 RPM/TPM 预算"""
+        permit = self.estimate_tokens(request_data)
+        start = time.perf_counter()
+        if self.controller:
+            permit.epoch = await self.controller.acquire()
+        if self.limiter:
+            await self.limiter.acquire(permit.estimated_tokens)
+        permit.wait = time.perf_counter() - start
+        if permit.wait > 0.001:
+            self.stats["throttled"] += 1
+            self.stats["throttle_wait"] = round(self.stats["throttle_wait"] + permit.wait, 3)
+        return permit
+
+    async def reacquire(self, permit: Permit):
+        """重试或对冲再次发送：沿用原有的并发名额，重新占用 RPM/TPM 预算"""
+        permit.sends += 1
+        if self.limiter:
+            wait = await self.limiter.acquire(permit.estimated_tokens)
+            permit.wait += wait
+            self.stats["throttle_wait"] = round(self.stats["throttle_wait"] + wait, 3)
+
+    def note_failure(self, permit: Permit, exc: BaseException):
+        """某次发送失败（之后可能重试）：429 时遵从 Retry-After，过载错误立即反馈给并发控制"""
+        error_type = classify_error(exc)
+        if self.limiter and error_type == "rate_limit":
+            self.limiter.pause(retry_after(exc))
+        if self.controller and error_type in OVERLOAD_ERRORS:
+            self.controller.decrease(permit.epoch, error_type)
+            self.stats["concurrency_limit"] = int(self.controller.limit)
+            self.stats["backoffs"] = self.controller.epoch
+
+    def fields(self, permit: Permit) -> Dict[str, Any]:
+        """写入结果记录的限流字段"""
+        fields = {"throttle_wait": round(permit.wait, 4)}
+        if self.controller:
+            fields["concurrency_limit"] = int(self.controller.limit)
+        return fields
+
+    def release(self, permit: Permit, result: Dict[str, Any], exc: Optional[BaseException] = None):
+        """请求完成：按 usage 修正Token预算，429 时遵从 Retry-After，并反馈给并发控制"""
+        success = result.get("success", False)
+        actual = 0
+        if success:
+            input_tokens = result.get("input_tokens") or 0
+            output_tokens = result.get("output_tokens") or 0
+            actual = result.get("total_tokens") or input_tokens + output_tokens
+            if input_tokens and permit.prompt_chars:
+                self.tokens_per_char += SMOOTHING * (input_tokens / permit.prompt_chars - self.tokens_per_char)
+            self.completion_tokens = output_tokens if self.completion_tokens is None else \
+                self.completion_tokens + SMOOTHING * (output_tokens - self.completion_tokens)
+        estimated = permit.estimated_tokens * permit.sends
+        self.stats["estimated_tokens"] += estimated
+        self.stats["actual_tokens"] += actual
+
+        if self.limiter:
+            # 失败的请求不计入Token用量
+            self.limiter.correct(estimated, actual)
+            if result.get("error_type") == "rate_limit":
+                self.limiter.pause(retry_after(exc))
+        if self.controller:
+            self.controller.release(permit.epoch, success, result.get("error_type"), result.get("duration") or 0.0)
+            self.stats["concurrency_limit"] = int(self.controller.limit)
+            self.stats["backoffs"] = self.controller.epoch
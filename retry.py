@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+重试与对冲请求
+对可重试的错误（429、5xx、超时、连接错误）按指数退避加全抖动重试，并遵从 Retry-After；
+重试预算限制重试占原始请求的比例，避免服务端过载时重试进一步放大负载；
+对冲模式在请求超过历史 p95 延迟仍未返回时发出一个副本，先成功者胜出，用于削减尾延迟
+"""
+
+import asyncio
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from logger import get_logger
+from ratelimit import retry_after
+from stats import LatencyHistogram, classify_error
+
+logger = get_logger("retry")
+
+# 默认重试的错误类型（见 stats.classify_error）
+RETRYABLE_ERRORS = ("rate_limit", "server_error", "timeout", "connection")
+
+# send(attempt)：发送第 attempt 次尝试（从1开始，对冲副本也计为一次尝试）
+SendCallback = Callable[[int], Awaitable[Any]]
+
+
+def backoff_delay(retry: int, base_delay: float, max_delay: float, rng: Optional[random.Random] = None) -> float:
+    """第 retry 次重试（从1开始）前的等待时间：指数退避上限内均匀取值（全抖动），避免重试同步到达"""
+    ceiling = min(max_delay, base_delay * 2 ** (retry - 1))
+    return (rng or random).uniform(0, ceiling)
+
+
+def is_retryable(exc: BaseException, retry_on: Tuple[str, ...] = RETRYABLE_ERRORS) -> bool:
+    return classify_error(exc) in retry_on
+
+
+@dataclass
+class RetryPolicy:
+    """重试策略"""
+    max_retries: int = 0  # 失败后最多重试的次数，不含对冲副本
+    base_delay: float = 0.5  # 首次重试的退避上限（秒），之后每次翻倍
+    max_delay: float = 30.0  # 单次退避的上限（秒）
+    retry_on: Tuple[str, ...] = RETRYABLE_ERRORS
+    hedge: bool = False  # 超过对冲延迟仍未返回时发出副本
+
+
+class RetryBudget:
+    """重试预算：每个原始请求存入 ratio 个额度，每次重试或对冲取出1个
+
+    起始额度为 minimum，保证请求量较少时也能重试；服务端持续过载时重试量被限制在原始请求的 ratio 倍以内
+    """
+
+    def __init__(self, ratio: float = 0.1, minimum: float = 10):
+        self.ratio = ratio
+        self.minimum = minimum
+        self.balance = float(minimum)
+
+    def deposit(self):
+        # 额度不无限积累，长时间健康运行后也不会出现一次性的大量重试
+        self.balance = min(self.balance + self.ratio, self.minimum + self.ratio * 100)
+
+    def withdraw(self) -> bool:
+        if self.balance < 1:
+            return False
+        self.balance -= 1
+        return True
+
+
+class HedgeTimer:
+    """对冲延迟：已完成请求单次尝试延迟的指定分位数，样本不足 min_samples 时不对冲"""
+
+    def __init__(self, percentile: float = 95, min_samples: int = 20):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.histogram = LatencyHistogram()
+
+    def record(self, latency: float):
+        self.histogram.record(latency)
+
+    def delay(self) -> Optional[float]:
+        if self.histogram.count < self.min_samples:
+            return None
+        return self.histogram.percentile(self.percentile)
+
+
+@dataclass
+class AttemptInfo:
+    """一次逻辑请求的尝试记录，写入结果"""
+    attempts: int = 0  # 实际发出的次数（含重试和对冲副本）
+    winner: Optional[int] = None  # 采用其响应的尝试序号，全部失败时为 None
+    hedged: bool = False
+    retry_wait: float = 0.0  # 重试前退避等待的总时间（秒）
+
+    def fields(self) -> Dict[str, Any]:
+        return {
+            "attempts": self.attempts,
+            "winning_attempt": self.winner,
+            "hedged": self.hedged,
+            "retry_wait": round(self.retry_wait, 4),
+        }
+
+
+@dataclass
+class RetryEngine:
+    """一个任务的重试与对冲：策略、预算和对冲延迟在任务内的所有请求间共享
+
+    stats 在运行中原地更新，可直接放入任务结果
+    """
+    policy: RetryPolicy
+    budget: Optional[RetryBudget] = None
+    hedge_timer: Optional[HedgeTimer] = None
+    stats: Dict[str, Any] = field(default_factory=lambda: {
+        "retries": 0,
+        "hedges": 0,
+        "hedge_wins": 0,
+        "recovered": 0,
+        "budget_exhausted": 0,
+    })
+
+    def __post_init__(self):
+        if self.policy.hedge and self.hedge_timer is None:
+            self.hedge_timer = HedgeTimer()
+
+    def _withdraw(self) -> bool:
+        if self.budget is None or self.budget.withdraw():
+            return True
+        self.stats["budget_exhausted"] += 1
+        return False
+
+    async def run(self, send: SendCallback, info: AttemptInfo) -> Any:
+        """发送请求，失败时按策略重试；返回成功尝试的结果，重试用尽时抛出最后一次的异常"""
+        if self.budget:
+            self.budget.deposit()
+        retry = 0
+        while True:
+            try:
+                value = await self._send_hedged(send, info)
+                if retry:
+                    self.stats["recovered"] += 1
+                return value
+            except Exception as e:
+                error = e
+            if retry >= self.policy.max_retries or not is_retryable(error, self.policy.retry_on) \
+                    or not self._withdraw():
+                raise error
+            retry += 1
+            self.stats["retries"] += 1
+            delay = max(backoff_delay(retry, self.policy.base_delay, self.policy.max_delay),
+                        min(retry_after(error), self.policy.max_delay))
+            logger.debug("第 %d 次重试前等待 %.2fs: %s", retry, delay, error)
+            info.retry_wait += delay
+            await asyncio.sleep(delay)
+
+    async def _send_hedged(self, send: SendCallback, info: AttemptInfo) -> Any:
+        """发出一次尝试；启用对冲且超过对冲延迟仍未返回时再发一个副本，先成功者胜出，其余取消"""
+        tasks: Dict[asyncio.Future, Tuple[int, float]] = {}
+
+        def launch() -> int:
+            info.attempts += 1
+            tasks[asyncio.ensure_future(send(info.attempts))] = (info.attempts, time.perf_counter())
+            return info.attempts
+
+        launch()
+        hedge_attempt = None
+        try:
+            delay = self.hedge_timer.delay() if self.policy.hedge else None
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done and self._withdraw():
+                    info.hedged = True
+                    self.stats["hedges"] += 1
+                    hedge_attempt = launch()
+
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in sorted(done, key=lambda t: tasks[t][0]):
+                    if task.exception() is None:
+                        attempt, started = tasks[task]
+                        info.winner = attempt
+                        if self.hedge_timer:
+                            self.hedge_timer.record(time.perf_counter() - started)
+                        if attempt == hedge_attempt:
+                            self.stats["hedge_wins"] += 1
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    # 标记异常已读取，避免未胜出的失败尝试产生警告
+                    task.exception()
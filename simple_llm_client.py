@@ -1,12 +1,17 @@
 """简化的LiteLLM客户端，专门用于request-tester"""
 
-import json
+import asyncio
 import time
-import random
 from typing import Any, Dict, List, Optional
 from dataclasses import dataclass
 import litellm
 
+from retry import backoff_delay, is_retryable
+
+# 重试退避：首次重试等待上限（秒），之后每次翻倍并随机抖动
+RETRY_BASE_DELAY = 5.0
+RETRY_MAX_DELAY = 60.0
+
 
 @dataclass
 class TextPrompt:
@@ -35,16 +40,12 @@ class SimpleLiteLLMClient:
         self.model_name = model_name
         self.max_retries = max_retries
     
-    def generate(
+    def _build_messages(
         self,
         messages: List[List[TextPrompt]],
-        max_tokens: int,
-        temperature: float = 0.7,
-        system_prompt: Optional[str] = None
-    ) -> tuple[List[TextResult], Dict[str, Any]]:
-        """生成响应"""
-        
-        # 转换消息格式
+        system_prompt: Optional[str]
+    ) -> List[Dict[str, Any]]:
+        """转换消息格式"""
         litellm_messages = []
         
         if system_prompt:
@@ -57,31 +58,78 @@ class SimpleLiteLLMClient:
                         "role": "user",
                         "content": message.text
                     })
+        return litellm_messages
+    
+    def _params(self, litellm_messages: List[Dict[str, Any]], max_tokens: int, temperature: float) -> Dict[str, Any]:
+        # 为模型名称添加openai/前缀
+        model_with_prefix = f"openai/{self.model_name}" if not self.model_name.startswith("openai/") else self.model_name
+        return {
+            "api_key": self.api_key,
+            "base_url": self.base_url,
+            "model": model_with_prefix,
+            "messages": litellm_messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "stream": False
+        }
+    
+    def _should_retry(self, retry: int, error: Exception) -> bool:
+        """只重试 429/5xx/超时/连接错误，其余错误立即抛出"""
+        if not is_retryable(error):
+            print(f"LiteLLM请求失败，错误不可重试: {type(error).__name__}")
+            return False
+        if retry == self.max_retries - 1:
+            print(f"LiteLLM请求失败，重试{retry + 1}次后仍然失败")
+            return False
+        print(f"LiteLLM请求失败，正在重试: {retry + 1}/{self.max_retries}")
+        return True
+    
+    def generate(
+        self,
+        messages: List[List[TextPrompt]],
+        max_tokens: int,
+        temperature: float = 0.7,
+        system_prompt: Optional[str] = None
+    ) -> tuple[List[TextResult], Dict[str, Any]]:
+        """生成响应（同步阻塞，不要在事件循环中调用，异步场景使用 agenerate）"""
+        params = self._params(self._build_messages(messages, system_prompt), max_tokens, temperature)
         
-        # 重试机制
+        # 重试机制：指数退避加随机抖动
         response = None
         for retry in range(self.max_retries):
             try:
-                # 为模型名称添加openai/前缀
-                model_with_prefix = f"openai/{self.model_name}" if not self.model_name.startswith("openai/") else self.model_name
-                
-                response = litellm.completion(
-                    api_key=self.api_key,
-                    base_url=self.base_url,
-                    model=model_with_prefix,
-                    messages=litellm_messages,
-                    max_tokens=max_tokens,
-                    temperature=temperature,
-                    stream=False
-                )
+                response = litellm.completion(**params)
                 break
             except Exception as e:
-                if retry == self.max_retries - 1:
-                    print(f"LiteLLM请求失败，重试{retry + 1}次后仍然失败")
+                if not self._should_retry(retry, e):
                     raise e
-                print(f"LiteLLM请求失败，正在重试: {retry + 1}/{self.max_retries}")
-                time.sleep(5 * random.uniform(0.8, 1.2))
+                time.sleep(backoff_delay(retry + 1, RETRY_BASE_DELAY, RETRY_MAX_DELAY))
+        
+        return self._build_results(response)
+    
+    async def agenerate(
+        self,
+        messages: List[List[TextPrompt]],
+        max_tokens: int,
+        temperature: float = 0.7,
+        system_prompt: Optional[str] = None
+    ) -> tuple[List[TextResult], Dict[str, Any]]:
+        """异步生成响应，重试等待不阻塞事件循环"""
+        params = self._params(self._build_messages(messages, system_prompt), max_tokens, temperature)
         
+        response = None
+        for retry in range(self.max_retries):
+            try:
+                response = await litellm.acompletion(**params)
+                break
+            except Exception as e:
+                if not self._should_retry(retry, e):
+                    raise e
+                await asyncio.sleep(backoff_delay(retry + 1, RETRY_BASE_DELAY, RETRY_MAX_DELAY))
+        
+        return self._build_results(response)
+    
+    def _build_results(self, response: Any) -> tuple[List[TextResult], Dict[str, Any]]:
         # 处理响应
         if not response:
             raise Exception("未收到响应")
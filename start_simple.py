@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 import uvicorn
-from app import app
+from config import APP_WORKERS
 
 if __name__ == "__main__":
     print("启动 Request Tester 服务...")
-    uvicorn.run(app, host="0.0.0.0", port=8002, reload=False)
\ No newline at end of file
+    # 多工作进程时 uvicorn 需要以导入路径加载应用
+    uvicorn.run("app:app", host="0.0.0.0", port=8002, reload=False, workers=APP_WORKERS)
\ No newline at end of file
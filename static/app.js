@@ -37,6 +37,8 @@ class LLMTester {
     constructor() {
         this.currentSessionId = null;
         this.isRunning = false;
+        this.eventSource = null;
+        this.streamedCount = 0;
     }
 
     static async create() {
@@ -156,8 +158,8 @@ class LLMTester {
             console.log('API响应结果:', result);
             this.currentSessionId = result.session_id;
             
-            // 开始轮询结果
-            this.pollResults();
+            // 订阅结果推送
+            this.streamResults();
             
         } catch (error) {
             console.error('测试失败:', error);
@@ -174,6 +176,8 @@ class LLMTester {
         const isJsonMode = document.getElementById('jsonMode').checked;
         
         const count = parseInt(document.getElementById('count').value);
+        const concurrency = parseInt(document.getElementById('concurrency').value) || 1;
+        const stream = document.getElementById('streamMode').checked;
         
         if (isSimpleMode) {
             // 简单模式：构建基本请求
@@ -188,7 +192,9 @@ class LLMTester {
                 model,
                 temperature,
                 max_tokens: maxTokens,
-                count
+                count,
+                concurrency,
+                stream
             };
         } else if (isJsonMode) {
             // JSON模式：使用完整的JSON请求
@@ -199,7 +205,9 @@ class LLMTester {
                 return {
                     mode: 'json',
                     request_json: parsedJson,
-                    count
+                    count,
+                    concurrency,
+                    stream
                 };
             } catch (error) {
                 throw new Error('JSON格式错误: ' + error.message);
@@ -207,20 +215,81 @@ class LLMTester {
         }
     }
 
-    async pollResults() {
+    streamResults() {
+        if (!this.currentSessionId) return;
+        
+        // 不支持 EventSource 的浏览器回退到轮询
+        if (!window.EventSource) {
+            this.pollResults();
+            return;
+        }
+        
+        this.closeStream();
+        this.streamedCount = 0;
+        this.updateResults({ results: [] });
+        
+        const sessionId = this.currentSessionId;
+        const source = new EventSource(`/results/${sessionId}/stream?since=0`);
+        this.eventSource = source;
+        
+        // 每条结果到达时追加显示，断线重连由浏览器携带 Last-Event-ID 续传
+        source.addEventListener('result', (e) => {
+            const result = JSON.parse(e.data);
+            this.appendResult(result, this.streamedCount);
+            this.streamedCount = result.position;
+        });
+        
+        source.addEventListener('snapshot', (e) => {
+            const data = JSON.parse(e.data);
+            this.updateProgress(data);
+            this.updateStats(data);
+        });
+        
+        source.addEventListener('end', () => {
+            this.closeStream();
+            this.loadSessions();
+        });
+        
+        source.addEventListener('missing', () => {
+            this.closeStream();
+            this.showError('会话不存在');
+        });
+    }
+
+    closeStream() {
+        if (this.eventSource) {
+            this.eventSource.close();
+            this.eventSource = null;
+        }
+    }
+
+    appendResult(result, index) {
+        const container = document.getElementById('resultsContainer');
+        if (index === 0) {
+            container.innerHTML = '';
+        }
+        container.insertAdjacentHTML('beforeend', this.renderResult(result, index));
+    }
+
+    async pollResults(since = 0) {
         if (!this.currentSessionId) return;
         
         try {
-            const response = await fetch(`/results/${this.currentSessionId}`);
+            // 只获取 since 之后新增的结果，追加显示
+            const response = await fetch(`/results/${this.currentSessionId}?since=${since}`);
             const data = await response.json();
             
             this.updateProgress(data);
             this.updateStats(data);
-            this.updateResults(data);
+            if (since === 0) {
+                this.updateResults(data);
+            } else {
+                data.results.forEach((result, i) => this.appendResult(result, since + i));
+            }
             
-            // 如果测试还在进行中，继续轮询
-            if (data.status === 'running') {
-                setTimeout(() => this.pollResults(), 1000);
+            // 如果任务还在排队或进行中，继续轮询
+            if (data.status === 'queued' || data.status === 'running') {
+                setTimeout(() => this.pollResults(data.next_since), 1000);
             } else {
                 // 测试完成，刷新会话列表
                 this.loadSessions();
@@ -228,7 +297,7 @@ class LLMTester {
             
         } catch (error) {
             console.error('获取结果失败:', error);
-            setTimeout(() => this.pollResults(), 2000); // 出错时延长轮询间隔
+            setTimeout(() => this.pollResults(since), 2000); // 出错时延长轮询间隔
         }
     }
 
@@ -237,10 +306,15 @@ class LLMTester {
         const progressBar = document.getElementById('progressBar');
         const progressText = document.getElementById('progressText');
         
-        if (data.status === 'running') {
+        if (data.status === 'queued') {
             progressContainer.style.display = 'block';
-            const progress = (data.completed / data.total) * 100;
+            progressBar.style.width = '0%';
+            progressText.textContent = '任务排队中...';
+        } else if (data.status === 'running') {
+            progressContainer.style.display = 'block';
+            const progress = data.total ? (data.completed / data.total) * 100 : 0;
             progressBar.style.width = `${progress}%`;
+            document.getElementById('progressPercent').textContent = `${Math.round(progress)}%`;
             progressText.textContent = `已完成 ${data.completed}/${data.total} 个请求`;
         } else {
             progressContainer.style.display = 'none';
@@ -252,19 +326,26 @@ class LLMTester {
         const toolStatsContainer = document.getElementById('toolStatsContainer');
         const toolStatsText = document.getElementById('toolStatsText');
         
-        if (data.results && data.results.length > 0) {
+        // 使用服务端计算的汇总统计
+        if (data.total_count > 0) {
             statsContainer.style.display = 'block';
             
-            const total = data.results.length;
-            const success = data.results.filter(r => r.success === true).length;
-            const error = total - success;
-            const avgDuration = data.results.reduce((sum, r) => sum + (r.duration || 0), 0) / total;
+            const total = data.total_count;
+            const success = data.success_count || 0;
+            const error = data.error_count || 0;
+            const avgDuration = data.avg_duration || 0;
             
             document.getElementById('totalCount').textContent = total;
             document.getElementById('successCount').textContent = success;
             document.getElementById('errorCount').textContent = error;
             document.getElementById('avgDuration').textContent = `${avgDuration.toFixed(2)}s`;
             
+            // 显示延迟分位数
+            const latency = data.latency || {};
+            document.getElementById('latencyPercentiles').textContent = latency.p50 !== undefined && latency.p50 !== null
+                ? `p50 ${latency.p50}s · p99 ${latency.p99}s`
+                : '';
+            
             // 更新工具调用统计
             if (data.tool_call_count !== undefined && data.tool_call_probability !== undefined) {
                 toolStatsContainer.style.display = 'block';
@@ -302,201 +383,214 @@ class LLMTester {
             return;
         }
         
-        const resultsHtml = data.results.map((result, index) => {
-            const statusClass = result.success ? 'success' : 'danger';
-            const statusIcon = result.success ? 'check-circle' : 'x-circle';
-            
-            let contentHtml = '';
-            if (result.success) {
-                // 优先使用新的数据结构
-                let contentText = result.content || '';
-                let toolCallsData = result.tool_calls || null;
+        container.innerHTML = data.results.map((result, index) => this.renderResult(result, index)).join('');
+    }
+
+    renderResult(result, index) {
+        const statusClass = result.success ? 'success' : 'danger';
+        const statusIcon = result.success ? 'check-circle' : 'x-circle';
+        
+        let contentHtml = '';
+        if (result.success) {
+            // 优先使用新的数据结构
+            let contentText = result.content || '';
+            let toolCallsData = result.tool_calls || null;
+            
+            // 如果新数据结构不存在，回退到解析响应摘要
+            if (!contentText && !toolCallsData) {
+                const response = result.response || '无响应内容';
                 
-                // 如果新数据结构不存在，回退到解析响应摘要
-                if (!contentText && !toolCallsData) {
-                    const response = result.response || '无响应内容';
-                    
-                    if (response.includes(' | ')) {
-                        const parts = response.split(' | ');
-                        for (const part of parts) {
-                            if (part.startsWith('内容: ')) {
-                                contentText = part.substring(4);
-                            } else if (part.startsWith('调用工具: ')) {
-                                // 简单解析工具名称
-                                const toolNames = part.substring(5).split(', ');
-                                toolCallsData = toolNames.map(name => ({ name: name.trim() }));
-                            }
+                if (response.includes(' | ')) {
+                    const parts = response.split(' | ');
+                    for (const part of parts) {
+                        if (part.startsWith('内容: ')) {
+                            contentText = part.substring(4);
+                        } else if (part.startsWith('调用工具: ')) {
+                            // 简单解析工具名称
+                            const toolNames = part.substring(5).split(', ');
+                            toolCallsData = toolNames.map(name => ({ name: name.trim() }));
                         }
-                    } else if (response.startsWith('内容: ')) {
-                        contentText = response.substring(4);
-                    } else if (response.startsWith('调用工具: ')) {
-                        const toolNames = response.substring(5).split(', ');
-                        toolCallsData = toolNames.map(name => ({ name: name.trim() }));
-                    } else {
-                        contentText = response;
                     }
+                } else if (response.startsWith('内容: ')) {
+                    contentText = response.substring(4);
+                } else if (response.startsWith('调用工具: ')) {
+                    const toolNames = response.substring(5).split(', ');
+                    toolCallsData = toolNames.map(name => ({ name: name.trim() }));
+                } else {
+                    contentText = response;
                 }
-                
-                // 显示响应内容
-                if (contentText && contentText.trim() && contentText !== '无响应内容') {
-                    contentHtml += `
-                        <div class="mt-2">
-                            <div class="d-flex align-items-center mb-2">
-                                <i class="bi bi-chat-text text-primary me-2"></i>
-                                <strong class="text-primary">响应内容 (Content):</strong>
-                            </div>
-                            <div class="border-start border-primary border-3 ps-3">
-                                <div class="bg-white p-3 rounded border">
-                                    <pre class="mb-0 small text-dark">${this.escapeHtml(contentText.trim())}</pre>
-                                </div>
+            }
+            
+            // 显示响应内容
+            if (contentText && contentText.trim() && contentText !== '无响应内容') {
+                contentHtml += `
+                    <div class="mt-2">
+                        <div class="d-flex align-items-center mb-2">
+                            <i class="bi bi-chat-text text-primary me-2"></i>
+                            <strong class="text-primary">响应内容 (Content):</strong>
+                        </div>
+                        <div class="border-start border-primary border-3 ps-3">
+                            <div class="bg-white p-3 rounded border">
+                                <pre class="mb-0 small text-dark">${this.escapeHtml(contentText.trim())}</pre>
                             </div>
                         </div>
-                    `;
-                }
+                    </div>
+                `;
+            }
+            
+            // 显示工具调用信息
+            if (toolCallsData && Array.isArray(toolCallsData) && toolCallsData.length > 0) {
+                contentHtml += `
+                    <div class="mt-3">
+                        <div class="d-flex align-items-center mb-2">
+                            <i class="bi bi-tools text-warning me-2"></i>
+                            <strong class="text-warning">工具调用 (Tool Calls):</strong>
+                        </div>
+                        <div class="border-start border-warning border-3 ps-3">
+                            <div class="bg-warning bg-opacity-10 p-3 rounded">
+                `;
                 
-                // 显示工具调用信息
-                if (toolCallsData && Array.isArray(toolCallsData) && toolCallsData.length > 0) {
+                toolCallsData.forEach((tool, index) => {
                     contentHtml += `
-                        <div class="mt-3">
-                            <div class="d-flex align-items-center mb-2">
-                                <i class="bi bi-tools text-warning me-2"></i>
-                                <strong class="text-warning">工具调用 (Tool Calls):</strong>
+                        <div class="mb-2 ${index > 0 ? 'mt-2 pt-2 border-top' : ''}">
+                            <div class="d-flex align-items-center mb-1">
+                                <span class="badge bg-warning text-dark me-2">
+                                    <i class="bi bi-gear-fill me-1"></i>
+                                    ${this.escapeHtml(tool.name || '未知工具')}
+                                </span>
+                                ${tool.id ? `<small class="text-muted">ID: ${this.escapeHtml(tool.id)}</small>` : ''}
                             </div>
-                            <div class="border-start border-warning border-3 ps-3">
-                                <div class="bg-warning bg-opacity-10 p-3 rounded">
                     `;
                     
-                    toolCallsData.forEach((tool, index) => {
+                    if (tool.arguments) {
+                        let argsDisplay = '';
+                        if (typeof tool.arguments === 'object') {
+                            argsDisplay = JSON.stringify(tool.arguments, null, 2);
+                        } else {
+                            argsDisplay = tool.arguments;
+                        }
                         contentHtml += `
-                            <div class="mb-2 ${index > 0 ? 'mt-2 pt-2 border-top' : ''}">
-                                <div class="d-flex align-items-center mb-1">
-                                    <span class="badge bg-warning text-dark me-2">
-                                        <i class="bi bi-gear-fill me-1"></i>
-                                        ${this.escapeHtml(tool.name || '未知工具')}
-                                    </span>
-                                    ${tool.id ? `<small class="text-muted">ID: ${this.escapeHtml(tool.id)}</small>` : ''}
-                                </div>
+                            <div class="mt-1">
+                                <small class="text-muted">参数:</small>
+                                <pre class="bg-light p-2 mt-1 small rounded border">${this.escapeHtml(argsDisplay)}</pre>
+                            </div>
                         `;
-                        
-                        if (tool.arguments) {
-                            let argsDisplay = '';
-                            if (typeof tool.arguments === 'object') {
-                                argsDisplay = JSON.stringify(tool.arguments, null, 2);
-                            } else {
-                                argsDisplay = tool.arguments;
-                            }
-                            contentHtml += `
-                                <div class="mt-1">
-                                    <small class="text-muted">参数:</small>
-                                    <pre class="bg-light p-2 mt-1 small rounded border">${this.escapeHtml(argsDisplay)}</pre>
-                                </div>
-                            `;
-                        }
-                        
-                        contentHtml += `</div>`;
-                    });
+                    }
                     
-                    contentHtml += `
-                                </div>
-                            </div>
-                        </div>
-                    `;
-                } else if (typeof toolCallsData === 'string') {
-                    // 处理字符串形式的工具调用信息（向后兼容）
-                    contentHtml += `
-                        <div class="mt-3">
-                            <div class="d-flex align-items-center mb-2">
-                                <i class="bi bi-tools text-warning me-2"></i>
-                                <strong class="text-warning">工具调用 (Tool Calls):</strong>
-                            </div>
-                            <div class="border-start border-warning border-3 ps-3">
-                                <div class="bg-warning bg-opacity-10 p-2 rounded">
-                                    <span class="badge bg-warning text-dark me-1">
-                                        <i class="bi bi-gear-fill me-1"></i>
-                                        ${this.escapeHtml(toolCallsData)}
-                                    </span>
-                                </div>
-                            </div>
-                        </div>
-                    `;
-                }
+                    contentHtml += `</div>`;
+                });
                 
-                // 如果既没有content也没有tool_calls，显示原始响应
-                if ((!contentText || !contentText.trim()) && !toolCallsData) {
-                    const response = result.response || '无响应内容';
-                    contentHtml += `
-                        <div class="mt-2">
-                            <div class="d-flex align-items-center mb-2">
-                                <i class="bi bi-info-circle text-muted me-2"></i>
-                                <strong class="text-muted">响应信息:</strong>
-                            </div>
-                            <div class="border-start border-secondary border-3 ps-3">
-                                <pre class="bg-light p-2 mt-1 small rounded">${this.escapeHtml(response)}</pre>
+                contentHtml += `
                             </div>
                         </div>
-                    `;
-                }
-                
-                // 显示token使用情况
-                if (result.input_tokens || result.output_tokens || result.total_tokens) {
-                    contentHtml += `
-                        <div class="mt-3">
-                            <div class="d-flex align-items-center mb-2">
-                                <i class="bi bi-speedometer2 text-info me-2"></i>
-                                <strong class="text-info">Token使用统计:</strong>
-                            </div>
-                            <div class="d-flex gap-2 flex-wrap">
-                                <span class="badge bg-info">
-                                    <i class="bi bi-arrow-down me-1"></i>
-                                    输入: ${result.input_tokens || 0}
-                                </span>
-                                <span class="badge bg-info">
-                                    <i class="bi bi-arrow-up me-1"></i>
-                                    输出: ${result.output_tokens || 0}
-                                </span>
-                                <span class="badge bg-info">
-                                    <i class="bi bi-calculator me-1"></i>
-                                    总计: ${result.total_tokens || 0}
+                    </div>
+                `;
+            } else if (typeof toolCallsData === 'string') {
+                // 处理字符串形式的工具调用信息（向后兼容）
+                contentHtml += `
+                    <div class="mt-3">
+                        <div class="d-flex align-items-center mb-2">
+                            <i class="bi bi-tools text-warning me-2"></i>
+                            <strong class="text-warning">工具调用 (Tool Calls):</strong>
+                        </div>
+                        <div class="border-start border-warning border-3 ps-3">
+                            <div class="bg-warning bg-opacity-10 p-2 rounded">
+                                <span class="badge bg-warning text-dark me-1">
+                                    <i class="bi bi-gear-fill me-1"></i>
+                                    ${this.escapeHtml(toolCallsData)}
                                 </span>
                             </div>
                         </div>
-                    `;
-                }
-            } else {
-                // 显示错误信息
-                contentHtml = `
+                    </div>
+                `;
+            }
+            
+            // 如果既没有content也没有tool_calls，显示原始响应
+            if ((!contentText || !contentText.trim()) && !toolCallsData) {
+                const response = result.response || '无响应内容';
+                contentHtml += `
                     <div class="mt-2">
                         <div class="d-flex align-items-center mb-2">
-                            <i class="bi bi-exclamation-triangle text-danger me-2"></i>
-                            <strong class="text-danger">错误信息:</strong>
+                            <i class="bi bi-info-circle text-muted me-2"></i>
+                            <strong class="text-muted">响应信息:</strong>
+                        </div>
+                        <div class="border-start border-secondary border-3 ps-3">
+                            <pre class="bg-light p-2 mt-1 small rounded">${this.escapeHtml(response)}</pre>
+                        </div>
+                    </div>
+                `;
+            }
+            
+            // 显示token使用情况
+            if (result.input_tokens || result.output_tokens || result.total_tokens) {
+                contentHtml += `
+                    <div class="mt-3">
+                        <div class="d-flex align-items-center mb-2">
+                            <i class="bi bi-speedometer2 text-info me-2"></i>
+                            <strong class="text-info">Token使用统计:</strong>
                         </div>
-                        <div class="border-start border-danger border-3 ps-3">
-                            <pre class="bg-danger bg-opacity-10 text-danger p-3 mt-1 small rounded">${this.escapeHtml(result.error || '未知错误')}</pre>
+                        <div class="d-flex gap-2 flex-wrap">
+                            <span class="badge bg-info">
+                                <i class="bi bi-arrow-down me-1"></i>
+                                输入: ${result.input_tokens || 0}
+                            </span>
+                            <span class="badge bg-info">
+                                <i class="bi bi-arrow-up me-1"></i>
+                                输出: ${result.output_tokens || 0}
+                            </span>
+                            <span class="badge bg-info">
+                                <i class="bi bi-calculator me-1"></i>
+                                总计: ${result.total_tokens || 0}
+                            </span>
                         </div>
                     </div>
                 `;
             }
             
-            return `
-                <div class="card mb-3">
-                    <div class="card-header d-flex justify-content-between align-items-center">
-                        <span>
-                            <i class="bi bi-${statusIcon} text-${statusClass}"></i>
-                            请求 #${result.index || (index + 1)}
-                        </span>
-                        <small class="text-muted">
-                            ${result.duration ? `${result.duration}s` : ''}
-                            ${result.timestamp ? new Date(result.timestamp).toLocaleTimeString() : ''}
-                        </small>
+            // 显示流式测量指标
+            if (result.stream) {
+                contentHtml += `
+                    <div class="mt-3 d-flex gap-2 flex-wrap">
+                        <span class="badge bg-secondary">TTFT: ${result.ttft !== null ? `${result.ttft}s` : '-'}</span>
+                        <span class="badge bg-secondary">解码: ${result.decode_time !== null ? `${result.decode_time}s` : '-'}</span>
+                        <span class="badge bg-secondary">速度: ${result.tokens_per_second !== null ? `${result.tokens_per_second} tok/s` : '-'}</span>
+                        <span class="badge bg-secondary">平均间隔: ${result.itl_mean !== null ? `${result.itl_mean}ms` : '-'}</span>
                     </div>
-                    <div class="card-body">
-                        ${contentHtml}
+                `;
+            }
+        } else {
+            // 显示错误信息
+            contentHtml = `
+                <div class="mt-2">
+                    <div class="d-flex align-items-center mb-2">
+                        <i class="bi bi-exclamation-triangle text-danger me-2"></i>
+                        <strong class="text-danger">错误信息:</strong>
+                    </div>
+                    <div class="border-start border-danger border-3 ps-3">
+                        <pre class="bg-danger bg-opacity-10 text-danger p-3 mt-1 small rounded">${this.escapeHtml(result.error || '未知错误')}</pre>
                     </div>
                 </div>
             `;
-        }).join('');
+        }
         
-        container.innerHTML = resultsHtml;
+        return `
+            <div class="card mb-3">
+                <div class="card-header d-flex justify-content-between align-items-center">
+                    <span>
+                        <i class="bi bi-${statusIcon} text-${statusClass}"></i>
+                        请求 #${result.index || (index + 1)}
+                    </span>
+                    <small class="text-muted">
+                        ${result.duration ? `${result.duration}s` : ''}
+                        ${result.start_offset !== undefined ? `[+${result.start_offset}s → +${result.end_offset}s]` : ''}
+                        ${result.timestamp ? new Date(result.timestamp).toLocaleTimeString() : ''}
+                    </small>
+                </div>
+                <div class="card-body">
+                    ${contentHtml}
+                </div>
+            </div>
+        `;
     }
 
     async loadSessions() {
@@ -514,8 +608,9 @@ class LLMTester {
             
             const sessionsHtml = sessions.map(session => {
                 const date = new Date(session.timestamp).toLocaleString();
-                const statusClass = session.status === 'completed' ? 'success' : 
-                                  session.status === 'running' ? 'warning' : 'secondary';
+                const statusClass = session.status === 'done' ? 'success' : 
+                                  session.status === 'running' ? 'warning' :
+                                  session.status === 'failed' ? 'danger' : 'secondary';
                 
                 return `
                     <div class="d-flex justify-content-between align-items-center mb-2 p-2 border rounded">
@@ -549,6 +644,7 @@ class LLMTester {
 
     async loadSession(sessionId) {
         try {
+            this.closeStream();
             this.currentSessionId = sessionId;
             const response = await fetch(`/results/${sessionId}`);
             const data = await response.json();
@@ -566,7 +662,7 @@ class LLMTester {
         if (!confirm('确定要删除这个会话吗？')) return;
         
         try {
-            const response = await fetch(`/delete/${sessionId}`, { method: 'DELETE' });
+            const response = await fetch(`/results/${sessionId}`, { method: 'DELETE' });
             
             if (response.ok) {
                 this.loadSessions();
@@ -598,10 +694,10 @@ class LLMTester {
         if (!confirm('确定要清空所有历史会话吗？')) return;
         
         try {
-            const sessions = await fetch('/sessions').then(r => r.json());
+            const { sessions = [] } = await fetch('/sessions').then(r => r.json());
             
             for (const session of sessions) {
-                await fetch(`/delete/${session.session_id}`, { method: 'DELETE' });
+                await fetch(`/results/${session.session_id}`, { method: 'DELETE' });
             }
             
             this.loadSessions();
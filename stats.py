@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试结果统计
+增量延迟直方图、会话级汇总（含前缀缓存效果）、统计窗口和饱和点（拐点）检测
+"""
+
+import asyncio
+import math
+from typing import Any, Dict, List, Optional
+
+
+class LatencyHistogram:
+    """对数分桶的延迟直方图（HDR风格）
+
+    桶宽按固定比例增长，分位数的相对误差不超过 relative_error；
+    记录为 O(1)，查询只遍历非空桶，桶数与记录条数无关
+    """
+
+    def __init__(self, relative_error: float = 0.01, min_value: float = 1e-4):
+        self.relative_error = relative_error
+        self.min_value = min_value
+        self._gamma = (1 + relative_error) / (1 - relative_error)
+        self._log_gamma = math.log(self._gamma)
+        self.buckets: Dict[int, int] = {}
+        self.count = 0
+        self.sum = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def _bucket(self, value: float) -> int:
+        if value <= self.min_value:
+            return 0
+        return math.ceil(math.log(value / self.min_value) / self._log_gamma)
+
+    def record(self, value: float):
+        bucket = self._bucket(value)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other: "LatencyHistogram"):
+        """合并另一个直方图（分桶参数需一致）"""
+        for bucket, count in other.buckets.items():
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+        self.count += other.count
+        self.sum += other.sum
+        if other.count:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """取分位数，p 取值 0-100；返回所在桶的代表值，并截断在实际最小/最大值之间"""
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(p / 100 * self.count))
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                if bucket == 0:
+                    value = self.min_value
+                else:
+                    # 桶 (min*γ^(k-1), min*γ^k] 的代表值，相对误差不超过 relative_error
+                    value = self.min_value * 2 * self._gamma ** bucket / (self._gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.sum / self.count if self.count else None
+
+    def summary(self, digits: int = 4) -> Dict[str, Optional[float]]:
+        def rounded(value: Optional[float]) -> Optional[float]:
+            return round(value, digits) if value is not None else None
+
+        return {
+            "p50": rounded(self.percentile(50)),
+            "p90": rounded(self.percentile(90)),
+            "p95": rounded(self.percentile(95)),
+            "p99": rounded(self.percentile(99)),
+            "max": rounded(self.max),
+            "mean": rounded(self.mean),
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        """导出为可序列化的字典，便于持久化或跨进程合并"""
+        return {
+            "relative_error": self.relative_error,
+            "min_value": self.min_value,
+            "buckets": {str(k): v for k, v in self.buckets.items()},
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min,
+            "max": self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LatencyHistogram":
+        histogram = cls(relative_error=data["relative_error"], min_value=data["min_value"])
+        histogram.buckets = {int(k): v for k, v in data["buckets"].items()}
+        histogram.count = data["count"]
+        histogram.sum = data["sum"]
+        histogram.min = data["min"]
+        histogram.max = data["max"]
+        return histogram
+
+
+# 结果记录的 outcome 字段：超时单独计数，不与其他错误混在一起
+OUTCOME_SUCCESS = "success"
+OUTCOME_ERROR = "error"
+OUTCOME_TIMEOUT = "timeout"
+
+
+def classify_error(exc: BaseException) -> str:
+    """将异常归类为错误类型，用于错误分布统计"""
+    name = type(exc).__name__
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        # httpx.HTTPStatusError 的状态码在 response 上
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    if isinstance(exc, asyncio.TimeoutError) or "Timeout" in name:
+        return "timeout"
+    if status == 429 or "RateLimit" in name:
+        return "rate_limit"
+    if isinstance(status, int) and status >= 500:
+        return "server_error"
+    if status in (401, 403) or "Authentication" in name or "PermissionDenied" in name:
+        return "auth"
+    if isinstance(status, int) and 400 <= status < 500:
+        return "bad_request"
+    if "Connect" in name:
+        return "connection"
+    return "other"
+
+
+class Correlation:
+    """两个变量的皮尔逊相关系数，只保存各阶矩的累加和，可增量更新并跨进程合并"""
+
+    _FIELDS = ("n", "sx", "sy", "sxx", "syy", "sxy")
+
+    def __init__(self):
+        self.n = 0
+        self.sx = self.sy = self.sxx = self.syy = self.sxy = 0.0
+
+    def add(self, x: float, y: float):
+        self.n += 1
+        self.sx += x
+        self.sy += y
+        self.sxx += x * x
+        self.syy += y * y
+        self.sxy += x * y
+
+    def merge(self, other: "Correlation"):
+        for name in self._FIELDS:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    def value(self) -> Optional[float]:
+        """样本不足或任一变量没有变化时返回 None"""
+        if self.n < 2:
+            return None
+        cov = self.sxy - self.sx * self.sy / self.n
+        var_x = self.sxx - self.sx ** 2 / self.n
+        var_y = self.syy - self.sy ** 2 / self.n
+        if var_x <= 1e-12 or var_y <= 1e-12:
+            return None
+        return max(-1.0, min(1.0, cov / math.sqrt(var_x * var_y)))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self._FIELDS}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Correlation":
+        correlation = cls()
+        for name in cls._FIELDS:
+            setattr(correlation, name, data.get(name, 0))
+        return correlation
+
+
+class PromptCacheStats:
+    """前缀缓存效果统计，只计入响应 usage 报告了缓存Token数的成功请求
+
+    cached_tokens 大于0视为命中；命中和未命中的请求分别记录延迟和TTFT分布，
+    并计算单个请求的缓存Token比例与延迟、TTFT的相关系数（缓存生效时应明显为负）
+    """
+
+    _COUNT_FIELDS = ("requests", "hits", "prompt_tokens", "cached_tokens")
+    _HISTOGRAMS = ("latency_hit", "latency_miss", "ttft_hit", "ttft_miss")
+
+    def __init__(self):
+        self.requests = 0
+        self.hits = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.latency_hit = LatencyHistogram()
+        self.latency_miss = LatencyHistogram()
+        self.ttft_hit = LatencyHistogram()
+        self.ttft_miss = LatencyHistogram()
+        self.latency_correlation = Correlation()
+        self.ttft_correlation = Correlation()
+
+    def add(self, prompt_tokens: int, cached_tokens: int, latency: float, ttft: Optional[float] = None):
+        hit = cached_tokens > 0
+        ratio = cached_tokens / prompt_tokens if prompt_tokens else 0.0
+        self.requests += 1
+        self.hits += 1 if hit else 0
+        self.prompt_tokens += prompt_tokens
+        self.cached_tokens += cached_tokens
+        (self.latency_hit if hit else self.latency_miss).record(latency)
+        self.latency_correlation.add(ratio, latency)
+        if ttft is not None:
+            (self.ttft_hit if hit else self.ttft_miss).record(ttft)
+            self.ttft_correlation.add(ratio, ttft)
+
+    def merge(self, other: "PromptCacheStats"):
+        for name in self._COUNT_FIELDS:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        for name in self._HISTOGRAMS:
+            getattr(self, name).merge(getattr(other, name))
+        self.latency_correlation.merge(other.latency_correlation)
+        self.ttft_correlation.merge(other.ttft_correlation)
+
+    def to_dict(self) -> Dict[str, Any]:
+        data: Dict[str, Any] = {name: getattr(self, name) for name in self._COUNT_FIELDS}
+        for name in self._HISTOGRAMS:
+            data[name] = getattr(self, name).to_dict()
+        data["latency_correlation"] = self.latency_correlation.to_dict()
+        data["ttft_correlation"] = self.ttft_correlation.to_dict()
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "PromptCacheStats":
+        stats = cls()
+        for name in cls._COUNT_FIELDS:
+            setattr(stats, name, data.get(name, 0))
+        for name in cls._HISTOGRAMS:
+            if data.get(name):
+                setattr(stats, name, LatencyHistogram.from_dict(data[name]))
+        stats.latency_correlation = Correlation.from_dict(data.get("latency_correlation") or {})
+        stats.ttft_correlation = Correlation.from_dict(data.get("ttft_correlation") or {})
+        return stats
+
+    def summary(self) -> Optional[Dict[str, Any]]:
+        """没有请求报告缓存Token数时返回 None"""
+        if not self.requests:
+            return None
+
+        def histogram(value: LatencyHistogram) -> Optional[Dict[str, Optional[float]]]:
+            return value.summary() if value.count else None
+
+        def rounded(value: Optional[float]) -> Optional[float]:
+            return round(value, 4) if value is not None else None
+
+        return {
+            "requests": self.requests,
+            "hit_requests": self.hits,
+            "hit_rate": round(self.hits / self.requests, 4),
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "cached_token_ratio": round(self.cached_tokens / self.prompt_tokens, 4) if self.prompt_tokens else 0.0,
+            "latency_hit": histogram(self.latency_hit),
+            "latency_miss": histogram(self.latency_miss),
+            "ttft_hit": histogram(self.ttft_hit),
+            "ttft_miss": histogram(self.ttft_miss),
+            "latency_correlation": rounded(self.latency_correlation.value()),
+            "ttft_correlation": rounded(self.ttft_correlation.value()),
+        }
+
+
+class SessionStats:
+    """会话级增量统计
+
+    每写入一条结果调用一次 add()，汇总查询不再扫描结果列表
+    """
+
+    def __init__(self):
+        self.total_count = 0
+        self.success_count = 0
+        self.error_count = 0
+        self.timeout_count = 0  # 失败结果中的超时，包含在 error_count 内
+        self.tool_call_count = 0
+        self.total_tool_calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.duration_sum = 0.0
+        self.tokens_per_second_sum = 0.0
+        self.tokens_per_second_count = 0
+        self.error_types: Dict[str, int] = {}
+        self.last_update: Optional[str] = None
+        self.latency = LatencyHistogram()
+        self.ttft = LatencyHistogram()
+        self.prompt_cache = PromptCacheStats()
+
+    def add(self, result: Dict[str, Any]):
+        self.total_count += 1
+        self.duration_sum += result.get("duration") or 0
+        self.last_update = result.get("timestamp") or self.last_update
+        if not result["success"]:
+            self.error_count += 1
+            if result.get("outcome") == OUTCOME_TIMEOUT:
+                self.timeout_count += 1
+            error_type = result.get("error_type") or "other"
+            self.error_types[error_type] = self.error_types.get(error_type, 0) + 1
+            return
+
+        self.success_count += 1
+        self.latency.record(result["duration"])
+        self.input_tokens += result.get("input_tokens") or 0
+        self.output_tokens += result.get("output_tokens") or 0
+        if result.get("ttft") is not None:
+            self.ttft.record(result["ttft"])
+        if result.get("tokens_per_second") is not None:
+            self.tokens_per_second_sum += result["tokens_per_second"]
+            self.tokens_per_second_count += 1
+        if result.get("cached_tokens") is not None:
+            self.prompt_cache.add(result.get("input_tokens") or 0, result["cached_tokens"],
+                                  result["duration"], result.get("ttft"))
+
+        tool_calls = result.get("tool_calls")
+        if tool_calls:
+            self.tool_call_count += 1
+            self.total_tool_calls += len(tool_calls) if isinstance(tool_calls, list) else 1
+
+    _SCALAR_FIELDS = (
+        "total_count", "success_count", "error_count", "timeout_count", "tool_call_count",
+        "total_tool_calls", "input_tokens", "output_tokens", "duration_sum", "tokens_per_second_sum",
+        "tokens_per_second_count", "last_update",
+    )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """导出为可序列化的字典，便于持久化或跨进程合并"""
+        data = {name: getattr(self, name) for name in self._SCALAR_FIELDS}
+        data["error_types"] = dict(self.error_types)
+        data["latency"] = self.latency.to_dict()
+        data["ttft"] = self.ttft.to_dict()
+        data["prompt_cache"] = self.prompt_cache.to_dict()
+        return data
+
+    def merge(self, other: "SessionStats"):
+        """合并另一份统计（如其他进程回传的统计）"""
+        for name in self._SCALAR_FIELDS:
+            if name != "last_update":
+                setattr(self, name, getattr(self, name) + getattr(other, name))
+        for error_type, count in other.error_types.items():
+            self.error_types[error_type] = self.error_types.get(error_type, 0) + count
+        self.latency.merge(other.latency)
+        self.ttft.merge(other.ttft)
+        self.prompt_cache.merge(other.prompt_cache)
+        if other.last_update and (self.last_update is None or other.last_update > self.last_update):
+            self.last_update = other.last_update
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SessionStats":
+        stats = cls()
+        for name in cls._SCALAR_FIELDS:
+            if name in data:
+                setattr(stats, name, data[name])
+        stats.error_types = dict(data.get("error_types") or {})
+        if data.get("latency"):
+            stats.latency = LatencyHistogram.from_dict(data["latency"])
+        if data.get("ttft"):
+            stats.ttft = LatencyHistogram.from_dict(data["ttft"])
+        if data.get("prompt_cache"):
+            stats.prompt_cache = PromptCacheStats.from_dict(data["prompt_cache"])
+        return stats
+
+    def summary(self) -> Dict[str, Any]:
+        """汇总统计，兼容原有的计数与工具调用字段"""
+        total = self.total_count
+        tool_call_probability = (self.tool_call_count / total * 100) if total > 0 else 0
+        mean_tps = (self.tokens_per_second_sum / self.tokens_per_second_count
+                    if self.tokens_per_second_count else None)
+        return {
+            "total_count": total,
+            "success_count": self.success_count,
+            "error_count": self.error_count,
+            "timeout_count": self.timeout_count,
+            "avg_duration": round(self.duration_sum / total, 4) if total > 0 else 0,
+            "latency": self.latency.summary(),
+            "ttft": self.ttft.summary() if self.ttft.count else None,
+            "mean_tokens_per_second": round(mean_tps, 2) if mean_tps is not None else None,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "error_types": dict(self.error_types),
+            "prompt_cache": self.prompt_cache.summary(),
+            "tool_call_count": self.tool_call_count,
+            "total_tool_calls": self.total_tool_calls,
+            "tool_call_probability": round(tool_call_probability, 1),
+            "last_update": self.last_update,
+        }
+
+
+def summarize_window(stats: SessionStats, elapsed: float) -> Dict[str, Any]:
+    """汇总一个统计窗口：吞吐、错误率和延迟分位数"""
+    total = stats.total_count
+    latency = stats.latency.summary()
+    return {
+        "count": total,
+        "success_count": stats.success_count,
+        "error_count": stats.error_count,
+        "error_rate": round(stats.error_count / total, 4) if total else 0.0,
+        "timeout_count": stats.timeout_count,
+        "elapsed": round(elapsed, 3),
+        "throughput": round(stats.success_count / elapsed, 3) if elapsed > 0 else 0.0,
+        "output_tokens_per_second": round(stats.output_tokens / elapsed, 2) if elapsed > 0 else 0.0,
+        "latency_p50": latency["p50"],
+        "latency_p90": latency["p90"],
+        "latency_p99": latency["p99"],
+        "latency_max": latency["max"],
+    }
+
+
+def summarize_comparison(stats: SessionStats, elapsed: float) -> Dict[str, Any]:
+    """汇总多模型对比矩阵中的一行：在统计窗口汇总的基础上增加平均延迟、Token、TTFT和错误分类"""
+    row = summarize_window(stats, elapsed)
+    ttft = stats.ttft.summary() if stats.ttft.count else None
+    row.update({
+        "latency_mean": stats.latency.summary()["mean"],
+        "input_tokens": stats.input_tokens,
+        "output_tokens": stats.output_tokens,
+        "avg_output_tokens": round(stats.output_tokens / stats.success_count, 1) if stats.success_count else 0,
+        "avg_tokens_per_second": (round(stats.tokens_per_second_sum / stats.tokens_per_second_count, 2)
+                                  if stats.tokens_per_second_count else None),
+        "ttft_p50": ttft["p50"] if ttft else None,
+        "ttft_p99": ttft["p99"] if ttft else None,
+        "error_types": dict(stats.error_types),
+    })
+    return row
+
+
+def detect_knee(
+    steps: List[Dict[str, Any]],
+    p99_threshold: float,
+    error_rate_threshold: float,
+    min_throughput_gain: float = 0.05
+) -> Optional[int]:
+    """检测饱和拐点，返回拐点所在步骤的序号（从0开始），未出现时返回 None
+
+    拐点定义：该步的 p99 延迟或错误率超过阈值，且吞吐相对此前最好成绩的提升不足 min_throughput_gain
+    """
+    best_throughput = 0.0
+    for i, step in enumerate(steps):
+        stats = step["stats"]
+        p99 = stats["latency_p99"]
+        breached = (p99 is not None and p99 > p99_threshold) or stats["error_rate"] > error_rate_threshold
+        stalled = i > 0 and stats["throughput"] < best_throughput * (1 + min_throughput_gain)
+        if breached and stalled:
+            return i
+        best_throughput = max(best_throughput, stats["throughput"])
+    return None
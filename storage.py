@@ -0,0 +1,786 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试结果存储
+提供内存和SQLite两种后端；SQLite后端在独立线程中批量写入，不阻塞事件循环。
+存储按会话数、总字节数和闲置时间淘汰旧会话，超出保留条数的成功结果只保存指标。
+SQLite后端的共享模式供多个 uvicorn 工作进程共用：会话元数据、统计和任务状态都经数据库同步
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from jobs import ACTIVE_STATES, JOB_FAILED
+from logger import get_logger
+from stats import SessionStats
+
+logger = get_logger("storage")
+
+
+def json_default(obj: Any) -> Any:
+    """序列化响应中残留的模型对象"""
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    if hasattr(obj, "dict"):
+        return obj.dict()
+    if hasattr(obj, "__dict__"):
+        return vars(obj)
+    return str(obj)
+
+
+def encode_result(result: Dict[str, Any]) -> str:
+    return json.dumps(result, ensure_ascii=False, default=json_default)
+
+
+# 共享模式下，心跳超过该时间（秒）未更新的运行中任务视为所属进程已退出
+JOB_STALE_AFTER = 30
+# 共享模式下，取得会话写入权后等待提交任务的时间（秒），超时仍没有运行中的任务则释放
+CLAIM_GRACE = 5
+
+# 精简记录中去掉的响应体字段
+BODY_FIELDS = ("content", "full_content", "full_response", "chunk_gaps")
+
+# 建有索引、可用于过滤查询的结果字段
+FILTER_FIELDS = ("success", "model", "error_type")
+
+# 一条结果及其 position
+PositionedResult = Tuple[int, Dict[str, Any]]
+
+
+def project_result(result: Dict[str, Any], fields: Optional[List[str]] = None,
+                   exclude: Iterable[str] = ()) -> Dict[str, Any]:
+    """字段投影：指定 fields 时只保留这些字段（缺失的为 None），否则去掉 exclude 中的字段"""
+    if fields:
+        return {name: result.get(name) for name in fields}
+    if exclude:
+        return {key: value for key, value in result.items() if key not in exclude}
+    return result
+
+
+def matches(result: Dict[str, Any], filters: Dict[str, Any]) -> bool:
+    return all(result.get(field) == value for field, value in filters.items())
+
+
+def compact_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    """精简为仅含指标的记录：去掉响应体，工具调用只保留名称（response 摘要仍保留）"""
+    compact = {key: value for key, value in result.items() if key not in BODY_FIELDS}
+    if result.get("tool_calls"):
+        compact["tool_calls"] = [{"name": call.get("name")} for call in result["tool_calls"]]
+    compact["compact"] = True
+    return compact
+
+
+class ResultStore:
+    """结果存储基类
+
+    会话索引、结果计数和会话统计常驻内存，结果记录本身由具体后端保存。
+    每条结果在会话内有从1开始递增的 position，可作为分页和续传游标；
+    后端按 (会话, FILTER_FIELDS 中的字段, position) 建立索引，过滤查询只读取匹配的结果。
+
+    保留策略：每个会话前 keep_full_bodies 条成功结果保存完整响应，其余成功结果精简为指标记录，
+    失败结果始终完整保存；会话数超过 max_sessions、总字节数超过 max_bytes 或闲置超过 max_age 秒时，
+    由 enforce_retention() 按最近访问时间淘汰（0 表示不限制）
+    """
+
+    # 是否与其他进程共享会话和任务状态
+    shared = False
+
+    def __init__(self, max_sessions: int = 0, max_bytes: int = 0, max_age: float = 0,
+                 keep_full_bodies: Optional[int] = None):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.keep_full_bodies = keep_full_bodies
+        self._stats: Dict[str, SessionStats] = {}
+        self._created: Dict[str, str] = {}
+        self._counts: Dict[str, int] = {}
+        self._sizes: Dict[str, int] = {}
+        self._accessed: Dict[str, float] = {}
+        self._policies: Dict[str, Optional[int]] = {}
+        self._total_bytes = 0
+
+    async def open(self):
+        """启动存储（加载已有会话等）"""
+
+    async def close(self):
+        """关闭存储，确保所有结果已写入"""
+
+    async def flush(self):
+        """将缓冲的数据写入后端"""
+
+    async def sync(self):
+        """共享模式下从后端刷新所有会话的元数据和统计"""
+
+    async def sync_session(self, session_id: str):
+        """共享模式下从后端刷新单个会话的元数据和统计"""
+
+    async def load_jobs(self, session_id: Optional[str] = None,
+                        job_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """共享模式下读取各进程持久化的任务状态（按创建时间排序）"""
+        return []
+
+    async def request_cancel(self, job_id: str) -> bool:
+        """共享模式下请求其他进程取消其任务，由任务所属进程下次写入时执行；不支持时返回 False"""
+        return False
+
+    async def claim_session(self, session_id: str) -> bool:
+        """取得会话的写入权；共享模式下会话正由其他进程写入时返回 False"""
+        return True
+
+    def has_session(self, session_id: str) -> bool:
+        return session_id in self._stats
+
+    def session_ids(self) -> List[str]:
+        """按创建顺序返回所有会话ID"""
+        return sorted(self._stats, key=lambda session_id: self._created.get(session_id) or "")
+
+    def created_at(self, session_id: str) -> Optional[str]:
+        return self._created.get(session_id)
+
+    def stats(self, session_id: str) -> SessionStats:
+        return self._stats[session_id]
+
+    def count(self, session_id: str) -> int:
+        """会话中已写入的结果条数（即最新 position）"""
+        return self._counts.get(session_id, 0)
+
+    def size(self, session_id: str) -> int:
+        """会话结果按JSON编码计算的字节数"""
+        return self._sizes.get(session_id, 0)
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def create_session(self, session_id: str, keep_full_bodies: Optional[int] = None):
+        """创建会话（已存在时只更新保留策略），keep_full_bodies 为空时使用存储的默认值"""
+        if session_id not in self._stats:
+            self._stats[session_id] = SessionStats()
+            self._created[session_id] = datetime.now().isoformat()
+            self._counts[session_id] = 0
+            self._sizes[session_id] = 0
+        if keep_full_bodies is not None:
+            self._policies[session_id] = keep_full_bodies
+        self._accessed[session_id] = time.time()
+
+    def append(self, session_id: str, result: Dict[str, Any]) -> Optional[int]:
+        """写入一条结果并更新会话统计，返回其 position
+
+        会话须已由 create_session() 创建；会话已被删除或淘汰（含被其他进程删除）时丢弃该结果并返回 None，
+        不会以空统计和从1开始的 position 重新创建会话。
+        统计基于完整结果更新，之后再按保留策略决定是否精简
+        """
+        if session_id not in self._stats:
+            logger.info("会话 %s 已不存在，丢弃迟到的结果", session_id, extra={"session_id": session_id})
+            return None
+        self._accessed[session_id] = time.time()
+        position = self._counts[session_id] + 1
+        self._counts[session_id] = position
+        self._stats[session_id].add(result)
+
+        keep = self._policies.get(session_id, self.keep_full_bodies)
+        if result["success"] and keep is not None and position > keep:
+            result = compact_result(result)
+        data = encode_result(result)
+        size = len(data.encode("utf-8"))
+        self._sizes[session_id] += size
+        self._total_bytes += size
+        self._write(session_id, position, result, data)
+        return position
+
+    def _write(self, session_id: str, position: int, result: Dict[str, Any], data: str):
+        raise NotImplementedError
+
+    async def get_results(self, session_id: str, offset: int = 0,
+                          limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """按 position 顺序返回 offset 之后的结果（position > offset），并刷新会话的访问时间"""
+        results, _ = await self.query_results(session_id, offset, limit)
+        return results
+
+    async def query_results(self, session_id: str, since: int = 0, limit: Optional[int] = None,
+                            filters: Optional[Dict[str, Any]] = None) -> Tuple[List[Dict[str, Any]], int]:
+        """按 position 顺序返回 since 之后满足 filters（字段 -> 取值，字段见 FILTER_FIELDS）的结果
+
+        同时返回下次查询的游标：返回满 limit 条时为最后一条的 position，否则为查询时已写入的结果数，
+        不匹配的结果也不会被再次检查，轮询的开销只与新写入的结果数有关
+        """
+        if session_id in self._accessed:
+            self._accessed[session_id] = time.time()
+        # 先取条数再读取：读取时这些结果都已写入后端或在缓冲区中
+        total = self.count(session_id)
+        rows = await self._read_results(session_id, since, limit, filters or {})
+        if limit is not None and len(rows) >= limit:
+            cursor = rows[-1][0]
+        else:
+            # 共享模式下库中可能已有其他进程写入、本进程尚未同步计数的结果
+            cursor = max(since, total, rows[-1][0] if rows else 0)
+        return [result for _, result in rows], cursor
+
+    async def _read_results(self, session_id: str, since: int, limit: Optional[int],
+                            filters: Dict[str, Any]) -> List[PositionedResult]:
+        raise NotImplementedError
+
+    async def delete_session(self, session_id: str):
+        self._forget(session_id)
+
+    def _forget(self, session_id: str):
+        """清除内存中的会话索引和统计"""
+        self._stats.pop(session_id, None)
+        self._created.pop(session_id, None)
+        self._counts.pop(session_id, None)
+        self._accessed.pop(session_id, None)
+        self._policies.pop(session_id, None)
+        self._total_bytes -= self._sizes.pop(session_id, 0)
+
+    async def enforce_retention(self, is_protected: Callable[[str], bool] = lambda session_id: False,
+                                reserve: int = 0) -> List[str]:
+        """按最近访问时间从旧到新淘汰会话，直到满足所有限制，返回被淘汰的会话ID
+
+        is_protected 返回 True 的会话（如仍有任务在运行）不会被淘汰；
+        reserve 为即将创建的会话数，创建新会话前传 1 以预留位置
+        """
+        now = time.time()
+        evicted = []
+        for session_id in sorted(self._accessed, key=self._accessed.get):
+            over_sessions = self.max_sessions and len(self._stats) + reserve > self.max_sessions
+            over_bytes = self.max_bytes and self._total_bytes > self.max_bytes
+            expired = self.max_age and now - self._accessed[session_id] > self.max_age
+            if not (over_sessions or over_bytes or expired):
+                # 按访问时间排序，后面的会话更新，无需继续检查
+                break
+            if is_protected(session_id):
+                continue
+            await self.delete_session(session_id)
+            evicted.append(session_id)
+        return evicted
+
+
+class MemoryResultStore(ResultStore):
+    """内存存储，重启后数据丢失
+
+    过滤索引为每个会话的 (字段, 取值) -> 递增的 position 列表，查询时二分定位游标，
+    多个条件时遍历最短的列表并检查其余条件
+    """
+
+    def __init__(self, **retention):
+        super().__init__(**retention)
+        self._results: Dict[str, List[Dict[str, Any]]] = {}
+        self._indexes: Dict[str, Dict[Tuple[str, Any], List[int]]] = {}
+
+    def _write(self, session_id: str, position: int, result: Dict[str, Any], data: str):
+        self._results.setdefault(session_id, []).append(result)
+        index = self._indexes.setdefault(session_id, {})
+        for field in FILTER_FIELDS:
+            index.setdefault((field, result.get(field)), []).append(position)
+
+    async def _read_results(self, session_id: str, since: int, limit: Optional[int],
+                            filters: Dict[str, Any]) -> List[PositionedResult]:
+        results = self._results.get(session_id, [])
+        if not filters:
+            end = None if limit is None else since + limit
+            return list(enumerate(results[since:end], start=since + 1))
+
+        index = self._indexes.get(session_id, {})
+        positions = min((index.get((field, value), []) for field, value in filters.items()), key=len)
+        rows = []
+        for i in range(bisect_right(positions, since), len(positions)):
+            result = results[positions[i] - 1]
+            if matches(result, filters):
+                rows.append((positions[i], result))
+                if limit is not None and len(rows) >= limit:
+                    break
+        return rows
+
+    async def delete_session(self, session_id: str):
+        await super().delete_session(session_id)
+        self._results.pop(session_id, None)
+        self._indexes.pop(session_id, None)
+
+
+class SQLiteResultStore(ResultStore):
+    """SQLite存储（WAL模式）
+
+    append() 只把结果放入内存缓冲区，后台任务定期在专用线程中批量提交；
+    所有数据库操作都在同一个线程中顺序执行，读取时再合并尚未落盘的缓冲记录。
+
+    共享模式（shared=True）下，每次写入同时保存会话的条数、字节数、保留策略和访问时间，
+    以及 job_source 提供的本进程任务快照；position 由写入进程按本地条数分配，因此同一会话同时只允许
+    一个进程写入：claim_session() 在数据库中原子地登记写入进程，其任务结束、结果写入后随同一批次释放；sync()/sync_session() 从数据库刷新本进程
+    没有未写入数据的会话，写入时发现会话已被其他进程删除则丢弃缓冲并回调 on_remote_delete，
+    发现其他进程请求取消本进程的任务则回调 on_remote_cancel
+    """
+
+    def __init__(self, path: str, flush_interval: float = 0.2, shared: bool = False, **retention):
+        super().__init__(**retention)
+        self.path = path
+        self.flush_interval = flush_interval
+        self.shared = shared
+        # 返回本进程的任务对象（需有 job_id/status/is_active/to_dict），写入时一并持久化
+        self.job_source: Optional[Callable[[], Iterable[Any]]] = None
+        # 会话被其他进程删除（或淘汰）时的回调
+        self.on_remote_delete: Optional[Callable[[str], None]] = None
+        # 其他进程请求取消本进程任务时的回调
+        self.on_remote_cancel: Optional[Callable[[str], Any]] = None
+        # 已确认写入数据库的会话，用于识别被其他进程删除的会话
+        self._persisted: set = set()
+        # 只刷新了访问时间的会话
+        self._touched: set = set()
+        # 已持久化的任务状态
+        self._job_status: Dict[str, str] = {}
+        # 本进程持有写入权的会话 -> 取得写入权的时间，已有任务运行后为 None
+        self._claims: Dict[str, Optional[float]] = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="result-store")
+        self._conn: Optional[sqlite3.Connection] = None
+        # 待写入记录：(session_id, position, result, 编码后的JSON)
+        self._pending: List[Tuple[str, int, Dict[str, Any], str]] = []
+        self._inflight: List[Tuple[str, int, Dict[str, Any], str]] = []
+        self._dirty: set = set()
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    # ---------------------------------------------------------------- 线程内操作
+
+    def _open_db(self) -> List[Tuple[str, str, Optional[str], int, int]]:
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        # 共享模式下多个进程争用写锁，等待时间放宽
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30 if self.shared else 5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                created_at TEXT,
+                stats TEXT
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                session_id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                success INTEGER NOT NULL,
+                model TEXT,
+                error_type TEXT,
+                data TEXT NOT NULL,
+                PRIMARY KEY (session_id, position)
+            ) WITHOUT ROWID
+        """)
+        for field in FILTER_FIELDS:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS results_{field} ON results (session_id, {field}, position)")
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(sessions)")}
+        for column, column_type in self._SESSION_COLUMNS:
+            if column not in columns:
+                try:
+                    conn.execute(f"ALTER TABLE sessions ADD COLUMN {column} {column_type}")
+                except sqlite3.OperationalError as e:
+                    # 多个进程同时启动时可能已被其他进程添加
+                    if "duplicate column" not in str(e):
+                        raise
+        if self.shared:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    session_id TEXT NOT NULL,
+                    created_at TEXT,
+                    owner INTEGER,
+                    heartbeat REAL,
+                    data TEXT NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_session ON jobs (session_id, created_at)")
+            conn.execute("CREATE TABLE IF NOT EXISTS job_cancels (job_id TEXT PRIMARY KEY)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS session_writers (
+                    session_id TEXT PRIMARY KEY,
+                    owner INTEGER NOT NULL,
+                    heartbeat REAL NOT NULL
+                )
+            """)
+        conn.commit()
+        self._conn = conn
+        return conn.execute("""
+            SELECT s.session_id, s.created_at, s.stats,
+                   COALESCE(MAX(r.position), 0), COALESCE(SUM(LENGTH(CAST(r.data AS BLOB))), 0)
+            FROM sessions s LEFT JOIN results r ON r.session_id = s.session_id
+            GROUP BY s.session_id ORDER BY s.created_at
+        """).fetchall()
+
+    # 共享模式使用的会话元数据列（旧数据库打开时自动补齐）
+    _SESSION_COLUMNS = (
+        ("result_count", "INTEGER"),
+        ("stored_bytes", "INTEGER"),
+        ("keep_full_bodies", "INTEGER"),
+        ("accessed", "REAL"),
+    )
+
+    def _write_batch(self, batch: List[Tuple[str, int, Dict[str, Any], str]],
+                     sessions: List[Tuple[Any, ...]], check: List[str],
+                     touched: List[Tuple[float, str]], jobs: List[Tuple[Any, ...]],
+                     claims: List[Tuple[float, str]], released: List[str]) -> Tuple[set, List[str]]:
+        """写入一批结果和会话元数据，刷新仍在写入的会话的心跳，并在结果写入后释放 released 中的写入权
+
+        返回已被其他进程删除的会话（这些会话的数据不再写入），以及被请求取消的本进程任务
+        """
+        with self._conn:
+            deleted = {
+                session_id for session_id in check
+                if not self._conn.execute("SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            }
+            rows = [
+                (session_id, position, 1 if result["success"] else 0,
+                 result.get("model"), result.get("error_type"), data)
+                for session_id, position, result, data in batch if session_id not in deleted
+            ]
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO sessions (session_id, created_at, stats, result_count, stored_bytes, "
+                "keep_full_bodies, accessed) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [row for row in sessions if row[0] not in deleted]
+            )
+            self._conn.executemany("UPDATE sessions SET accessed = ? WHERE session_id = ?", touched)
+            # 会话已不存在时不再写入其任务
+            if jobs:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO jobs (job_id, session_id, created_at, owner, heartbeat, data) "
+                    "SELECT ?, ?, ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM sessions WHERE session_id = ?)",
+                    [row + (row[1],) for row in jobs if row[1] not in deleted]
+                )
+                job_ids = [row[0] for row in jobs]
+                placeholders = ",".join("?" * len(job_ids))
+                cancels = [row[0] for row in self._conn.execute(
+                    f"SELECT job_id FROM job_cancels WHERE job_id IN ({placeholders})", job_ids)]
+                self._conn.executemany("DELETE FROM job_cancels WHERE job_id = ?", [(job_id,) for job_id in cancels])
+            else:
+                cancels = []
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO results (session_id, position, success, model, error_type, data) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            if claims or released:
+                owner = os.getpid()
+                self._conn.executemany("UPDATE session_writers SET heartbeat = ? WHERE session_id = ? AND owner = ?",
+                                       [claim + (owner,) for claim in claims])
+                self._conn.executemany("DELETE FROM session_writers WHERE session_id = ? AND owner = ?",
+                                       [(session_id, owner) for session_id in released])
+        return deleted, cancels
+
+    def _read_sessions(self, session_id: Optional[str]) -> List[Tuple[Any, ...]]:
+        query = ("SELECT session_id, created_at, stats, result_count, stored_bytes, keep_full_bodies, accessed "
+                 "FROM sessions")
+        if session_id is None:
+            return self._conn.execute(query).fetchall()
+        return self._conn.execute(query + " WHERE session_id = ?", (session_id,)).fetchall()
+
+    def _read_jobs(self, session_id: Optional[str], job_id: Optional[str]) -> List[Tuple[Any, ...]]:
+        query = "SELECT owner, heartbeat, data FROM jobs"
+        if job_id is not None:
+            return self._conn.execute(query + " WHERE job_id = ?", (job_id,)).fetchall()
+        if session_id is not None:
+            return self._conn.execute(query + " WHERE session_id = ? ORDER BY created_at", (session_id,)).fetchall()
+        return self._conn.execute(query + " ORDER BY created_at").fetchall()
+
+    def _read(self, session_id: str, since: int, limit: Optional[int],
+              filters: Dict[str, Any]) -> List[PositionedResult]:
+        # 字段名只来自 FILTER_FIELDS；IS 同时匹配 NULL，也能使用索引
+        conditions = "".join(f" AND {field} IS ?" for field in filters)
+        values = [int(value) if field == "success" else value for field, value in filters.items()]
+        rows = self._conn.execute(
+            f"SELECT position, data FROM results WHERE session_id = ?{conditions} AND position > ? "
+            "ORDER BY position LIMIT ?",
+            (session_id, *values, since, -1 if limit is None else limit)
+        ).fetchall()
+        return [(position, json.loads(data)) for position, data in rows]
+
+    def _claim(self, session_id: str, now: float) -> bool:
+        """登记本进程为会话的写入进程：没有登记、已由本进程登记或原写入进程心跳超时时成功"""
+        owner = os.getpid()
+        with self._conn:
+            self._conn.execute(
+                "INSERT INTO session_writers (session_id, owner, heartbeat) VALUES (?, ?, ?) "
+                "ON CONFLICT (session_id) DO UPDATE SET owner = excluded.owner, heartbeat = excluded.heartbeat "
+                "WHERE session_writers.owner = excluded.owner OR session_writers.heartbeat < ?",
+                (session_id, owner, now, now - JOB_STALE_AFTER)
+            )
+            row = self._conn.execute("SELECT owner FROM session_writers WHERE session_id = ?",
+                                     (session_id,)).fetchone()
+        return row is not None and row[0] == owner
+
+    def _request_cancel(self, job_id: str) -> bool:
+        with self._conn:
+            if not self._conn.execute("SELECT 1 FROM jobs WHERE job_id = ?", (job_id,)).fetchone():
+                return False
+            self._conn.execute("INSERT OR IGNORE INTO job_cancels (job_id) VALUES (?)", (job_id,))
+        return True
+
+    def _delete(self, session_id: str):
+        with self._conn:
+            self._conn.execute("DELETE FROM results WHERE session_id = ?", (session_id,))
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            if self.shared:
+                self._conn.execute("DELETE FROM job_cancels WHERE job_id IN "
+                                   "(SELECT job_id FROM jobs WHERE session_id = ?)", (session_id,))
+                self._conn.execute("DELETE FROM jobs WHERE session_id = ?", (session_id,))
+                self._conn.execute("DELETE FROM session_writers WHERE session_id = ?", (session_id,))
+
+    # ---------------------------------------------------------------- 事件循环侧接口
+
+    async def open(self):
+        now = time.time()
+        for session_id, created_at, stats, count, size in await self._run(self._open_db):
+            self._stats[session_id] = SessionStats.from_dict(json.loads(stats)) if stats else SessionStats()
+            self._created[session_id] = created_at
+            self._counts[session_id] = count
+            self._sizes[session_id] = size
+            self._accessed[session_id] = now
+            self._total_bytes += size
+            self._persisted.add(session_id)
+        self._flush_task = asyncio.create_task(self._flush_loop())
+        logger.info("结果存储已打开: %s（%d 个会话）", self.path, len(self._stats))
+
+    async def close(self):
+        if self._flush_task:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+        if self._conn:
+            await self._run(self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=True)
+
+    def create_session(self, session_id: str, keep_full_bodies: Optional[int] = None):
+        if session_id not in self._stats:
+            self._dirty.add(session_id)
+        super().create_session(session_id, keep_full_bodies)
+
+    def _write(self, session_id: str, position: int, result: Dict[str, Any], data: str):
+        self._pending.append((session_id, position, result, data))
+        self._dirty.add(session_id)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.exception("结果写入失败: %s", e)
+
+    def _job_rows(self) -> List[Tuple[Any, ...]]:
+        """本进程中运行中或状态有变化的任务快照，运行中的任务每次写入都刷新心跳"""
+        if not self.shared or not self.job_source:
+            return []
+        now = time.time()
+        rows = []
+        for job in self.job_source():
+            if not job.is_active and self._job_status.get(job.job_id) == job.status:
+                continue
+            data = job.to_dict()
+            rows.append((job.job_id, data["session_id"], data["created_at"], os.getpid(), now,
+                         json.dumps(data, ensure_ascii=False, default=json_default)))
+            self._job_status[job.job_id] = job.status
+        return rows
+
+    def _claim_rows(self) -> Tuple[List[Tuple[float, str]], List[str]]:
+        """本进程持有写入权的会话中，仍有运行中任务（或刚取得写入权、尚未提交任务）的刷新心跳，其余释放
+
+        任务结束时其结果都已在本批次中，释放与结果写入在同一事务内完成
+        """
+        if not self._claims:
+            return [], []
+        now = time.time()
+        active = {job.session_id for job in self.job_source() if job.is_active} if self.job_source else set()
+        claims, released = [], []
+        for session_id, claimed in list(self._claims.items()):
+            if session_id in active:
+                self._claims[session_id] = None
+            if session_id in active or (claimed is not None and now - claimed <= CLAIM_GRACE):
+                claims.append((now, session_id))
+            else:
+                released.append(session_id)
+                del self._claims[session_id]
+        return claims, released
+
+    async def flush(self):
+        """将缓冲区中的结果和会话统计批量写入数据库"""
+        async with self._flush_lock:
+            jobs = self._job_rows()
+            claims, released = self._claim_rows()
+            if not self._pending and not self._dirty and not self._touched and not jobs and not released:
+                return
+            batch, self._pending = self._pending, []
+            # 统计快照在事件循环中生成，避免与写入线程并发修改
+            sessions = [
+                (session_id, self._created[session_id], json.dumps(self._stats[session_id].to_dict()),
+                 self._counts[session_id], self._sizes[session_id], self._policies.get(session_id),
+                 self._accessed.get(session_id))
+                for session_id in self._dirty if session_id in self._stats
+            ]
+            # 共享模式下检查之前写入过的会话（含仍有任务的会话）是否已被其他进程删除
+            check = [
+                session_id for session_id in {row[0] for row in sessions} | {row[1] for row in jobs}
+                if session_id in self._persisted
+            ] if self.shared else []
+            touched = [(self._accessed[session_id], session_id) for session_id in self._touched
+                       if session_id in self._accessed and session_id not in self._dirty]
+            self._dirty = set()
+            self._touched = set()
+            self._inflight = batch
+            try:
+                deleted, cancels = await self._run(self._write_batch, batch, sessions, check, touched, jobs,
+                                                   claims, released)
+            except Exception:
+                # 写入失败时放回缓冲区，下次重试
+                self._pending = batch + self._pending
+                self._dirty.update(row[0] for row in sessions)
+                for job_id, *_ in jobs:
+                    self._job_status.pop(job_id, None)
+                for session_id in released:
+                    self._claims.setdefault(session_id, None)
+                raise
+            finally:
+                self._inflight = []
+            self._persisted.update(row[0] for row in sessions if row[0] not in deleted)
+        for session_id in deleted:
+            self._drop_remote(session_id)
+        for job_id in cancels:
+            logger.info("任务 %s 被其他进程请求取消", job_id)
+            if self.on_remote_cancel:
+                self.on_remote_cancel(job_id)
+
+    def _drop_remote(self, session_id: str):
+        """丢弃已被其他进程删除的会话在本进程中的状态"""
+        self._forget(session_id)
+        self._pending = [item for item in self._pending if item[0] != session_id]
+        self._dirty.discard(session_id)
+        logger.info("会话 %s 已被其他进程删除", session_id, extra={"session_id": session_id})
+        if self.on_remote_delete:
+            self.on_remote_delete(session_id)
+
+    def _forget(self, session_id: str):
+        super()._forget(session_id)
+        self._persisted.discard(session_id)
+
+    def _apply_session_row(self, row: Tuple[Any, ...]):
+        """用数据库中的会话行覆盖本进程的缓存"""
+        session_id, created_at, stats, count, size, keep, accessed = row
+        self._stats[session_id] = SessionStats.from_dict(json.loads(stats)) if stats else SessionStats()
+        self._created[session_id] = created_at
+        if count is not None:
+            self._counts[session_id] = count
+        if size is not None:
+            self._total_bytes += size - self._sizes.get(session_id, 0)
+            self._sizes[session_id] = size
+        self._counts.setdefault(session_id, 0)
+        self._sizes.setdefault(session_id, 0)
+        if keep is not None:
+            self._policies[session_id] = keep
+        self._accessed[session_id] = max(accessed or 0, self._accessed.get(session_id, 0)) or time.time()
+        self._persisted.add(session_id)
+
+    async def _sync(self, session_id: Optional[str]):
+        if not self.shared:
+            return
+        # 持有写入锁：同步期间不会有批次在写，未写入的本地变更都在 _dirty 中
+        async with self._flush_lock:
+            rows = await self._run(self._read_sessions, session_id)
+            found = set()
+            for row in rows:
+                found.add(row[0])
+                # 本进程有未写入的变更时以本地为准
+                if row[0] not in self._dirty:
+                    self._apply_session_row(row)
+            candidates = list(self._stats) if session_id is None else [session_id]
+            removed = [sid for sid in candidates
+                       if sid in self._persisted and sid not in found and sid not in self._dirty]
+        for sid in removed:
+            self._drop_remote(sid)
+
+    async def sync(self):
+        await self._sync(None)
+
+    async def sync_session(self, session_id: str):
+        await self._sync(session_id)
+
+    async def load_jobs(self, session_id: Optional[str] = None,
+                        job_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        if not self.shared:
+            return []
+        now = time.time()
+        jobs = []
+        for owner, heartbeat, data in await self._run(self._read_jobs, session_id, job_id):
+            job = json.loads(data)
+            job["owner"] = owner
+            if job["status"] in ACTIVE_STATES and now - (heartbeat or 0) > JOB_STALE_AFTER:
+                job["status"] = JOB_FAILED
+                job["error"] = "所属工作进程已退出"
+            jobs.append(job)
+        return jobs
+
+    async def request_cancel(self, job_id: str) -> bool:
+        if not self.shared:
+            return False
+        return await self._run(self._request_cancel, job_id)
+
+    async def claim_session(self, session_id: str) -> bool:
+        if not self.shared:
+            return True
+        now = time.time()
+        if not await self._run(self._claim, session_id, now):
+            return False
+        self._claims[session_id] = now
+        return True
+
+    async def query_results(self, session_id: str, since: int = 0, limit: Optional[int] = None,
+                            filters: Optional[Dict[str, Any]] = None) -> Tuple[List[Dict[str, Any]], int]:
+        if self.shared:
+            self._touched.add(session_id)
+        return await super().query_results(session_id, since, limit, filters)
+
+    async def _read_results(self, session_id: str, since: int, limit: Optional[int],
+                            filters: Dict[str, Any]) -> List[PositionedResult]:
+        # 先取缓冲区快照再读库：快照中的记录要么已在库中，要么会在此合并，不会遗漏
+        unflushed = [
+            (position, result) for pending_session, position, result, _ in self._inflight + self._pending
+            if pending_session == session_id and position > since and matches(result, filters)
+        ]
+        rows = dict(await self._run(self._read, session_id, since, limit, filters))
+        for position, result in unflushed:
+            rows.setdefault(position, result)
+        positions = sorted(rows)
+        if limit is not None:
+            positions = positions[:limit]
+        return [(position, rows[position]) for position in positions]
+
+    async def delete_session(self, session_id: str):
+        await super().delete_session(session_id)
+        self._pending = [item for item in self._pending if item[0] != session_id]
+        self._dirty.discard(session_id)
+        self._touched.discard(session_id)
+        self._claims.pop(session_id, None)
+        async with self._flush_lock:
+            await self._run(self._delete, session_id)
+
+
+def create_result_store(kind: str, path: str, flush_interval: float = 0.2, shared: bool = False,
+                        **retention) -> ResultStore:
+    """根据配置创建结果存储，retention 为保留策略参数（max_sessions/max_bytes/max_age/keep_full_bodies）
+
+    shared 为 True 时供多个进程共用，只有 SQLite 后端支持
+    """
+    if kind == "memory":
+        if shared:
+            raise ValueError("多进程共享状态需要使用 sqlite 结果存储")
+        return MemoryResultStore(**retention)
+    if kind == "sqlite":
+        return SQLiteResultStore(path, flush_interval=flush_interval, shared=shared, **retention)
+    raise ValueError(f"不支持的结果存储类型: {kind}")
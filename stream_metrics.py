@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流式响应测量
+逐块消费LiteLLM流式响应，记录首token时间(TTFT)、块间隔和解码吞吐
+"""
+
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import litellm
+
+from logger import get_logger
+from normalize import get_field, usage_to_dict
+
+logger = get_logger("stream")
+
+
+def _merge_tool_call_delta(tool_calls: Dict[int, Dict[str, Any]], delta_call: Any):
+    """按 index 合并工具调用增量，arguments 逐块拼接"""
+    index = get_field(delta_call, "index") or 0
+    call = tool_calls.setdefault(index, {
+        "id": None,
+        "type": "function",
+        "function": {"name": "", "arguments": ""}
+    })
+    if get_field(delta_call, "id"):
+        call["id"] = get_field(delta_call, "id")
+    function = get_field(delta_call, "function")
+    if function is not None:
+        call["function"]["name"] += get_field(function, "name") or ""
+        call["function"]["arguments"] += get_field(function, "arguments") or ""
+
+
+def summarize_timing(
+    start: float,
+    token_times: List[float],
+    end: float,
+    completion_tokens: int
+) -> Dict[str, Any]:
+    """根据各内容块到达时间计算流式指标
+
+    start/token_times/end 均为 time.perf_counter() 读数；
+    解码吞吐按首token之后的输出token数除以解码时间计算
+    """
+    if not token_times:
+        return {
+            "ttft": None,
+            "decode_time": None,
+            "tokens_per_second": None,
+            "chunk_count": 0,
+            "chunk_gaps": [],
+            "itl_mean": None,
+            "total_time": round(end - start, 4),
+        }
+
+    first, last = token_times[0], token_times[-1]
+    gaps = [(b - a) * 1000 for a, b in zip(token_times, token_times[1:])]
+    decode_time = last - first
+    decode_tokens = max(completion_tokens - 1, 0)
+    return {
+        "ttft": round(first - start, 4),
+        "decode_time": round(decode_time, 4),
+        "tokens_per_second": round(decode_tokens / decode_time, 2) if decode_time > 0 else None,
+        "chunk_count": len(token_times),
+        "chunk_gaps": [round(gap, 2) for gap in gaps],  # 毫秒
+        "itl_mean": round(sum(gaps) / len(gaps), 2) if gaps else None,
+        "total_time": round(end - start, 4),
+    }
+
+
+async def consume_stream(
+    stream: Any,
+    start: float,
+    messages: Optional[List[Dict[str, Any]]] = None
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """消费流式响应，返回 (响应字典, 计时指标)
+
+    stream 的每个块可以是LiteLLM的块对象，也可以是解析后的 chat.completion.chunk 字典。
+
+    响应字典与非流式路径的结构一致（choices[0].message 含 content/tool_calls，以及 usage），
+    以便结果摘要字段保持不变。服务端未在流中返回 usage 时，LiteLLM的块对象使用 litellm.stream_chunk_builder 估算
+    """
+    chunks = []
+    token_times: List[float] = []
+    content_parts: List[str] = []
+    tool_calls: Dict[int, Dict[str, Any]] = {}
+    finish_reason = None
+    role = "assistant"
+    usage: Dict[str, Any] = {}
+    response_dict: Dict[str, Any] = {}
+
+    async for chunk in stream:
+        now = time.perf_counter()
+        chunks.append(chunk)
+
+        if not response_dict:
+            response_dict = {
+                "id": get_field(chunk, "id"),
+                "object": "chat.completion",
+                "created": get_field(chunk, "created"),
+                "model": get_field(chunk, "model"),
+            }
+
+        chunk_usage = get_field(chunk, "usage")
+        if chunk_usage:
+            usage = usage_to_dict(chunk_usage)
+
+        choices = get_field(chunk, "choices")
+        if not choices:
+            continue
+        choice = choices[0]
+        finish_reason = get_field(choice, "finish_reason") or finish_reason
+
+        delta = get_field(choice, "delta")
+        if delta is None:
+            continue
+        role = get_field(delta, "role") or role
+
+        has_token = False
+        content = get_field(delta, "content")
+        if content:
+            content_parts.append(content)
+            has_token = True
+        for delta_call in get_field(delta, "tool_calls") or []:
+            _merge_tool_call_delta(tool_calls, delta_call)
+            has_token = True
+        if has_token:
+            token_times.append(now)
+
+    end = time.perf_counter()
+
+    if not usage and chunks and not isinstance(chunks[0], dict):
+        try:
+            built = litellm.stream_chunk_builder(chunks, messages=messages)
+            usage = usage_to_dict(getattr(built, "usage", None))
+        except Exception as e:
+            logger.warning("流式usage估算失败: %s", e)
+
+    message: Dict[str, Any] = {"role": role, "content": "".join(content_parts)}
+    if tool_calls:
+        message["tool_calls"] = [tool_calls[i] for i in sorted(tool_calls)]
+    response_dict["choices"] = [{"index": 0, "finish_reason": finish_reason, "message": message}]
+    response_dict["usage"] = usage
+
+    # 无usage时以内容块数近似输出token数
+    completion_tokens = usage.get("completion_tokens") or len(token_times)
+    return response_dict, summarize_timing(start, token_times, end, completion_tokens)
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+请求传输层
+LiteLLM：经 litellm.acompletion 发送；
+httpx：共享的长连接池直接调用 OpenAI 兼容的 /chat/completions，并单独报告建连耗时
+两者都按 Timeouts 分别限制建连和首字节等待时间，总超时由调用方按单次尝试施加
+"""
+
+import asyncio
+import json
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+import httpx
+import litellm
+
+from logger import get_logger, payloads_enabled
+from normalize import normalize_response
+from stream_metrics import consume_stream
+
+logger = get_logger("transport")
+
+TRANSPORT_LITELLM = "litellm"
+TRANSPORT_HTTPX = "httpx"
+TRANSPORT_TYPES = (TRANSPORT_LITELLM, TRANSPORT_HTTPX)
+
+# 返回值：(规范化的响应字典, 计时指标)
+TransportResult = Tuple[Dict[str, Any], Dict[str, Any]]
+
+# 超时阶段
+TIMEOUT_CONNECT = "connect"
+TIMEOUT_FIRST_BYTE = "first_byte"
+TIMEOUT_TOTAL = "total"
+
+
+@dataclass
+class Timeouts:
+    """单次请求的超时（秒）"""
+    connect: float = 10  # 建立连接（含TLS握手）
+    first_byte: float = 120  # 等待响应头；流式请求中也是相邻两个数据块的最大间隔
+    total: float = 300  # 从发出到收到完整响应
+
+    def httpx_timeout(self) -> httpx.Timeout:
+        # 等待连接池空闲连接属于本地排队，只受总超时限制
+        return httpx.Timeout(connect=self.connect, read=self.first_byte, write=self.first_byte, pool=None)
+
+    def describe(self, phase: str, exc: BaseException) -> str:
+        """超时结果的错误信息：超时阶段及其时限，附上原始异常信息（如有）"""
+        label, limit = {
+            TIMEOUT_CONNECT: ("建立连接超时", self.connect),
+            TIMEOUT_FIRST_BYTE: ("等待响应超时", self.first_byte),
+        }.get(phase, ("请求总时长超时", self.total))
+        message = f"{label}（{limit:g} 秒）"
+        return f"{message}: {exc}" if str(exc) else message
+
+
+def timeout_phase(exc: BaseException) -> Optional[str]:
+    """判断超时发生的阶段，非超时异常返回 None
+
+    LiteLLM 会把底层的 httpx 超时包装成自己的异常，沿异常链查找原始异常；
+    无法区分阶段的超时（如 LiteLLM 自行抛出的）记为 total
+    """
+    seen = set()
+    current: Optional[BaseException] = exc
+    while current is not None and id(current) not in seen:
+        seen.add(id(current))
+        if isinstance(current, (httpx.ConnectTimeout, httpx.PoolTimeout)):
+            return TIMEOUT_CONNECT
+        if isinstance(current, (httpx.ReadTimeout, httpx.WriteTimeout)):
+            return TIMEOUT_FIRST_BYTE
+        if isinstance(current, asyncio.TimeoutError):
+            return TIMEOUT_TOTAL
+        current = current.__cause__ or current.__context__
+    return TIMEOUT_TOTAL if "Timeout" in type(exc).__name__ else None
+
+
+class Transport:
+    """传输层基类"""
+
+    name = ""
+
+    async def complete(self, request_data: Dict[str, Any]) -> TransportResult:
+        """发送非流式请求"""
+        raise NotImplementedError
+
+    async def stream(self, request_data: Dict[str, Any]) -> TransportResult:
+        """发送流式请求并逐块消费，计时指标包含TTFT等流式字段"""
+        raise NotImplementedError
+
+    async def close(self):
+        """释放连接等资源"""
+
+
+class LiteLLMTransport(Transport):
+    """经 litellm.acompletion 发送请求；连接由LiteLLM内部管理，不报告建连耗时"""
+
+    name = TRANSPORT_LITELLM
+
+    def __init__(self, api_url: str, api_key: str, default_model: str, timeouts: Optional[Timeouts] = None):
+        self.api_url = api_url
+        self.api_key = api_key
+        self.default_model = default_model
+        self.timeouts = timeouts or Timeouts()
+
+    def build_params(self, request_data: Dict[str, Any]) -> Dict[str, Any]:
+        """构建LiteLLM请求参数"""
+        # 为模型名称添加openai/前缀（如果需要）
+        model = request_data.get("model", self.default_model)
+        if not model.startswith("openai/"):
+            model = f"openai/{model}"
+
+        # 准备LiteLLM请求参数
+        litellm_params = {
+            "api_key": self.api_key,
+            "base_url": self.api_url,
+            "timeout": self.timeouts.httpx_timeout(),
+            **request_data  # 传递所有原始请求数据
+        }
+        litellm_params["model"] = model
+        return litellm_params
+
+    async def complete(self, request_data: Dict[str, Any]) -> TransportResult:
+        try:
+            litellm_params = self.build_params(request_data)
+
+            # 强制禁用流式传输以获得完整响应
+            litellm_params["stream"] = False
+
+            if payloads_enabled(logger):
+                logger.debug("LiteLLM请求参数: %s", json.dumps(
+                    {k: v for k, v in litellm_params.items() if k != 'api_key'}, ensure_ascii=False, default=str))
+
+            response = await litellm.acompletion(**litellm_params)
+            response_dict = normalize_response(response)
+
+            if payloads_enabled(logger):
+                logger.debug("LiteLLM响应: %s", json.dumps(response_dict, ensure_ascii=False, default=str))
+
+            return response_dict, {}
+        except Exception as e:
+            logger.debug("LiteLLM API调用失败: %s", e, exc_info=True)
+            raise
+
+    async def stream(self, request_data: Dict[str, Any]) -> TransportResult:
+        litellm_params = self.build_params(request_data)
+        litellm_params["stream"] = True
+
+        start = time.perf_counter()
+        response = await litellm.acompletion(**litellm_params)
+        return await consume_stream(response, start, request_data.get("messages"))
+
+
+class ConnectionTrace:
+    """通过 httpx 的 trace 扩展记录单次请求的建连和响应头耗时
+
+    连接池中的连接被复用时不会产生建连事件，connect_time 为 0
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.connect_started: Optional[float] = None
+        self.connect_finished: Optional[float] = None
+        self.headers_received: Optional[float] = None
+
+    async def __call__(self, event: str, info: Dict[str, Any]):
+        now = time.perf_counter()
+        if event == "connection.connect_tcp.started":
+            self.connect_started = now
+        elif event in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+            self.connect_finished = now
+        elif event.endswith("receive_response_headers.complete"):
+            self.headers_received = now
+
+    def timing(self) -> Dict[str, Any]:
+        reused = self.connect_started is None
+        connect_time = 0.0 if reused else (self.connect_finished or self.connect_started) - self.connect_started
+        return {
+            "connection_reused": reused,
+            "connect_time": round(connect_time, 4),
+            # 从发起请求到收到响应头，减去建连耗时即为网关/服务端的响应时间
+            "ttfb": round(self.headers_received - self.start, 4) if self.headers_received else None,
+        }
+
+
+class HTTPXTransport(Transport):
+    """直接调用 OpenAI 兼容接口的 httpx 传输
+
+    所有请求共用一个长连接池（keep-alive），可选 HTTP/2（需要安装 h2）
+    """
+
+    name = TRANSPORT_HTTPX
+
+    def __init__(
+        self,
+        api_url: str,
+        api_key: str,
+        default_model: str,
+        timeouts: Optional[Timeouts] = None,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        http2: bool = False
+    ):
+        self.url = api_url.rstrip("/") + "/chat/completions"
+        self.default_model = default_model
+        limits = httpx.Limits(max_connections=max_connections,
+                              max_keepalive_connections=max_keepalive_connections)
+        headers = {"Authorization": f"Bearer {api_key}"}
+        timeout = (timeouts or Timeouts()).httpx_timeout()
+        try:
+            self.client = httpx.AsyncClient(timeout=timeout, limits=limits, headers=headers, http2=http2)
+        except ImportError:
+            logger.warning("未安装 h2，HTTP/2 不可用，改用 HTTP/1.1")
+            self.client = httpx.AsyncClient(timeout=timeout, limits=limits, headers=headers)
+
+    def build_body(self, request_data: Dict[str, Any], stream: bool) -> Dict[str, Any]:
+        body = dict(request_data)
+        model = body.get("model") or self.default_model
+        # 与LiteLLM后端保持一致：openai/ 前缀只用于LiteLLM路由，直接请求时去掉
+        body["model"] = model[len("openai/"):] if model.startswith("openai/") else model
+        body["stream"] = stream
+        if stream:
+            # 请求服务端在流末尾返回usage
+            body.setdefault("stream_options", {"include_usage": True})
+        return body
+
+    async def complete(self, request_data: Dict[str, Any]) -> TransportResult:
+        trace = ConnectionTrace()
+        body = self.build_body(request_data, stream=False)
+        if payloads_enabled(logger):
+            logger.debug("HTTP请求: %s", json.dumps(body, ensure_ascii=False, default=str))
+        response = await self.client.post(self.url, json=body, extensions={"trace": trace})
+        response.raise_for_status()
+        response_dict = normalize_response(response.json())
+        return response_dict, trace.timing()
+
+    async def stream(self, request_data: Dict[str, Any]) -> TransportResult:
+        trace = ConnectionTrace()
+        body = self.build_body(request_data, stream=True)
+        request = self.client.build_request("POST", self.url, json=body, extensions={"trace": trace})
+        response = await self.client.send(request, stream=True)
+        try:
+            if response.is_error:
+                await response.aread()
+                response.raise_for_status()
+            response_dict, timing = await consume_stream(
+                self._iter_chunks(response), trace.start, request_data.get("messages"))
+        finally:
+            await response.aclose()
+        timing.update(trace.timing())
+        return response_dict, timing
+
+    @staticmethod
+    async def _iter_chunks(response: httpx.Response) -> AsyncIterator[Dict[str, Any]]:
+        """解析 SSE 数据行，逐个产出 chat.completion.chunk 字典"""
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                return
+            if data:
+                yield json.loads(data)
+
+    async def close(self):
+        await self.client.aclose()
+
+
+def create_transport(kind: str, api_url: str, api_key: str, default_model: str,
+                     timeouts: Optional[Timeouts] = None, **options) -> Transport:
+    """根据名称创建传输层，options 为 httpx 传输的连接池参数"""
+    if kind == TRANSPORT_LITELLM:
+        return LiteLLMTransport(api_url, api_key, default_model, timeouts)
+    if kind == TRANSPORT_HTTPX:
+        return HTTPXTransport(api_url, api_key, default_model, timeouts, **options)
+    raise ValueError(f"不支持的传输类型: {kind}")
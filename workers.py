@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多进程负载生成
+协调进程把一次 /test 或 /load 的负载拆分给 N 个本地工作进程，每个工作进程有独立的事件循环和连接池，
+按各自分到的并发数或到达率发送请求；结果分批回传，结束时回传本进程的统计（含延迟直方图），
+由协调进程写入同一会话并合并统计
+"""
+
+import asyncio
+import multiprocessing
+import os
+import queue
+import time
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional
+
+from load import OpenLoopScheduler
+from logger import get_logger
+from stats import SessionStats, summarize_window
+
+logger = get_logger("workers")
+
+KIND_BATCH = "batch"
+KIND_LOAD = "load"
+
+# 工作进程 -> 协调进程的消息类型
+MSG_READY = "ready"
+MSG_RESULTS = "results"
+MSG_DONE = "done"
+MSG_ERROR = "error"
+
+# 工作进程回传结果的间隔（秒）
+FLUSH_INTERVAL = 0.1
+# 协调进程检查工作进程存活的间隔（秒）
+POLL_INTERVAL = 0.5
+
+
+def split_evenly(total: int, parts: int) -> List[int]:
+    """将 total 尽量均匀地分成 parts 份"""
+    base, extra = divmod(total, parts)
+    return [base + (1 if i < extra else 0) for i in range(parts)]
+
+
+def batch_specs(request: Dict[str, Any], count: int, concurrency: int, workers: int) -> List[Dict[str, Any]]:
+    """拆分固定次数的批量测试：请求次数和并发数在各进程间均分，并发总数不变"""
+    workers = max(1, min(workers, count, concurrency))
+    return [
+        {"kind": KIND_BATCH, "request": request, "count": worker_count, "concurrency": worker_concurrency}
+        for worker_count, worker_concurrency in zip(split_evenly(count, workers),
+                                                    split_evenly(concurrency, workers))
+    ]
+
+
+def load_specs(request: Dict[str, Any], rate: float, duration: float, arrival: str, max_in_flight: int,
+               seed: Optional[int], workers: int) -> List[Dict[str, Any]]:
+    """拆分开环压测：每个进程承担 rate/N 的到达率，在途上限均分
+
+    恒定到达时各进程依次错开 1/rate 的相位，合并后仍是间隔均匀的到达序列；
+    泊松到达时 N 个 rate/N 的泊松过程叠加即为 rate 的泊松过程
+    """
+    workers = max(1, min(workers, max_in_flight))
+    return [
+        {
+            "kind": KIND_LOAD,
+            "request": request,
+            "rate": rate / workers,
+            "duration": duration,
+            "arrival": arrival,
+            "max_in_flight": worker_in_flight,
+            "seed": seed + i if seed is not None else None,
+            "phase": i / rate,
+        }
+        for i, worker_in_flight in enumerate(split_evenly(max_in_flight, workers))
+    ]
+
+
+async def _run_worker(worker_id: int, worker_count: int, spec: Dict[str, Any], outbox, start_event):
+    # 在子进程中导入，得到本进程独立的传输层和连接池
+    import app as engine
+
+    loop = asyncio.get_running_loop()
+    outbox.put((MSG_READY, worker_id, os.getpid()))
+    # 所有进程就绪后同时开始，避免先启动的进程单独承压
+    await loop.run_in_executor(None, start_event.wait)
+
+    test_req = engine.TestRequest(**spec["request"])
+    # 限流预算由各进程均分，自适应并发以本进程分到的并发数为上限
+    throttle = engine.create_throttle(test_req, spec.get("concurrency") or spec.get("max_in_flight"),
+                                      share=worker_count)
+    retrier = engine.create_retrier(test_req)
+    stats = SessionStats()
+    buffer: List[Dict[str, Any]] = []
+
+    def record(result: Dict[str, Any]):
+        # 本地序号映射为全局唯一序号：进程 i 负责 i+1, i+1+N, ...
+        result["index"] = (result["index"] - 1) * worker_count + worker_id + 1
+        result["worker"] = worker_id
+        stats.add(result)
+        buffer.append(result)
+
+    def flush():
+        if buffer:
+            outbox.put((MSG_RESULTS, worker_id, list(buffer)))
+            buffer.clear()
+
+    async def flush_loop():
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            flush()
+
+    flusher = asyncio.create_task(flush_loop())
+    schedule_stats = None
+    start = time.perf_counter()
+    try:
+        if spec["kind"] == KIND_BATCH:
+            indices = iter(range(1, spec["count"] + 1))
+
+            async def batch_worker():
+                for index in indices:
+                    record(await engine.execute_single_request(test_req, index, start,
+                                                               throttle=throttle, retrier=retrier))
+
+            await asyncio.gather(*(batch_worker() for _ in range(spec["concurrency"])))
+        else:
+            scheduler = OpenLoopScheduler(
+                rate=spec["rate"],
+                duration=spec["duration"],
+                arrival=spec["arrival"],
+                max_in_flight=spec["max_in_flight"],
+                seed=spec["seed"],
+                phase=spec["phase"]
+            )
+
+            async def fire(index: int, intended_offset: float, run_start: float):
+                record(await engine.execute_single_request(test_req, index, run_start,
+                                                           intended_offset=intended_offset, throttle=throttle,
+                                                           retrier=retrier))
+
+            schedule_stats = await scheduler.run(fire)
+    finally:
+        flusher.cancel()
+        flush()
+        for transport in engine.transports.values():
+            await transport.close()
+
+    outbox.put((MSG_DONE, worker_id, {
+        "worker": worker_id,
+        "pid": os.getpid(),
+        "elapsed": time.perf_counter() - start,
+        "stats": stats.to_dict(),
+        "schedule": schedule_stats,
+        "controls": engine.control_stats(throttle, retrier),
+    }))
+
+
+def worker_main(worker_id: int, worker_count: int, spec: Dict[str, Any], outbox, start_event):
+    """工作进程入口"""
+    try:
+        asyncio.run(_run_worker(worker_id, worker_count, spec, outbox, start_event))
+    except Exception as e:
+        outbox.put((MSG_ERROR, worker_id, f"{type(e).__name__}: {e}"))
+
+
+async def run_workers(specs: List[Dict[str, Any]],
+                      on_results: Callable[[List[Dict[str, Any]]], None]) -> List[Dict[str, Any]]:
+    """启动工作进程执行各自的负载份额，回传的结果批次交给 on_results，返回各进程的最终报告
+
+    任务被取消或任一进程失败时终止所有工作进程
+    """
+    context = multiprocessing.get_context("spawn")
+    outbox = context.Queue()
+    start_event = context.Event()
+    processes = [
+        context.Process(target=worker_main, args=(i, len(specs), spec, outbox, start_event),
+                        name=f"load-worker-{i}", daemon=True)
+        for i, spec in enumerate(specs)
+    ]
+    for process in processes:
+        process.start()
+    logger.info("已启动 %d 个工作进程", len(processes))
+
+    loop = asyncio.get_running_loop()
+    reports: List[Optional[Dict[str, Any]]] = [None] * len(processes)
+    ready = 0
+    try:
+        while any(report is None for report in reports):
+            try:
+                kind, worker_id, payload = await loop.run_in_executor(
+                    None, partial(outbox.get, timeout=POLL_INTERVAL))
+            except queue.Empty:
+                dead = [i for i, process in enumerate(processes)
+                        if reports[i] is None and not process.is_alive()]
+                if dead:
+                    raise RuntimeError(f"工作进程 {dead} 异常退出")
+                continue
+
+            if kind == MSG_READY:
+                ready += 1
+                if ready == len(processes):
+                    start_event.set()
+            elif kind == MSG_RESULTS:
+                on_results(payload)
+            elif kind == MSG_DONE:
+                reports[worker_id] = payload
+            elif kind == MSG_ERROR:
+                raise RuntimeError(f"工作进程 {worker_id} 失败: {payload}")
+    finally:
+        for process, report in zip(processes, reports):
+            if report is None and process.is_alive():
+                process.terminate()
+        await loop.run_in_executor(None, lambda: [process.join(timeout=5) for process in processes])
+    return reports
+
+
+def merge_reports(reports: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """合并各工作进程的统计，给出逐进程和总体的吞吐、延迟分位数"""
+    merged = SessionStats()
+    per_worker = []
+    for report in reports:
+        stats = SessionStats.from_dict(report["stats"])
+        merged.merge(stats)
+        per_worker.append({"worker": report["worker"], "pid": report["pid"],
+                           **summarize_window(stats, report["elapsed"]),
+                           **report["controls"]})
+
+    summary: Dict[str, Any] = {
+        "workers": len(reports),
+        "merged": summarize_window(merged, max(report["elapsed"] for report in reports)),
+        "per_worker": per_worker,
+    }
+    schedules = [report["schedule"] for report in reports if report["schedule"]]
+    if schedules:
+        summary["scheduled"] = sum(schedule["scheduled"] for schedule in schedules)
+        summary["max_schedule_lag"] = max(schedule["max_schedule_lag"] for schedule in schedules)
+    return summary